@@ -0,0 +1,237 @@
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+import numpy as np
+from config import Config
+
+logger = logging.getLogger("Alarm")
+
+# Alarm levels, from analyzer status
+LEVEL_OFF = 0
+LEVEL_WARNING = 1
+LEVEL_ALARM = 2
+
+STATUS_LEVELS = {"NORMAL": LEVEL_OFF, "POTENTIAL_FALL": LEVEL_WARNING, "FALL_DETECTED": LEVEL_ALARM}
+LEVEL_NAMES = {LEVEL_OFF: "off", LEVEL_WARNING: "warning", LEVEL_ALARM: "alarm"}
+
+# Beep patterns per level: (frequency Hz, tone seconds, pause seconds), repeated
+PATTERNS = {
+    LEVEL_WARNING: [(1000, 0.2, 0.8)],  # Soft warning beep per second
+    LEVEL_ALARM: [(2500, 0.4, 0.1)],    # Alarm!
+}
+
+
+def tone_wav(frequency, duration, sample_rate=None):
+    # 16-bit mono WAV of a sine tone with 5 ms fades (no clicks)
+    sample_rate = sample_rate or Config.ALARM_SAMPLE_RATE
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pcm = np.sin(2 * np.pi * frequency * t) * 0.5
+    fade = min(len(pcm) // 2, int(0.005 * sample_rate))
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade)
+        pcm[:fade] *= ramp
+        pcm[-fade:] *= ramp[::-1]
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((pcm * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+class ToneOutput:
+    # Cross-platform speaker output. Every tone of every pattern is rendered
+    # to a WAV file once at startup; playing is just handing a file to the
+    # platform player (winsound / aplay / paplay / afplay), falling back to
+    # the terminal bell.
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="alarm_tones_")
+        self.files = {}
+        for steps in PATTERNS.values():
+            for frequency, duration, _ in steps:
+                path = os.path.join(self.directory, f"tone_{frequency}_{int(duration * 1000)}.wav")
+                with open(path, "wb") as f:
+                    f.write(tone_wav(frequency, duration))
+                self.files[(frequency, duration)] = path
+        self.player = self._find_player()
+        self.process = None
+
+    @staticmethod
+    def _find_player():
+        if sys.platform == "win32":
+            return "winsound"
+        for player in ("aplay", "paplay", "afplay"):
+            path = shutil.which(player)
+            if path:
+                return path
+        logger.warning("No audio player found (aplay/paplay/afplay); using the terminal bell.")
+        return None
+
+    def set_level(self, level):
+        if level == LEVEL_OFF:
+            self._stop()
+
+    def beep(self, frequency, duration):
+        path = self.files[(frequency, duration)]
+        if self.player == "winsound":
+            import winsound
+            winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_ASYNC)
+        elif self.player:
+            self._stop()
+            args = [self.player, "-q", path] if self.player.endswith("aplay") else [self.player, path]
+            self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            sys.stdout.write("\a")
+            sys.stdout.flush()
+
+    def _stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+        self.process = None
+
+    def close(self):
+        self._stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class GpioOutput:
+    # Relay/strobe on a GPIO line: on while the alarm level is active.
+    # Uses the sysfs value file when present; otherwise only logs (stub for
+    # boards without sysfs GPIO, wire your driver in _write).
+    def __init__(self, pin=None, min_level=LEVEL_ALARM):
+        self.pin = pin if pin is not None else Config.ALARM_GPIO_PIN
+        self.min_level = min_level
+        self.path = f"/sys/class/gpio/gpio{self.pin}/value"
+        self.available = os.path.exists(self.path)
+        if not self.available:
+            logger.info(f"GPIO {self.pin} not available; relay output is a stub.")
+        self.active = False
+
+    def _write(self, on):
+        if self.available:
+            with open(self.path, "w") as f:
+                f.write("1" if on else "0")
+        else:
+            logger.info(f"GPIO {self.pin} -> {'ON' if on else 'OFF'}")
+
+    def set_level(self, level):
+        active = level >= self.min_level
+        if active != self.active:
+            self.active = active
+            self._write(active)
+
+    def beep(self, frequency, duration):
+        pass
+
+    def close(self):
+        if self.active:
+            self._write(False)
+
+
+class SocketOutput:
+    # Sends one JSON datagram per level change to a siren controller
+    # ("host:port", UDP: fire-and-forget, never waits on the peer).
+    def __init__(self, address=None):
+        host, port = (address or Config.ALARM_SOCKET).rsplit(":", 1)
+        self.address = (host, int(port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def set_level(self, level):
+        message = {"level": LEVEL_NAMES[level], "time": time.time()}
+        try:
+            self.sock.sendto(json.dumps(message).encode(), self.address)
+        except OSError as e:
+            logger.error(f"Siren controller {self.address[0]}:{self.address[1]} unreachable: {e}")
+
+    def beep(self, frequency, duration):
+        pass
+
+    def close(self):
+        self.sock.close()
+
+
+OUTPUTS = {"tone": ToneOutput, "gpio": GpioOutput, "socket": SocketOutput}
+
+
+def create_outputs(names=None):
+    names = names if names is not None else [n.strip() for n in Config.ALARM_OUTPUTS.split(",") if n.strip()]
+    outputs = []
+    for name in names:
+        if name not in OUTPUTS:
+            raise ValueError(f"Unknown alarm output: {name} (known: {', '.join(OUTPUTS)})")
+        try:
+            outputs.append(OUTPUTS[name]())
+        except Exception as e:
+            logger.error(f"Alarm output {name} unavailable: {e}")
+    return outputs
+
+
+class AlarmController:
+    # Owns the alarm outputs on its own thread. update() is called with the
+    # analyzer status every frame; it only compares an int and, on a change,
+    # stores the new level and wakes the thread, so raising or clearing the
+    # alarm never blocks frame processing. The thread plays the level's
+    # pattern until the level changes (checked between tones).
+    def __init__(self, outputs=None):
+        self.outputs = outputs if outputs is not None else create_outputs()
+        self.level = LEVEL_OFF
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="alarm", daemon=True)
+        self.thread.start()
+
+    def update(self, status):
+        level = STATUS_LEVELS.get(status, LEVEL_OFF)
+        if level == self.level:
+            return
+        with self.cond:
+            self.level = level
+            self.cond.notify()
+
+    def _run(self):
+        current = LEVEL_OFF
+        while True:
+            with self.cond:
+                if self.level == current and current == LEVEL_OFF and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    break
+                level = self.level
+
+            if level != current:
+                logger.info(f"Alarm level: {LEVEL_NAMES[level]}")
+                for output in self.outputs:
+                    output.set_level(level)
+                current = level
+
+            for frequency, duration, pause in PATTERNS.get(current, []):
+                for output in self.outputs:
+                    try:
+                        output.beep(frequency, duration)
+                    except Exception as e:
+                        logger.error(f"Alarm output failed: {e}")
+                # Sleep through tone + pause, but wake at once on a level change
+                with self.cond:
+                    self.cond.wait_for(lambda: self.level != current or self.closed, duration + pause)
+                if self.level != current or self.closed:
+                    break
+
+        for output in self.outputs:
+            output.set_level(LEVEL_OFF)
+            output.close()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join(timeout=2.0)
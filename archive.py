@@ -0,0 +1,339 @@
+import argparse
+import datetime
+import glob
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from config import Config
+import landmarks as lmk
+import telemetry
+
+logger = logging.getLogger("Archive")
+
+# Long-term landmark archive: raw (33, 5) frames only, never images.
+#
+#   <ARCHIVE_DIR>/<camera>/<YYYYMMDD>.lmk   chunks, appended
+#   <ARCHIVE_DIR>/<camera>/<YYYYMMDD>.idx   one INDEX_DTYPE record per chunk
+#
+# A chunk holds up to ARCHIVE_CHUNK_FRAMES consecutive frames of one camera
+# (at most ARCHIVE_CHUNK_SECONDS, never across local midnight):
+#   uint32  milliseconds since the chunk start, per frame
+#   uint8   present flags (absent frames repeat the previous values)
+#   int16   x, y, z, visibility, presence in 1/8192 steps (lmk.PACK_SCALE),
+#           delta-encoded along time with wrapping int16 arithmetic (so the
+#           decode is exact) and stored byte-planar: all low bytes, then
+#           all high bytes
+# zlib-compressed as a whole. Frame-to-frame deltas of a body are mostly a
+# few steps, so the high-byte plane is nearly all 0x00/0xFF.
+#
+# Frames are written by one background thread; recording is a put_nowait()
+# per chunk. A chunk's index record is written after its data, so a crash
+# can only leave unreferenced bytes at the end of a data file. Queries
+# memory-map both files and decompress only the chunks overlapping the
+# requested time range.
+
+SCALE = lmk.PACK_SCALE
+INDEX_DTYPE = np.dtype([("start", "<f8"), ("end", "<f8"), ("offset", "<u8"), ("size", "<u4"), ("frames", "<u4")])
+
+
+def camera_dir(directory, camera):
+    # Camera names can carry a source path or URL ("camera/dev/video0")
+    return os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", camera))
+
+
+def day_name(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
+
+
+def next_midnight(timestamp):
+    day = datetime.datetime.fromtimestamp(timestamp).date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, datetime.time()).timestamp()
+
+
+def encode_chunk(timestamps, present, frames, level=None):
+    # (N,) float seconds, (N,) bool, (N, 33, 5) float -> compressed bytes
+    n = len(timestamps)
+    ms = np.rint((timestamps - timestamps[0]) * 1000.0).astype("<u4")
+    values = np.clip(np.rint(frames * SCALE), -32768, 32767).astype("<i2")
+    if not present.all():
+        # Absent frames repeat the last present one: zero deltas
+        last = np.where(present, np.arange(n), 0)
+        np.maximum.accumulate(last, out=last)
+        values = values[last]
+    deltas = np.empty_like(values)
+    deltas[0] = values[0]
+    np.subtract(values[1:], values[:-1], out=deltas[1:])
+    planes = deltas.view(np.uint8).reshape(-1, 2).T
+    payload = ms.tobytes() + present.astype(np.uint8).tobytes() + planes.tobytes()
+    return zlib.compress(payload, Config.ARCHIVE_COMPRESSION if level is None else level)
+
+
+def decode_chunk(data, count, start):
+    # Inverse of encode_chunk -> (timestamps, present, frames); absent frames are zeros
+    payload = zlib.decompress(data)
+    ms = np.frombuffer(payload, "<u4", count)
+    present = np.frombuffer(payload, np.uint8, count, 4 * count).astype(bool)
+    planes = np.frombuffer(payload, np.uint8, offset=5 * count).reshape(2, -1)
+    deltas = planes.T.copy().view("<i2").reshape(count, lmk.NUM_LANDMARKS, lmk.NUM_FIELDS)
+    values = np.cumsum(deltas, axis=0, dtype=np.int16)
+    frames = values.astype(lmk.DTYPE)
+    frames *= 1.0 / SCALE
+    frames[~present] = 0.0
+    return start + ms / 1000.0, present, frames
+
+
+class CameraArchive:
+    # Per-camera front end with the recorder interface (main.py):
+    # add(landmarks, timestamp) with every raw frame, None when nobody was
+    # detected. Frames fill a preallocated chunk; full chunks are handed to
+    # the archive's writer thread.
+    def __init__(self, archive, camera, chunk_frames=None):
+        self.archive = archive
+        self.camera = camera
+        self.chunk_frames = chunk_frames or Config.ARCHIVE_CHUNK_FRAMES
+        self._new_chunk()
+
+    def _new_chunk(self):
+        self.frames = lmk.empty_frame((self.chunk_frames,))
+        self.timestamps = np.zeros(self.chunk_frames, dtype=np.float64)
+        self.present = np.zeros(self.chunk_frames, dtype=bool)
+        self.count = 0
+        self.chunk_end = None  # Chunk closes at this timestamp (duration limit or midnight)
+
+    def add(self, landmarks, timestamp):
+        if self.count and timestamp >= self.chunk_end:
+            self.flush()
+        i = self.count
+        if i == 0:
+            self.chunk_end = min(timestamp + Config.ARCHIVE_CHUNK_SECONDS, next_midnight(timestamp))
+        if landmarks is not None:
+            self.frames[i] = landmarks
+            self.present[i] = True
+        self.timestamps[i] = timestamp
+        self.count += 1
+        if self.count >= self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        if self.count == 0:
+            return
+        n = self.count
+        self.archive.put(self.camera, self.timestamps[:n], self.present[:n], self.frames[:n])
+        self._new_chunk()
+
+    def close(self):
+        self.flush()
+
+
+class DayFile:
+    # Append handles for one camera-day; a torn index record (crash) is cut
+    # off so new records stay aligned
+    def __init__(self, directory, day):
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, day)
+        self.day = day
+        self.data = open(base + ".lmk", "ab")
+        self.index = open(base + ".idx", "ab")
+        torn = self.index.seek(0, os.SEEK_END) % INDEX_DTYPE.itemsize
+        if torn:
+            self.index.truncate(self.index.tell() - torn)
+            self.index.seek(0, os.SEEK_END)
+        self.offset = self.data.seek(0, os.SEEK_END)
+
+    def append(self, start, end, frames, payload):
+        self.data.write(payload)
+        self.data.flush()
+        record = np.array([(start, end, self.offset, len(payload), frames)], dtype=INDEX_DTYPE)
+        self.index.write(record.tobytes())
+        self.index.flush()
+        self.offset += len(payload)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class LandmarkArchive:
+    # Writer for every camera of a process (one thread, bounded queue) plus
+    # the read side. Supervisor workers each run their own: files are per
+    # camera, so processes never share one.
+    def __init__(self, directory=None, queue_size=None):
+        self.directory = directory or Config.ARCHIVE_DIR
+        self.queue = queue.Queue(maxsize=queue_size or Config.ARCHIVE_QUEUE_SIZE)
+        self.cameras = []
+        self.files = {}  # camera -> DayFile being appended
+        self.dropped = telemetry.counter("archive_chunks_dropped_total", "Archive chunks dropped on a full queue")
+        self.lock = threading.Lock()
+        self.thread = None  # Started with the first chunk; read-only use never starts it
+
+    def camera(self, name):
+        log = CameraArchive(self, name)
+        self.cameras.append(log)
+        return log
+
+    # --- Recording ---
+
+    def put(self, camera, timestamps, present, frames):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._write, name="landmark-archive", daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait((camera, timestamps, present, frames))
+        except queue.Full:
+            self.dropped.inc()
+
+    def _write(self):
+        chunks = telemetry.counter("archive_chunks_total", "Landmark chunks archived")
+        stored = telemetry.counter("archive_bytes_total", "Compressed landmark bytes archived")
+        encode_time = telemetry.histogram("archive_write_seconds", "Encode + append time per archive chunk")
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            camera, timestamps, present, frames = item
+            start = time.perf_counter()
+            try:
+                payload = encode_chunk(timestamps, present, frames)
+                self._file(camera, timestamps[0]).append(timestamps[0], timestamps[-1], len(timestamps), payload)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to archive {len(timestamps)} frames of {camera}: {e}")
+                continue
+            encode_time.record(time.perf_counter() - start)
+            chunks.inc()
+            stored.inc(len(payload))
+        for day_file in self.files.values():
+            day_file.close()
+
+    def _file(self, camera, timestamp):
+        day = day_name(timestamp)
+        current = self.files.get(camera)
+        if current is None or current.day != day:
+            if current is not None:
+                current.close()
+            current = self.files[camera] = DayFile(camera_dir(self.directory, camera), day)
+            if Config.ARCHIVE_RETENTION_DAYS:
+                self.prune(camera, timestamp - Config.ARCHIVE_RETENTION_DAYS * 86400)
+        return current
+
+    def prune(self, camera, before):
+        # Deletes the camera's day files older than `before` (epoch seconds)
+        cutoff = day_name(before)
+        for path in glob.glob(os.path.join(camera_dir(self.directory, camera), "*.idx")):
+            day = os.path.basename(path)[:-4]
+            if day < cutoff:
+                for old in (path, path[:-4] + ".lmk"):
+                    try:
+                        os.remove(old)
+                    except OSError as e:
+                        logger.warning(f"Could not delete {old}: {e}")
+                logger.info(f"Pruned archive {camera}/{day}")
+
+    def close(self):
+        for log in self.cameras:
+            log.close()
+        if self.thread is not None:
+            self.queue.put(None)  # Blocks if full: everything queued gets written
+            self.thread.join()
+
+    # --- Queries (any process; reads what has been written so far) ---
+
+    def list_cameras(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def days(self, camera):
+        return sorted(os.path.basename(p)[:-4] for p in glob.glob(os.path.join(camera_dir(self.directory, camera), "*.idx")))
+
+    def index(self, camera, day):
+        # Memory-mapped chunk index of one camera-day (complete records only)
+        path = os.path.join(camera_dir(self.directory, camera), day + ".idx")
+        count = os.path.getsize(path) // INDEX_DTYPE.itemsize if os.path.exists(path) else 0
+        if count == 0:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.memmap(path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+
+    def query(self, camera, start=None, end=None):
+        # Frames of one camera within [start, end] (epoch seconds, None =
+        # open) -> (timestamps (N,), present (N,), frames (N, 33, 5))
+        start = start if start is not None else -np.inf
+        end = end if end is not None else np.inf
+        first = day_name(start - Config.ARCHIVE_CHUNK_SECONDS) if np.isfinite(start) else ""
+        last = day_name(end) if np.isfinite(end) else "99999999"
+        parts = []
+        for day in self.days(camera):
+            if not first <= day <= last:
+                continue
+            index = self.index(camera, day)
+            hits = np.flatnonzero((index["end"] >= start) & (index["start"] <= end))
+            if len(hits) == 0:
+                continue
+            data = np.memmap(os.path.join(camera_dir(self.directory, camera), day + ".lmk"), dtype=np.uint8, mode="r")
+            for record in index[hits]:
+                offset, size = int(record["offset"]), int(record["size"])
+                timestamps, present, frames = decode_chunk(data[offset:offset + size], int(record["frames"]),
+                                                           float(record["start"]))
+                keep = (timestamps >= start - 0.0005) & (timestamps <= end + 0.0005)  # Stored to the millisecond
+                parts.append((timestamps[keep], present[keep], frames[keep]))
+        if not parts:
+            return np.zeros(0), np.zeros(0, dtype=bool), lmk.empty_frame((0,))
+        timestamps, present, frames = (np.concatenate(column) for column in zip(*parts))
+        return timestamps, present, frames
+
+    def stats(self, camera):
+        # (days, chunks, frames, stored bytes) of one camera
+        chunks = frames = size = 0
+        days = self.days(camera)
+        for day in days:
+            index = self.index(camera, day)
+            chunks += len(index)
+            frames += int(index["frames"].sum())
+            size += os.path.getsize(os.path.join(camera_dir(self.directory, camera), day + ".lmk"))
+        return len(days), chunks, frames, size
+
+
+def main():
+    from eventstore import parse_time
+    from recorder import save_recording
+
+    parser = argparse.ArgumentParser(description="Inspect or export the landmark archive.")
+    parser.add_argument("command", choices=("stats", "export"))
+    parser.add_argument("--dir", default=Config.ARCHIVE_DIR or "archive")
+    parser.add_argument("--camera", help="e.g. camera0 (export: required)")
+    parser.add_argument("--since", help="7d, 12h, ISO date/time or epoch seconds")
+    parser.add_argument("--until")
+    parser.add_argument("--output", help="export: .npz clip for replay.py / sweep.py")
+    parser.add_argument("--label", default="", help="export: clip label (fall / no_fall)")
+    args = parser.parse_args()
+
+    archive = LandmarkArchive(args.dir)
+    query_start = time.perf_counter()
+    if args.command == "stats":
+        raw_frame = lmk.NUM_LANDMARKS * lmk.NUM_FIELDS * 4 + 8  # float32 frame + timestamp
+        print(f"{'camera':<12} {'days':>4} {'chunks':>7} {'frames':>10} {'MB':>8} {'B/frame':>7} {'ratio':>6}")
+        for camera in ([args.camera] if args.camera else archive.list_cameras()):
+            days, chunks, frames, size = archive.stats(camera)
+            per_frame = size / frames if frames else 0.0
+            ratio = f"{raw_frame / per_frame:.1f}x" if per_frame else "-"
+            print(f"{camera:<12} {days:>4} {chunks:>7} {frames:>10} {size / 1e6:>8.1f} {per_frame:>7.1f} {ratio:>6}")
+    else:
+        if not args.camera or not args.output:
+            parser.error("export needs --camera and --output")
+        timestamps, present, frames = archive.query(args.camera, parse_time(args.since), parse_time(args.until))
+        if len(timestamps) == 0:
+            print("No frames in that range.")
+            return
+        save_recording(args.output, frames, timestamps, present, label=args.label, camera=args.camera)
+        print(f"Exported {len(timestamps)} frames ({int(present.sum())} with a person) to {args.output}")
+    print(f"\nDone in {(time.perf_counter() - query_start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import logging
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from config import Config
+import landmarks as lmk
+
+logger = logging.getLogger("Backends")
+
+# Pose model tiers, least to most accurate
+TIERS = ("lite", "full", "heavy")
+
+MODEL_URL = ("https://storage.googleapis.com/mediapipe-models/pose_landmarker/"
+             "pose_landmarker_{tier}/float16/1/pose_landmarker_{tier}.task")
+
+
+def model_path(tier, extension="task"):
+    return os.path.join(Config.MODEL_DIR, f"pose_landmarker_{tier}.{extension}")
+
+
+class ModelCache:
+    # Process-wide cache of loaded models. Stateless runners such as ONNX
+    # Runtime sessions are shared outright. MediaPipe landmarkers keep
+    # per-stream tracking state, so each stream still needs its own instance;
+    # they are given the .task path, which MediaPipe memory-maps instead of
+    # copying it into the process (read-only pages shared by every landmarker
+    # and supervisor worker, loaded on demand).
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+
+    def get(self, key, loader):
+        with self.lock:
+            if key not in self.items:
+                self.items[key] = loader()
+            return self.items[key]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+MODEL_CACHE = ModelCache()
+
+_BACKENDS = {}
+
+
+def register_backend(name):
+    def decorator(cls):
+        cls.name = name
+        _BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def available_backends():
+    # (backend name, tier) pairs whose runtime is importable and model file exists
+    return [(name, tier) for name, cls in _BACKENDS.items() for tier in TIERS if cls.is_available(tier)]
+
+
+def parse_model_spec(spec):
+    # "full" -> ("mediapipe", "full"), "onnx:heavy" -> ("onnx", "heavy")
+    spec = (spec or Config.POSE_MODEL).strip()
+    if ":" in spec:
+        backend, tier = spec.split(":", 1)
+    else:
+        backend, tier = "mediapipe", spec
+    return backend, tier
+
+
+def create_backend(spec=None, num_poses=1):
+    backend, tier = parse_model_spec(spec)
+    if tier == "auto":
+        backend, tier = select_model(Config.TARGET_FPS)
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown pose backend: {backend} (known: {', '.join(_BACKENDS)})")
+    if tier not in TIERS:
+        raise ValueError(f"Unknown model tier: {tier} (known: {', '.join(TIERS)})")
+    return _BACKENDS[backend](tier, num_poses=num_poses)
+
+
+@register_backend("mediapipe")
+class MediaPipeBackend:
+    # MediaPipe Tasks PoseLandmarker (.task bundle), VIDEO running mode
+    def __init__(self, tier="lite", num_poses=1):
+        self.tier = tier
+        self.num_poses = num_poses
+        self.landmarker = self._create()
+
+    @staticmethod
+    def is_available(tier):
+        return os.path.exists(model_path(tier))
+
+    def _create(self):
+        from mediapipe.tasks import python
+        from mediapipe.tasks.python import vision
+
+        base_options = python.BaseOptions(model_asset_path=model_path(self.tier))
+        options = vision.PoseLandmarkerOptions(
+            base_options=base_options,
+            running_mode=vision.RunningMode.VIDEO,
+            num_poses=self.num_poses)
+        return vision.PoseLandmarker.create_from_options(options)
+
+    def detect(self, rgb, timestamp_ms):
+        # rgb: HxWx3 uint8 RGB image. Returns (N, 33, 5)
+        import mediapipe as mp
+
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+        result = self.landmarker.detect_for_video(mp_image, int(timestamp_ms))
+        poses = lmk.empty_frame((len(result.pose_landmarks),))
+        for i, pose in enumerate(result.pose_landmarks):
+            lmk.from_mediapipe(pose, out=poses[i])
+        return poses
+
+    def reset(self):
+        # Fresh landmarker (drops tracking state); the model stays in the page cache
+        self.close()
+        self.landmarker = self._create()
+
+    def close(self):
+        try:
+            self.landmarker.close()
+        except Exception:
+            pass
+
+
+class LandmarkModelRunner:
+    # Shared pre/post-processing for exported single-person BlazePose
+    # landmark models (ONNX / OpenVINO IR). Expected contract, matching the
+    # pose_landmark_{tier} network: input (1, S, S, 3) float32 RGB in [0, 1],
+    # first output (1, 195) = 39 keypoints x (x, y, z, visibility, presence)
+    # in input pixels, visibility/presence as logits; second output a pose
+    # presence score. Works best on a crop around the person (ROI_ENABLED).
+    INPUT_SIZE = 256
+    extension = "onnx"
+
+    def __init__(self, tier="lite", num_poses=1):
+        self.tier = tier
+        self.num_poses = 1  # Single-person models
+        self.model = MODEL_CACHE.get((self.name, model_path(tier, self.extension)), self._load)
+        self.input = np.zeros((1, self.INPUT_SIZE, self.INPUT_SIZE, 3), dtype=np.float32)
+
+    @classmethod
+    def is_available(cls, tier):
+        try:
+            cls._import_runtime()
+        except ImportError:
+            return False
+        return os.path.exists(model_path(tier, cls.extension))
+
+    def detect(self, rgb, timestamp_ms):
+        height, width = rgb.shape[:2]
+        size = self.INPUT_SIZE
+
+        # Letterbox into the preallocated square input
+        scale = size / max(height, width)
+        new_w, new_h = int(round(width * scale)), int(round(height * scale))
+        pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+        resized = cv2.resize(rgb, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        self.input.fill(0)
+        np.multiply(resized, 1.0 / 255.0, out=self.input[0, pad_y:pad_y + new_h, pad_x:pad_x + new_w])
+
+        raw, presence = self._run(self.input)
+        if float(presence) < Config.MIN_POSE_PRESENCE:
+            return lmk.empty_frame((0,))
+
+        points = raw.reshape(-1, lmk.NUM_FIELDS)[:lmk.NUM_LANDMARKS]
+        poses = lmk.empty_frame((1,))
+        poses[0, :, lmk.X] = (points[:, 0] - pad_x) / new_w
+        poses[0, :, lmk.Y] = (points[:, 1] - pad_y) / new_h
+        poses[0, :, lmk.Z] = points[:, 2] / new_w
+        poses[0, :, lmk.VISIBILITY:] = 1.0 / (1.0 + np.exp(-points[:, 3:5]))
+        return poses
+
+    def reset(self):
+        pass  # Stateless
+
+    def close(self):
+        pass
+
+
+@register_backend("onnx")
+class OnnxBackend(LandmarkModelRunner):
+    extension = "onnx"
+
+    @staticmethod
+    def _import_runtime():
+        import onnxruntime
+        return onnxruntime
+
+    def _load(self):
+        ort = self._import_runtime()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = Config.BACKEND_THREADS
+        session = ort.InferenceSession(model_path(self.tier, self.extension), options,
+                                       providers=["CPUExecutionProvider"])
+        return session
+
+    def _run(self, image):
+        outputs = self.model.run(None, {self.model.get_inputs()[0].name: image})
+        presence = outputs[1].reshape(-1)[0] if len(outputs) > 1 else 1.0
+        return outputs[0], presence
+
+
+@register_backend("openvino")
+class OpenVinoBackend(LandmarkModelRunner):
+    extension = "xml"
+
+    @staticmethod
+    def _import_runtime():
+        import openvino
+        return openvino
+
+    def _load(self):
+        ov = self._import_runtime()
+        core = ov.Core()
+        model = core.read_model(model_path(self.tier, self.extension))
+        return core.compile_model(model, "CPU", {"INFERENCE_NUM_THREADS": Config.BACKEND_THREADS})
+
+    def _run(self, image):
+        # Compiled models are shared; each call gets its own infer request
+        outputs = list(self.model.create_infer_request().infer({0: image}).values())
+        presence = outputs[1].reshape(-1)[0] if len(outputs) > 1 else 1.0
+        return outputs[0], presence
+
+
+_SELECTED = {}
+
+
+def benchmark_backend(backend, tier, frames=20, size=(640, 480)):
+    # Average inference FPS on a synthetic frame, using a throwaway instance
+    runner = _BACKENDS[backend](tier, num_poses=1)
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    try:
+        runner.detect(image, 0)  # Warm-up
+        start = time.perf_counter()
+        for i in range(frames):
+            runner.detect(image, (i + 1) * 33)
+        elapsed = time.perf_counter() - start
+    finally:
+        runner.close()
+    return frames / elapsed if elapsed > 0 else float("inf")
+
+
+def select_model(target_fps=None):
+    # Startup self-benchmark: most accurate tier that still meets the target
+    # FPS on this machine (ties broken by speed). Cached for the process.
+    target_fps = target_fps or Config.TARGET_FPS
+    if target_fps in _SELECTED:
+        return _SELECTED[target_fps]
+
+    candidates = available_backends()
+    if not candidates:
+        raise RuntimeError(f"No pose models found in {os.path.abspath(Config.MODEL_DIR)}. Run download_model.py.")
+
+    results = []
+    for backend, tier in candidates:
+        try:
+            fps = benchmark_backend(backend, tier)
+        except Exception as e:
+            logger.warning(f"Benchmark of {backend}:{tier} failed: {e}")
+            continue
+        logger.info(f"Benchmark {backend}:{tier}: {fps:.1f} FPS")
+        results.append((TIERS.index(tier), fps, backend, tier))
+
+    if not results:
+        raise RuntimeError("No pose backend could run on this machine.")
+
+    fast_enough = [r for r in results if r[1] >= target_fps]
+    # Nothing meets the target: fall back to the fastest option
+    _, fps, backend, tier = max(fast_enough) if fast_enough else max(results, key=lambda r: r[1])
+    logger.info(f"Selected {backend}:{tier} ({fps:.1f} FPS, target {target_fps})")
+    _SELECTED[target_fps] = (backend, tier)
+    return backend, tier
@@ -0,0 +1,228 @@
+import logging
+import os
+import time
+import cv2
+import numpy as np
+from config import Config
+
+logger = logging.getLogger("Capture")
+
+# Pixel layouts a capture source can deliver
+BGR = "bgr"
+RGB = "rgb"
+YUV = "yuv"  # I420 planar, shape (H * 3 / 2, W), as decoders emit it
+
+COLORS = (BGR, RGB, YUV)
+
+_TO_RGB = {BGR: cv2.COLOR_BGR2RGB, YUV: cv2.COLOR_YUV2RGB_I420}
+_TO_BGR = {RGB: cv2.COLOR_RGB2BGR, YUV: cv2.COLOR_YUV2BGR_I420}
+_TO_GRAY = {BGR: cv2.COLOR_BGR2GRAY, RGB: cv2.COLOR_RGB2GRAY}
+
+
+def frame_size(frame, color=BGR):
+    # (height, width) of the picture, whatever the layout
+    if color == YUV:
+        return frame.shape[0] * 2 // 3, frame.shape[1]
+    return frame.shape[:2]
+
+
+def to_rgb(frame, color=BGR):
+    # Contiguous RGB image; no copy when the frame already is one
+    if color == RGB:
+        return frame if frame.flags.c_contiguous else np.ascontiguousarray(frame)
+    return cv2.cvtColor(frame, _TO_RGB[color])
+
+
+def to_bgr(frame, color=BGR):
+    if color == BGR:
+        return frame
+    return cv2.cvtColor(frame, _TO_BGR[color])
+
+
+def resize(frame, scale, color=BGR):
+    # Downscaled copy and its layout (planar YUV is converted to RGB first).
+    # Landmarks are normalized, so results on it map back for free.
+    if scale >= 1.0:
+        return frame, color
+    if color == YUV:
+        frame, color = to_rgb(frame, color), RGB
+    return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), color
+
+
+def to_gray(frame, color=BGR):
+    if frame.ndim == 2 and color != YUV:
+        return frame
+    if color == YUV:
+        return frame[:frame.shape[0] * 2 // 3]  # The Y plane is the grayscale image
+    return cv2.cvtColor(frame, _TO_GRAY[color])
+
+
+def has_gstreamer():
+    return "GStreamer:                   YES" in cv2.getBuildInformation()
+
+
+def gstreamer_pipeline(url, color=None, threads=None):
+    # RTSP -> depay -> decode -> appsink. With YUV the decoder's native I420
+    # goes straight to the appsink (no videoconvert pass); OpenCV's appsink
+    # only takes BGR among packed formats, so BGR/RGB requests get BGR.
+    color = color or Config.CAPTURE_COLOR
+    threads = threads or Config.DECODE_THREADS
+    decoder = Config.GST_DECODER
+    if decoder == "avdec_h264":
+        decoder = f"avdec_h264 max-threads={threads}"
+    if color == YUV:
+        convert = "video/x-raw,format=I420"
+    else:
+        convert = f"videoconvert n-threads={threads} ! video/x-raw,format=BGR"
+    return (f"rtspsrc location={url} latency=0 protocols=tcp ! rtph264depay ! h264parse ! {decoder} ! "
+            f"{convert} ! appsink drop=true max-buffers=1 sync=false")
+
+
+class VideoSource:
+    # cv2.VideoCapture with a ring of reused frame buffers. read() decodes
+    # into the next buffer of the ring, so steady-state capture allocates
+    # nothing. A frame stays valid until the ring wraps around: size the
+    # ring (CAPTURE_BUFFERS) above the number of frames the pipeline can
+    # hold at once (queues + frames being processed).
+    # `ended` is set once a video file (is_file) runs out of frames; a failed
+    # read from a camera or stream is just a dropout.
+    def __init__(self, cap, color=BGR, buffers=None, name="", is_file=False):
+        self.cap = cap
+        self.color = color
+        self.name = name
+        self.is_file = is_file
+        self.ended = False
+        self.buffers = [None] * (buffers or Config.CAPTURE_BUFFERS)
+        self.index = 0
+
+    def read(self):
+        slot = self.index
+        self.index = (slot + 1) % len(self.buffers)
+        buffer = self.buffers[slot]
+        success, frame = self.cap.read(buffer) if buffer is not None else self.cap.read()
+        if success:
+            self.buffers[slot] = frame
+        elif self.is_file:
+            self.ended = True
+        return success, frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def release(self):
+        self.cap.release()
+
+
+class LoopSource(VideoSource):
+    # Test/loopback source: plays a video file forever, paced at its own FPS
+    # (or `fps`) so it behaves like a live camera.
+    def __init__(self, path, fps=None, buffers=None):
+        super().__init__(_open_ffmpeg(path), BGR, buffers, name=path)
+        self.path = path
+        self.interval = 1.0 / (fps or self.cap.get(cv2.CAP_PROP_FPS) or Config.FPS)
+        self.next_time = time.perf_counter()
+
+    def read(self):
+        success, frame = super().read()
+        if not success:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = super().read()
+        delay = self.next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time = max(self.next_time + self.interval, time.perf_counter() - self.interval)
+        return success, frame
+
+
+class ArraySource:
+    # In-memory frames (tests, benchmarks); optionally looping. `ended` is
+    # set once a non-looping source has delivered every frame.
+    def __init__(self, frames, color=BGR, loop=False):
+        self.frames = frames
+        self.color = color
+        self.loop = loop
+        self.index = 0
+        self.name = "array"
+        self.ended = False
+
+    def read(self):
+        if self.index >= len(self.frames):
+            if not self.loop or not len(self.frames):
+                self.ended = True
+                return False, None
+            self.index = 0
+        frame = self.frames[self.index]
+        self.index += 1
+        return True, frame
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0.0
+
+    def release(self):
+        pass
+
+
+def _open_ffmpeg(source, threads=None):
+    # Hardware decode when available, bounded decoder threads
+    threads = threads or Config.DECODE_THREADS
+    params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY, cv2.CAP_PROP_N_THREADS, threads,
+              cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, Config.CAPTURE_OPEN_TIMEOUT_MS,
+              cv2.CAP_PROP_READ_TIMEOUT_MSEC, Config.CAPTURE_READ_TIMEOUT_MS]
+    try:
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG, params)
+    except cv2.error:
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(source)  # Whatever backend OpenCV picks
+    return cap
+
+
+def open_capture(source, color=None, backend=None):
+    # source: webcam index (int or digits), rtsp:// / http:// URL, video file,
+    # or "loop:<file>" for a looping, real-time-paced file.
+    # Returns an object with the cv2.VideoCapture read/isOpened/set/release
+    # interface plus a `color` attribute describing the frames it delivers.
+    color = color or Config.CAPTURE_COLOR
+    backend = backend or Config.CAPTURE_BACKEND
+    if color not in COLORS:
+        raise ValueError(f"Unknown capture color: {color} (known: {', '.join(COLORS)})")
+
+    if isinstance(source, str) and source.strip().isdigit():
+        source = int(source)
+
+    if isinstance(source, int):
+        cap = VideoSource(cv2.VideoCapture(source), BGR, name=f"camera{source}")
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, Config.FRAME_WIDTH)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, Config.FRAME_HEIGHT)
+        cap.set(cv2.CAP_PROP_FPS, Config.FPS)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Don't queue stale frames in the driver
+        return cap
+
+    if source.startswith("loop:"):
+        return LoopSource(source[len("loop:"):])
+
+    if "://" in source:
+        if backend in ("auto", "gstreamer") and source.startswith(("rtsp://", "rtsps://")) and has_gstreamer():
+            stream_color = YUV if color == YUV else BGR
+            cap = cv2.VideoCapture(gstreamer_pipeline(source, stream_color), cv2.CAP_GSTREAMER)
+            if cap.isOpened():
+                return VideoSource(cap, stream_color, name=source)
+            logger.warning(f"GStreamer pipeline failed for {source}, falling back to FFmpeg")
+        elif backend == "gstreamer":
+            logger.warning("OpenCV was built without GStreamer, using FFmpeg")
+        if source.startswith(("rtsp://", "rtsps://")):
+            os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+
+    return VideoSource(_open_ffmpeg(source), BGR, name=str(source), is_file="://" not in source)
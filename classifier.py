@@ -0,0 +1,240 @@
+import os
+import time
+import numpy as np
+from config import Config
+import landmarks as lmk
+import telemetry
+from backends import MODEL_CACHE
+from detector import LandmarkSmoother
+from settings import AnalyzerSettings
+
+# Learned alternative to FallAnalyzer's thresholds: a rolling window of
+# per-frame pose features is summarized into one vector and scored by a
+# small gradient-boosted tree ensemble (numpy, train_classifier.py) or any
+# ONNX model taking the raw (1, window, features) tensor.
+
+# Per-frame features
+FRAME_FEATURES = (
+    "centroid_x", "centroid_y", "head_y", "torso_verticality", "body_height",
+    "bbox_aspect", "centroid_vy", "head_vy", "joint_speed", "visibility",
+)
+WINDOW_STATS = ("last", "mean", "min", "max", "delta")
+FEATURE_NAMES = tuple(f"{f}_{s}" for s in WINDOW_STATS for f in FRAME_FEATURES)
+
+CENTROID_JOINTS = np.array(lmk.SHOULDERS + lmk.HIPS)
+KEY_JOINTS = np.array([lmk.NOSE] + lmk.SHOULDERS + lmk.HIPS
+                      + [lmk.LEFT_KNEE, lmk.RIGHT_KNEE, lmk.LEFT_ANKLE, lmk.RIGHT_ANKLE])
+
+
+class FeatureWindow:
+    # Ring buffer of per-frame feature rows (window, F). add() computes one
+    # row from a smoothed landmark frame; vector() summarizes the window.
+    def __init__(self, window=None):
+        self.window = int(window or Config.CLASSIFIER_WINDOW)
+        self.rows = np.zeros((self.window, len(FRAME_FEATURES)), dtype=np.float32)
+        self.out = np.zeros(len(FEATURE_NAMES), dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+        self.prev_key = None
+        self.prev_time = None
+
+    @property
+    def ready(self):
+        return self.count >= max(2, self.window // 2)
+
+    def add(self, frame, timestamp):
+        row = self.rows[self.index]
+        xy = frame[:, lmk.XY]
+        centroid = xy[CENTROID_JOINTS].mean(axis=0)
+        key = xy[KEY_JOINTS]
+
+        torso = lmk.midpoint(frame, lmk.LEFT_HIP, lmk.RIGHT_HIP) - lmk.midpoint(frame, lmk.LEFT_SHOULDER, lmk.RIGHT_SHOULDER)
+        x_min, y_min = xy.min(axis=0)
+        x_max, y_max = xy.max(axis=0)
+        height = y_max - y_min
+
+        row[0], row[1] = centroid
+        row[2] = frame[lmk.NOSE, lmk.Y]
+        row[3] = abs(torso[1]) / (abs(torso[0]) + abs(torso[1]) + 1e-6)  # 0 horizontal .. 1 vertical
+        row[4] = height
+        row[5] = (x_max - x_min) / max(height, 1e-3)
+
+        dt = timestamp - self.prev_time if self.prev_time is not None else 0.0
+        if dt > 0:
+            last = self.rows[self.index - 1]
+            row[6] = (row[1] - last[1]) / dt
+            row[7] = (row[2] - last[2]) / dt
+            row[8] = np.sqrt(((key - self.prev_key) ** 2).sum(axis=1)).mean() / dt
+        else:
+            row[6:9] = 0.0
+        row[9] = frame[KEY_JOINTS, lmk.VISIBILITY].mean()
+
+        self.prev_key = key
+        self.prev_time = timestamp
+        self.index = (self.index + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+        return row
+
+    def ordered(self):
+        # Oldest-first (count, F) rows
+        if self.count < self.window:
+            return self.rows[:self.count]
+        return np.roll(self.rows, -self.index, axis=0)
+
+    def vector(self):
+        rows = self.rows[:self.count] if self.count < self.window else self.rows
+        first = self.rows[0] if self.count < self.window else self.rows[self.index]
+        last = self.rows[self.index - 1]
+        f = len(FRAME_FEATURES)
+        out = self.out
+        out[:f] = last
+        out[f:2 * f] = rows.mean(axis=0)
+        out[2 * f:3 * f] = rows.min(axis=0)
+        out[3 * f:4 * f] = rows.max(axis=0)
+        out[4 * f:] = last - first
+        return out
+
+
+class TreeEnsemble:
+    # Gradient-boosted trees stored as complete binary trees of fixed depth:
+    # node i has children 2i+1 / 2i+2, leaves hold learning-rate-scaled
+    # values. predict() walks all trees at once, one numpy step per level.
+    def __init__(self, feature, threshold, value, base_score, window):
+        self.feature = np.asarray(feature, dtype=np.int32)      # (trees, internal nodes)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.value = np.asarray(value, dtype=np.float32)        # (trees, all nodes)
+        self.base_score = float(base_score)
+        self.window = int(window)
+        self.depth = int(np.log2(self.feature.shape[1] + 1))
+        self.trees = np.arange(len(self.feature))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["feature"], data["threshold"], data["value"], data["base_score"], data["window"])
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, value=self.value,
+                 base_score=np.float64(self.base_score), window=np.int64(self.window),
+                 feature_names=np.array(FEATURE_NAMES))
+
+    def raw_scores(self, X):
+        # X: (N, features) -> (N,) log-odds
+        X = np.atleast_2d(X)
+        node = np.zeros((len(X), len(self.trees)), dtype=np.int64)
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.depth):
+            feature = self.feature[self.trees, node]
+            right = X[rows, feature] > self.threshold[self.trees, node]
+            node = 2 * node + 1 + right
+        return self.base_score + self.value[self.trees, node].sum(axis=1)
+
+    def predict(self, vector, window_rows=None):
+        score = self.base_score
+        node = np.zeros(len(self.trees), dtype=np.int64)
+        for _ in range(self.depth):
+            node = 2 * node + 1 + (vector[self.feature[self.trees, node]] > self.threshold[self.trees, node])
+        score += float(self.value[self.trees, node].sum())
+        return 1.0 / (1.0 + np.exp(-score))
+
+
+class OnnxWindowModel:
+    # Any ONNX model (e.g. a tiny 1D-CNN) mapping the raw feature window
+    # (1, window, len(FRAME_FEATURES)) float32 to a fall probability/logit.
+    def __init__(self, path, window=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.window = int(window or Config.CLASSIFIER_WINDOW)
+        self.input = np.zeros((1, self.window, len(FRAME_FEATURES)), dtype=np.float32)
+
+    def predict(self, vector, window_rows=None):
+        self.input.fill(0)
+        self.input[0, self.window - len(window_rows):] = window_rows  # Right-aligned, zero-padded
+        out = float(np.asarray(self.session.run(None, {self.input_name: self.input})[0]).reshape(-1)[-1])
+        return out if 0.0 <= out <= 1.0 else 1.0 / (1.0 + np.exp(-out))
+
+
+def load_model(path=None):
+    path = path or Config.CLASSIFIER_MODEL
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Fall classifier model not found: {path}. Train one with train_classifier.py.")
+    if path.endswith(".onnx"):
+        return MODEL_CACHE.get(("classifier", path), lambda: OnnxWindowModel(path))
+    return MODEL_CACHE.get(("classifier", path), lambda: TreeEnsemble.load(path))
+
+
+class ClassifierAnalyzer:
+    # Drop-in replacement for FallAnalyzer (same analyze() contract) that
+    # decides from the model score: a fall is confirmed after
+    # classifier_confirm_frames consecutive frames above the threshold and
+    # released once the score falls below the release threshold.
+    def __init__(self, model_path=None, settings=None):
+        self.model = load_model(model_path)
+        self.settings = settings or AnalyzerSettings()
+        self.smoother = LandmarkSmoother(window_size=Config.SMOOTHING_WINDOW_SIZE, mode=Config.SMOOTHING_MODE)
+        self.features = FeatureWindow(self.model.window)
+        self.state = "NORMAL"
+        self.event_id = 0
+        self.score = 0.0
+        self.above = 0
+        self.verticality = 1.0
+        self.report_angle = True  # See FallAnalyzer.report_angle
+
+    def is_tracking_fall(self):
+        return self.state != "NORMAL"
+
+    def apply_settings(self, settings):
+        self.settings = settings
+
+    def torso_angle(self):
+        # Same 0..90 scale as FallAnalyzer
+        return float(np.degrees(np.arctan2(self.verticality, 1.0 - self.verticality)))
+
+    @telemetry.timed("fall_analysis_seconds", "Smoothing + fall state machine time per frame", analyzer="classifier")
+    def analyze(self, raw_landmarks, timestamp=None):
+        if raw_landmarks is None or len(raw_landmarks) == 0:
+            return "NORMAL"
+
+        current_time = timestamp if timestamp is not None else time.time()
+        settings = self.settings
+        self.smoother.smooth(raw_landmarks, current_time)
+        landmarks = self.smoother.frame
+
+        row = self.features.add(landmarks, current_time)
+        self.verticality, velocity = float(row[3]), float(row[7])
+
+        if self.features.ready:
+            rows = self.features.ordered() if isinstance(self.model, OnnxWindowModel) else None
+            self.score = self.model.predict(self.features.vector(), rows)
+
+        status = "NORMAL"
+        if self.state == "NORMAL":
+            if self.score >= settings.classifier_threshold:
+                self.state = "POTENTIAL_FALL"
+                self.above = 1
+
+        elif self.state == "POTENTIAL_FALL":
+            if self.score >= settings.classifier_threshold:
+                self.above += 1
+            else:
+                self.state = "NORMAL"
+                self.above = 0
+
+        elif self.state == "FALL_DETECTED":
+            status = "FALL_DETECTED"
+            if self.score < settings.classifier_release_threshold:
+                self.state = "NORMAL"
+                self.above = 0
+
+        if self.state == "POTENTIAL_FALL" and self.above >= settings.classifier_confirm_frames:
+            self.state = "FALL_DETECTED"
+            status = "FALL_DETECTED"
+            self.event_id += 1
+
+        return status, landmarks, self.torso_angle() if self.report_angle else None, velocity
@@ -6,10 +6,81 @@ load_dotenv()
 class Config:
     # Camera Settings
     CAMERA_INDEX = 0  # Default webcam
+    # Multi-camera supervisor: comma-separated indices, RTSP URLs or video files
+    CAMERA_SOURCES = os.getenv("CAMERA_SOURCES", "")
     FRAME_WIDTH = 640
     FRAME_HEIGHT = 480
     FPS = 30
 
+    # Capture (see capture.py)
+    CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "auto")  # auto, gstreamer, ffmpeg (network streams)
+    CAPTURE_COLOR = os.getenv("CAPTURE_COLOR", "yuv")  # yuv: decoder's native I420 straight to the model input (GStreamer RTSP); bgr: classic
+    DECODE_THREADS = 2  # Decoder threads per stream
+    CAPTURE_BUFFERS = 6  # Reused frame buffers per source (> frames in flight in the pipeline)
+    GST_DECODER = os.getenv("GST_DECODER", "avdec_h264")  # e.g. nvh264dec, vaapih264dec, v4l2h264dec
+
+    # Pipeline Mode: capture, inference and render on separate threads linked by
+    # bounded queues. Drop policies: "drop_oldest" (latest frame wins),
+    # "drop_newest" or "block".
+    PIPELINE_MODE = os.getenv("PIPELINE_MODE", "0") == "1"
+    PIPELINE_QUEUE_SIZE = 1
+    CAPTURE_DROP_POLICY = "drop_oldest"
+    RESULT_DROP_POLICY = "drop_oldest"
+    PIPELINE_STATS_INTERVAL = 5.0  # Seconds between per-stage throughput reports (0 = off)
+
+    # Adaptive inference: full rate on motion or a suspected fall, a low idle
+    # rate (on a downscaled frame) while the scene is still
+    ADAPTIVE_INFERENCE = os.getenv("ADAPTIVE_INFERENCE", "0") == "1"
+    IDLE_INFERENCE_FPS = 5
+    IDLE_INFERENCE_SCALE = 0.5  # Frame scale for idle inference (1.0 = full size)
+    MOTION_THRESHOLD = 2.0  # Mean gray-level change (0-255) that counts as motion
+    MOTION_HOLD_SECONDS = 2.0  # Stay at full rate this long after the last motion
+
+    # Region-of-interest inference: crop a padded box around the last pose
+    ROI_ENABLED = os.getenv("ROI_ENABLED", "0") == "1"
+    ROI_PADDING = 0.25  # Padding as a fraction of the pose box's longer side
+    ROI_MIN_SIZE = 0.3  # Minimum crop size as a fraction of the frame
+    ROI_MAX_AREA = 0.7  # Use the full frame if the crop would cover more than this
+    ROI_EDGE_MARGIN = 0.05  # Re-center once the pose gets this close to the crop edge
+    ROI_MIN_VISIBILITY = 0.5  # Mean visibility below which we fall back to full frame
+    ROI_FULL_FRAME_INTERVAL = 30  # Frames between full-frame searches while cropping
+
+    # Watchdog (see watchdog.py): dead streams are reopened with exponential
+    # backoff, a failing or hung landmarker is recreated, and inference is
+    # shed in stages while it cannot keep up
+    CAPTURE_RETRY_DELAY = 0.05  # Seconds to wait after a failed read (no busy loop)
+    CAPTURE_RECONNECT_AFTER = 2.0  # Seconds without a frame before the stream is reopened
+    RECONNECT_BASE_DELAY = 0.5  # First reconnect backoff, doubled per failed attempt
+    RECONNECT_MAX_DELAY = 10.0
+    CAPTURE_OPEN_TIMEOUT_MS = 10000  # FFmpeg open/read timeouts, so a dead network stream can't hang read()
+    CAPTURE_READ_TIMEOUT_MS = 5000
+    BACKEND_RESET_ERRORS = 10  # Consecutive inference failures before the landmarker is recreated
+    STALL_SECONDS = 5.0  # No frame / no analyzed frame for this long = stalled
+    WATCHDOG_INTERVAL = 1.0  # Seconds between health checks
+    # Load shedding stages: (max inference FPS, 0 = every frame; frame scale).
+    # A suspected fall always gets every frame, at the current stage's scale.
+    DEGRADE_STAGES = ((0, 1.0), (15, 1.0), (10, 0.75), (5, 0.5))
+    DEGRADE_WINDOW = 5.0  # Seconds of inference load per stage decision
+    DEGRADE_HIGH_LOAD = 0.9  # Busy fraction of the inference thread that steps down a stage
+    DEGRADE_LOW_LOAD = 0.4  # ... and that steps back up, after DEGRADE_RECOVER_WINDOWS calm windows
+    DEGRADE_RECOVER_WINDOWS = 3
+    WORKER_STALL_SECONDS = 30.0  # Supervisor restarts a camera worker silent for this long
+
+    # Pose Model: "lite" | "full" | "heavy" (MediaPipe), "onnx:<tier>",
+    # "openvino:<tier>", or "auto" to benchmark and pick the most accurate
+    # tier that reaches TARGET_FPS on this machine
+    POSE_MODEL = os.getenv("POSE_MODEL", "lite")
+    MODEL_DIR = os.getenv("MODEL_DIR", ".")
+    TARGET_FPS = 15
+    BACKEND_THREADS = 1  # Intra-op threads for ONNX/OpenVINO runners
+    MIN_POSE_PRESENCE = 0.5
+    MODEL_WARMUP = True  # One inference on a blank frame before the first camera frame
+
+    # Startup (see startup.py): the pose model loads and warms up while the
+    # camera opens, and Google Sheets connects in the background (alerts
+    # raised meanwhile are journaled and held). 0 = everything in sequence.
+    FAST_STARTUP = os.getenv("FAST_STARTUP", "1") == "1"
+
     # Fall Detection Thresholds
     FALL_TIME_WINDOW = 0.5  # Seconds to detect the drop
     LYING_DOWN_DURATION = 3.0  # Seconds to confirm they are on the floor
@@ -21,10 +92,57 @@ class Config:
 
     # V2: Advanced Physics
     SMOOTHING_WINDOW_SIZE = 5 # Frames to average
+    SMOOTHING_MODE = "window"  # "window" (boxcar), "ema" or "one_euro"
+    SMOOTHING_EMA_ALPHA = 0.5  # Weight of the newest frame in "ema" mode
+    ONE_EURO_MIN_CUTOFF = 1.0  # Hz. Lower = less jitter at rest
+    ONE_EURO_BETA = 10.0  # Higher = less lag during fast motion
+    ONE_EURO_D_CUTOFF = 1.0  # Hz. Cutoff for the derivative estimate
     FALL_ANGLE_THRESHOLD = 45 # Degrees. < 45 means closer to horizontal.
+
+    # Analyzer engine: "heuristic" (thresholds above) or "classifier" (see classifier.py)
+    ANALYZER_ENGINE = os.getenv("ANALYZER_ENGINE", "heuristic")
+    CLASSIFIER_MODEL = os.getenv("CLASSIFIER_MODEL", "fall_classifier.npz")  # .npz trees or .onnx
+    CLASSIFIER_WINDOW = 30  # Frames of pose features per decision
+    CLASSIFIER_THRESHOLD = 0.7  # Fall probability that starts a potential fall
+    CLASSIFIER_CONFIRM_FRAMES = 5  # Consecutive frames above threshold to confirm
+    CLASSIFIER_RELEASE_THRESHOLD = 0.3  # Back to NORMAL below this
+
+    # Hot-reloadable thresholds with per-camera overrides (see settings.py);
+    # the values above are the defaults for anything the file leaves out
+    SETTINGS_PATH = os.getenv("SETTINGS", "settings.json")
+    SETTINGS_POLL_INTERVAL = 1.0  # Seconds between file change checks
+
+    # Multi-person rooms
+    MAX_POSES = 1  # Poses per frame from the landmarker (> 1 enables tracking)
+    MAX_TRACKS = 4  # Tracked residents per camera (analyzer slots)
+    TRACK_IOU_THRESHOLD = 0.3  # Bounding-box IoU to keep a track ID
+    TRACK_MAX_DISTANCE = 0.2  # Normalized centroid distance fallback
+    TRACK_MAX_MISSED = 15  # Frames a track survives without a matching pose
     
     # Directories
     ALERTS_DIR = "captures"
+    # Incident artifacts (see incidents.py): frames kept before/after a fall
+    INCIDENT_PRE_FRAMES = 150
+    INCIDENT_POST_FRAMES = 60
+    INCIDENT_CLIP = os.getenv("INCIDENT_CLIP", "0") == "1"  # Also keep an .mp4 of the privacy frames (~1 MB RAM per frame at 640x480)
+    INCIDENT_QUEUE_SIZE = 4
+    RECORD_DIR = os.getenv("RECORD_DIR", "")  # Set to record raw landmarks as .npz clips
+    RECORD_CLIP_FRAMES = 9000  # Frames per recorded clip (~5 min at 30 FPS)
+    # Long-term landmark archive (see archive.py): every raw landmark frame,
+    # quantized and delta-encoded in per-camera daily files; empty = off
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+    ARCHIVE_CHUNK_FRAMES = 300  # Frames per chunk, the unit a query decodes
+    ARCHIVE_CHUNK_SECONDS = 10.0  # A chunk never spans more than this
+    ARCHIVE_COMPRESSION = 6  # zlib level of each chunk
+    ARCHIVE_QUEUE_SIZE = 256  # Chunks waiting for the writer before new ones are dropped
+    ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "0"))  # Older day files are deleted; 0 = keep
+
+    # Local event history (see eventstore.py); empty = off
+    EVENTS_DB = os.getenv("EVENTS_DB", "events.db")
+    EVENTS_COMMIT_INTERVAL = 0.5  # Seconds the writer gathers rows into one commit
+    EVENTS_BATCH_SIZE = 1000  # Max rows per commit
+    EVENTS_QUEUE_SIZE = 10000  # Rows waiting for the writer before new ones are dropped
+    EVENTS_SUMMARY_INTERVAL = 60.0  # Seconds per landmark summary row
 
     # "Lying down" heuristic: Width > Height of bounding box, or specific keypoint arrangement
     # For now, we'll check if y-coordinates of head are close to ankles/hips (vertical compression)
@@ -38,6 +156,53 @@ class Config:
     TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
     WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
 
+    # Alert delivery
+    ALERT_JOURNAL_PATH = os.getenv("ALERT_JOURNAL", "alerts_journal.jsonl")  # Undelivered alerts survive restarts
+    ALERT_JOURNAL_FSYNC = False  # fsync every journal write (slower, survives power loss)
+    CHANNEL_CONCURRENCY = {"telegram": 2, "webhook": 2}  # Delivery threads (max in-flight requests) per channel
+    HTTP_CONNECT_TIMEOUT = 3.05  # Seconds
+    HTTP_READ_TIMEOUT = 5.0  # Seconds
+    ALERT_RETRY_BASE_DELAY = 1.0  # Seconds, doubled on every failed attempt
+    ALERT_RETRY_MAX_DELAY = 60.0
+    ALERT_MAX_ATTEMPTS = 8  # Per process run; still pending alerts are retried on restart
+    SHEETS_BATCH_SIZE = 20  # Rows per append_rows call
+    SHEETS_FLUSH_INTERVAL = 2.0  # Seconds a row may wait for its batch
+
     # Display
     PRIVACY_MODE = True  # Default to Stick Figure only
     WINDOW_NAME = "Privacy-First Fall Detector"
+    HEADLESS = os.getenv("HEADLESS", "0") == "1"  # No rendering/window (servers, edge boxes)
+
+    # Local alarm (see alarm.py)
+    ALARM_OUTPUTS = os.getenv("ALARM_OUTPUTS", "tone")  # Comma list of: tone, gpio, socket
+    ALARM_SAMPLE_RATE = 16000  # Hz, precomputed alarm tones
+    ALARM_GPIO_PIN = int(os.getenv("ALARM_GPIO_PIN", "17"))  # Relay line (sysfs GPIO number)
+    ALARM_SOCKET = os.getenv("ALARM_SOCKET", "127.0.0.1:9750")  # Siren controller, UDP host:port
+
+    # Live stream for dashboards (see server.py); 0 = disabled
+    STREAM_PORT = int(os.getenv("STREAM_PORT", "0"))
+    STREAM_HOST = os.getenv("STREAM_HOST", "0.0.0.0")
+    STREAM_FPS = 15  # Max skeleton frames/sec per camera sent to viewers
+    STREAM_MAX_CLIENTS = 64
+    STREAM_EVENT_BACKLOG = 64  # Status events buffered per slow viewer
+    STREAM_SEND_TIMEOUT = 10.0  # Viewers stuck longer than this are dropped
+
+    # Landmark ingest (see ingest.py): thin clients (browsers, tablets) run
+    # only pose inference and send packed landmark batches; one server
+    # analyzes and alerts for every room
+    INGEST_PORT = int(os.getenv("INGEST_PORT", "8770"))
+    INGEST_HOST = os.getenv("INGEST_HOST", "0.0.0.0")
+    INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")  # Shared secret clients must send (empty = open)
+    INGEST_MAX_SESSIONS = 512  # Analyzer slots (one per connected room)
+    INGEST_MAX_BATCH_FRAMES = 64  # Frames per client message
+    INGEST_BATCH_WINDOW = 0.002  # Seconds to gather other sessions' messages into one analyzer pass
+    INGEST_SESSION_TIMEOUT = 60.0  # HTTP sessions idle this long release their slot
+
+    # Metrics & profiling (see telemetry.py)
+    METRICS_ENABLED = os.getenv("METRICS", "1") == "1"  # Per-call timing histograms and counters
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Prometheus /metrics endpoint; 0 = off
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_DUMP_PATH = os.getenv("METRICS_DUMP", "")  # Periodic JSON dump; empty = off
+    METRICS_DUMP_INTERVAL = 10.0
+    PROFILE_PATH = os.getenv("PROFILE", "")  # Folded-stack output of the sampling profiler; empty = off
+    PROFILE_INTERVAL = 0.01
@@ -1,99 +1,274 @@
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-import cv2
 import time
 import math
+import types
 import numpy as np
 from config import Config
+import landmarks as lmk
+import capture
+from tracker import PoseTracker
+from backends import create_backend
+from settings import AnalyzerSettings
+import kinematics
+import telemetry
 
 class PoseDetector:
-    def __init__(self):
-        # Load the task file downloaded
-        base_options = python.BaseOptions(model_asset_path='pose_landmarker_lite.task')
-        options = vision.PoseLandmarkerOptions(
-            base_options=base_options,
-            running_mode=vision.RunningMode.VIDEO)
-        self.landmarker = vision.PoseLandmarker.create_from_options(options)
-
-    def find_pose(self, frame, timestamp_ms):
-        # Convert to MP Image
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    def __init__(self, num_poses=None, model=None):
+        self.num_poses = num_poses or Config.MAX_POSES
+
+        # Pose backend/tier, e.g. "lite", "mediapipe:heavy", "onnx:full" or "auto"
+        # (see backends.py). Model files are loaded once per process.
+        self.backend = create_backend(model or Config.POSE_MODEL, num_poses=self.num_poses)
+
+        # Region of interest (normalized 0..1 x0, y0, x1, y1) around the last
+        # pose; None = full frame. Normalized so it still fits when the frame
+        # size changes (idle downscale, capture.resize).
+        self.roi_enabled = Config.ROI_ENABLED
+        self.roi = None
+        self.frames_since_full = 0
+
+        # Consecutive backend failures; BACKEND_RESET_ERRORS in a row recreate it
+        self.errors = 0
+
+    def reset_backend(self):
+        # Fresh landmarker (e.g. wedged or failing on every frame). Call it
+        # from the thread that runs inference.
+        self.errors = 0
+        self.roi = None
+        try:
+            self.backend.reset()
+            print("Pose backend recreated.")
+        except Exception as e:
+            print(f"Error recreating the pose backend: {e}")
+        telemetry.counter("backend_resets_total", "Pose landmarkers recreated after failures").inc()
+
+    def warm_up(self, width=None, height=None):
+        # One inference on a blank frame, so the first camera frame doesn't pay
+        # for graph setup, kernel selection and faulting in the model pages.
+        # Timestamp 0 precedes every live (wall clock) frame timestamp.
+        blank = np.zeros((height or Config.FRAME_HEIGHT, width or Config.FRAME_WIDTH, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        self.backend.detect(blank, 0)
+        return time.perf_counter() - start
+
+    def _next_roi(self, poses, width, height):
+        # Padded box around every detected person, kept "sticky": the crop is
+        # only moved when the person nears its edge. The landmarker tracks
+        # poses between frames, so a stable crop keeps that tracking valid.
+        if len(poses) == 0 or poses[0, :, lmk.VISIBILITY].mean() < Config.ROI_MIN_VISIBILITY:
+            return None  # Tracking confidence dropped: search the full frame
+
+        box = lmk.bounding_box(poses).reshape(-1, 4)
+        x0, y0 = box[:, :2].min(axis=0)
+        x1, y1 = box[:, 2:].max(axis=0)
+
+        if self.roi is not None:
+            rx0, ry0, rx1, ry1 = self.roi
+            margin_x = (rx1 - rx0) * Config.ROI_EDGE_MARGIN
+            margin_y = (ry1 - ry0) * Config.ROI_EDGE_MARGIN
+            if x0 > rx0 + margin_x and y0 > ry0 + margin_y and x1 < rx1 - margin_x and y1 < ry1 - margin_y:
+                return self.roi
+
+        # Pad (by the box's longer side in pixels), then enforce a minimum
+        # size so a distant person is not over-zoomed
+        pad = Config.ROI_PADDING * max((x1 - x0) * width, (y1 - y0) * height)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        half_w = max(x1 - x0 + 2 * pad / width, Config.ROI_MIN_SIZE) / 2
+        half_h = max(y1 - y0 + 2 * pad / height, Config.ROI_MIN_SIZE) / 2
+        roi = (max(0.0, float(cx - half_w)), max(0.0, float(cy - half_h)),
+               min(1.0, float(cx + half_w)), min(1.0, float(cy + half_h)))
+
+        if (roi[2] - roi[0]) * (roi[3] - roi[1]) >= Config.ROI_MAX_AREA:
+            return None  # Not worth cropping
+        return roi
+
+    @telemetry.timed("pose_inference_seconds", "Pose landmarker time per inferred frame")
+    def find_poses(self, frame, timestamp_ms, color=capture.BGR):
+        # Returns an (N, 33, 5) array, one landmark frame per detected person.
+        # color: layout of `frame` as delivered by the capture source
+        height, width = capture.frame_size(frame, color)
+        if color == capture.YUV:
+            # Planar I420 can't be cropped in place; one conversion to RGB
+            frame, color = capture.to_rgb(frame, color), capture.RGB
+
+        roi = None
+        if self.roi_enabled and self.roi is not None:
+            self.frames_since_full += 1
+            # Periodic full-frame pass so new people entering the room are found
+            if self.frames_since_full < Config.ROI_FULL_FRAME_INTERVAL:
+                roi = self.roi
+        if roi is None:
+            self.frames_since_full = 0
+            image = frame
+        else:
+            # Pixels of this frame, whatever size the ROI was found at
+            x0, y0 = int(roi[0] * width), int(roi[1] * height)
+            x1, y1 = max(x0 + 1, int(roi[2] * width)), max(y0 + 1, int(roi[3] * height))
+            image = frame[y0:y1, x0:x1]
+
+        # Convert to RGB (only the crop is converted; RGB input is used as-is)
+        rgb = capture.to_rgb(image, color)
         
         # Detect
+        poses = lmk.empty_frame((0,))
         try:
-            result = self.landmarker.detect_for_video(mp_image, int(timestamp_ms))
-            if result.pose_landmarks:
-                # Return the landmarks for the first detected person
-                return result.pose_landmarks[0]
+            poses = self.backend.detect(rgb, timestamp_ms)
+            self.errors = 0
         except Exception as e:
-            print(f"Error in detection: {e}")
+            self.errors += 1
+            if self.errors == 1:
+                print(f"Error in detection: {e}")  # Once per run of failures, not per frame
+            telemetry.counter("inference_errors_total", "Pose landmarker failures").inc()
+            if self.errors >= Config.BACKEND_RESET_ERRORS:
+                print(f"{self.errors} detection failures in a row, recreating the pose backend.")
+                self.reset_backend()
+
+        if roi is not None and len(poses):
+            # Remap crop-normalized coordinates back to the full frame
+            crop_w, crop_h = x1 - x0, y1 - y0
+            poses[..., lmk.X] = (poses[..., lmk.X] * crop_w + x0) / width
+            poses[..., lmk.Y] = (poses[..., lmk.Y] * crop_h + y0) / height
+            poses[..., lmk.Z] *= crop_w / width  # z uses the same scale as x
+
+        if self.roi_enabled:
+            self.roi = self._next_roi(poses, width, height)
             
+        return poses
+
+    def find_pose(self, frame, timestamp_ms, color=capture.BGR):
+        # Return the landmarks for the first detected person as a (33, 5) frame
+        poses = self.find_poses(frame, timestamp_ms, color)
+        if len(poses):
+            return poses[0]
         return None
 
-from collections import deque
-import copy
+SMOOTHING_MODES = ("window", "ema", "one_euro")
 
 class LandmarkSmoother:
-    def __init__(self, window_size=5):
-        self.window_size = window_size
-        self.history = deque(maxlen=window_size)
+    # Smooths x, y, z of all 33 landmarks at once.
+    #   window:   boxcar average over a preallocated (window, 33, 5) float32 ring
+    #             buffer with a running sum (one add + one subtract per frame)
+    #   ema:      exponential moving average (no window lag, one multiply-add)
+    #   one_euro: One-Euro filter, speed-adaptive cutoff (low jitter at rest,
+    #             low lag during fast motion such as a fall)
+    # smooth() returns a (33, 3) view into an internal buffer that is
+    # overwritten on the next call; `frame` holds the full (33, 5) result
+    # with visibility/presence taken from the latest frame.
+    RESYNC_INTERVAL = 1024  # Frames between exact sum recomputes (bounds float drift)
 
-    def smooth(self, landmarks):
-        # landmarks: list of NormalizedLandmark
-        # We need to average x, y, z for each of the 33 landmarks over the window
-        
-        # Store current frame
-        current_data = [(lm.x, lm.y, lm.z, lm.visibility, lm.presence) for lm in landmarks]
-        self.history.append(current_data)
-        
-        if len(self.history) < 2:
-            return landmarks
-            
-        # Average
-        num_frames = len(self.history)
-        num_landmarks = len(landmarks)
-        smoothed = []
-        
-        for idx in range(num_landmarks):
-            avg_x = sum(frame[idx][0] for frame in self.history) / num_frames
-            avg_y = sum(frame[idx][1] for frame in self.history) / num_frames
-            avg_z = sum(frame[idx][2] for frame in self.history) / num_frames
-            # Keep visibility from latest frame
-            vis = self.history[-1][idx][3]
-            pres = self.history[-1][idx][4]
-            
-            # Create a simple object mimicking the landmark
-            # MediaPipe landmarks are read-only usually, so using a simple class or named tuple
-            smoothed.append(SimpleLandmark(avg_x, avg_y, avg_z, vis, pres))
-            
-        return smoothed
+    def __init__(self, window_size=5, mode=None, num_landmarks=lmk.NUM_LANDMARKS):
+        self.mode = mode or Config.SMOOTHING_MODE
+        if self.mode not in SMOOTHING_MODES:
+            raise ValueError(f"Unknown smoothing mode: {self.mode}")
+
+        self.window_size = max(1, int(window_size))
+        self.buffer = np.zeros((self.window_size, num_landmarks, lmk.NUM_FIELDS), dtype=lmk.DTYPE)
+        self.sum = np.zeros((num_landmarks, 3), dtype=np.float64)
+        self.frame = np.zeros((num_landmarks, lmk.NUM_FIELDS), dtype=lmk.DTYPE)
+        self.xyz = self.frame[:, lmk.XYZ]  # Zero-copy view handed to callers
+        self.count = 0
+
+        # EMA / One-Euro state
+        self.alpha = Config.SMOOTHING_EMA_ALPHA
+        self.min_cutoff = Config.ONE_EURO_MIN_CUTOFF
+        self.beta = Config.ONE_EURO_BETA
+        self.d_cutoff = Config.ONE_EURO_D_CUTOFF
+        self.deriv = np.zeros((num_landmarks, 3), dtype=lmk.DTYPE)
+        self.last_time = None
+
+    def reset(self):
+        self.sum[:] = 0
+        self.count = 0
+        self.deriv[:] = 0
+        self.last_time = None
+
+    def smooth(self, landmarks, timestamp=None):
+        # landmarks: (33, 5) landmark frame (or a list of landmark objects)
+        idx = self.count % self.window_size
+        slot = self.buffer[idx]
+        if self.count >= self.window_size:
+            self.sum -= slot[:, :3]
+        current = lmk.as_landmark_array(landmarks, out=slot)
+        if current is not slot:
+            slot[:] = current
+        self.sum += slot[:, :3]
+        self.count += 1
+
+        # Keep visibility from latest frame
+        self.frame[:, 3:] = slot[:, 3:]
+
+        if self.count == 1:
+            self.xyz[:] = slot[:, :3]
+            self.last_time = timestamp
+            return self.xyz
 
-class SimpleLandmark:
-    def __init__(self, x, y, z, visibility, presence):
-        self.x = x
-        self.y = y
-        self.z = z
-        self.visibility = visibility
-        self.presence = presence
+        if self.mode == "window":
+            if self.count % self.RESYNC_INTERVAL == 0 and self.count >= self.window_size:
+                self.sum[:] = self.buffer[:, :, :3].sum(axis=0, dtype=np.float64)
+            num_frames = min(self.count, self.window_size)
+            np.divide(self.sum, num_frames, out=self.xyz, casting="unsafe")
+        elif self.mode == "ema":
+            self.xyz += self.alpha * (slot[:, :3] - self.xyz)
+        else:
+            self._one_euro(slot[:, :3], timestamp)
+
+        return self.xyz
+
+    def _one_euro(self, x, timestamp):
+        if timestamp is None:
+            timestamp = time.time()
+        dt = timestamp - self.last_time if self.last_time is not None else 0.0
+        self.last_time = timestamp
+        if dt <= 0:
+            dt = 1.0 / Config.FPS
+
+        # Filtered derivative
+        d_alpha = 1.0 / (1.0 + 1.0 / (2 * math.pi * self.d_cutoff * dt))
+        self.deriv += d_alpha * ((x - self.xyz) / dt - self.deriv)
+
+        # Speed-adaptive cutoff per coordinate
+        cutoff = self.min_cutoff + self.beta * np.abs(self.deriv)
+        alpha = 1.0 / (1.0 + 1.0 / (2 * np.pi * cutoff * dt))
+        self.xyz += alpha * (x - self.xyz)
 
 class FallAnalyzer:
-    def __init__(self):
+    def __init__(self, settings=None):
+        # Thresholds (settings.AnalyzerSettings); replaced live by apply_settings()
+        self.settings = settings or AnalyzerSettings()
         self.last_head_y = None
-        self.last_time = time.time()
+        self.last_time = 0.0
+        # Torso vector of the last frame; the angle is derived only on request
+        self.dx = kinematics.MIN_DX
+        self.dy = 0.0
+        # Return the torso angle from analyze() (None otherwise). Headless
+        # runs and replays turn it off and call torso_angle() when needed.
+        self.report_angle = True
         
         # State
         self.state = "NORMAL" # NORMAL, POTENTIAL_FALL, FALL_DETECTED
         self.fall_start_time = 0
         self.lying_start_time = 0
+        self.event_id = 0 # Incremented on every confirmed fall
         
-        self.smoother = LandmarkSmoother(window_size=Config.SMOOTHING_WINDOW_SIZE)
+        self.smoother = LandmarkSmoother(window_size=Config.SMOOTHING_WINDOW_SIZE, mode=Config.SMOOTHING_MODE)
         
+    def is_tracking_fall(self):
+        # True while a fall is suspected or confirmed (used to keep full-rate inference)
+        return self.state != "NORMAL"
+
+    def apply_settings(self, settings):
+        # Called from the settings watcher; analyze() reads self.settings once
+        # per frame, so each frame sees either the old or the new thresholds
+        self.settings = settings
+
+    def torso_angle(self):
+        # Degrees, 0 = Horizontal, 90 = Vertical
+        return kinematics.torso_angle(self.dx, self.dy)
+
     def calculate_angle(self, a, b):
         # Calculate angle with respect to vertical axis
-        # a, b are landmarks with x, y
-        delta_x = b.x - a.x
-        delta_y = b.y - a.y
+        # a, b are landmark rows (x, y, ...)
+        delta_x = b[lmk.X] - a[lmk.X]
+        delta_y = b[lmk.Y] - a[lmk.Y]
         # In image coords, y increases downwards.
         # Vertical = (0, 1) vector
         
@@ -104,28 +279,25 @@ class FallAnalyzer:
         # Actually, let's just get inclination from Horizontal.
         return abs(degrees)
 
-    def analyze(self, raw_landmarks):
-        if not raw_landmarks:
+    @telemetry.timed("fall_analysis_seconds", "Smoothing + fall state machine time per frame", analyzer="single")
+    def analyze(self, raw_landmarks, timestamp=None):
+        # timestamp: seconds; defaults to the wall clock. Replays and tests
+        # inject recorded timestamps so scenarios run faster than real time.
+        if raw_landmarks is None or len(raw_landmarks) == 0:
             return "NORMAL"
             
+        current_time = timestamp if timestamp is not None else time.time()
+        settings = self.settings
+
         # 1. Smooth Landmarks
-        landmarks = self.smoother.smooth(raw_landmarks)
-        
-        current_time = time.time()
-        
-        # Key Landmarks
-        nose = landmarks[0]
-        l_shoulder = landmarks[11]
-        r_shoulder = landmarks[12]
-        l_hip = landmarks[23]
-        r_hip = landmarks[24]
-        l_ankle = landmarks[27]
-        r_ankle = landmarks[28]
+        self.smoother.smooth(raw_landmarks, current_time)
+        landmarks = self.smoother.frame  # (33, 5): smoothed x, y, z + latest visibility
         
-        # --- Metrics ---
+        # --- Metrics (one fused pass, see kinematics.py) ---
+        current_head_y, dx, dy, height = kinematics.frame_metrics(landmarks)
+        self.dx, self.dy = dx, dy
         
         # 1. Fall Velocity (Head Drop)
-        current_head_y = nose.y
         is_falling = False
         velocity = 0
         
@@ -135,35 +307,16 @@ class FallAnalyzer:
              
              if delta_time > 0:
                  velocity = delta_y / delta_time 
-                 if velocity > Config.DROP_VELOCITY_THRESHOLD:
+                 if velocity > settings.drop_velocity_threshold:
                      is_falling = True
         
         self.last_head_y = current_head_y
         self.last_time = current_time
 
-        # 2. Torso Angle (Shoulder Midpoint to Hip Midpoint)
-        mid_shoulder_x = (l_shoulder.x + r_shoulder.x) / 2
-        mid_shoulder_y = (l_shoulder.y + r_shoulder.y) / 2
-        mid_hip_x = (l_hip.x + r_hip.x) / 2
-        mid_hip_y = (l_hip.y + r_hip.y) / 2
-        
-        dy = mid_hip_y - mid_shoulder_y
-        dx = mid_hip_x - mid_shoulder_x
-        if dx == 0: dx = 0.00001
-        
-        angle_rad = math.atan(abs(dy / dx))
-        angle_deg = math.degrees(angle_rad) # 0 = Horizontal, 90 = Vertical logic above was atan2, here atan
-        
-        # If dy is large and dx is small -> Vertical (Angle close to 90)
-        # If dy is small -> Horizontal (Angle close to 0)
-        # Let's stick to: 0 = Horizontal, 90 = Vertical
-        
-        # 3. Lying Down Check (Angle < Threshold AND Height Compression)
-        height = max(lm.y for lm in landmarks) - min(lm.y for lm in landmarks)
-        
-        is_horizontal = False
-        if angle_deg < Config.FALL_ANGLE_THRESHOLD: # e.g. < 45 degrees
-            is_horizontal = True
+        # 2. Torso Angle (Shoulder Midpoint to Hip Midpoint), 0 = Horizontal, 90 = Vertical.
+        # Lying down: angle < threshold (e.g. < 45 degrees), compared in tangent space;
+        # height compression is checked by the state machine
+        is_horizontal = kinematics.is_horizontal(dx, dy, settings.fall_angle_tan)
 
         # --- State Machine ---
         status = "NORMAL"
@@ -171,7 +324,7 @@ class FallAnalyzer:
         if self.state == "NORMAL":
             if is_falling:
                 # Only potential if they aren't already on the floor
-                if height > 0.4: 
+                if height > settings.fall_min_height:
                     self.state = "POTENTIAL_FALL"
                     self.fall_start_time = current_time
                     # NOTE: We don't trigger solely on velocity if they are sitting.
@@ -187,22 +340,252 @@ class FallAnalyzer:
                     self.lying_start_time = current_time
                 
                 time_lying = current_time - self.lying_start_time
-                if time_lying > Config.LYING_DOWN_DURATION:
+                if time_lying > settings.lying_down_duration:
                     self.state = "FALL_DETECTED"
                     status = "FALL_DETECTED"
+                    self.event_id += 1
             else:
                  # Logic for "Sitting":
                  # If time passes, velocity was high, but angle is still VERTICAL (> 45)
                  # Then it was likely sitting or crouching.
-                 if time_since_fall > 1.5:
+                 if time_since_fall > settings.sitting_timeout:
                      self.state = "NORMAL"
                      self.lying_start_time = 0
         
         elif self.state == "FALL_DETECTED":
             status = "FALL_DETECTED"
             # Auto-reset if they stand up (Vertical + Height)
-            if not is_horizontal and height > 0.5:
+            if not is_horizontal and height > settings.stand_min_height:
                  self.state = "NORMAL"
                  self.lying_start_time = 0
                  
+        angle_deg = kinematics.torso_angle(dx, dy) if self.report_angle else None
         return status, landmarks, angle_deg, velocity
+
+# State codes used by the batched analyzers
+STATE_NORMAL = 0
+STATE_POTENTIAL_FALL = 1
+STATE_FALL_DETECTED = 2
+STATE_NAMES = ("NORMAL", "POTENTIAL_FALL", "FALL_DETECTED")
+
+# AnalyzerSettings values the batched state machine compares against; these
+# can be set per slot (BatchFallAnalyzer.set_slot_settings)
+SLOT_SETTINGS = ("drop_velocity_threshold", "fall_angle_tan", "lying_down_duration",
+                 "fall_min_height", "stand_min_height", "sitting_timeout")
+
+class BatchFallAnalyzer:
+    # FallAnalyzer for many independent subjects at once (tracks, sessions,
+    # clips). Each subject owns a slot in preallocated state arrays, and one
+    # analyze() call smooths, measures and steps the state machine for all
+    # given slots in a single vectorized pass. Decisions match FallAnalyzer
+    # with the default boxcar smoothing. Slots share one AnalyzerSettings
+    # unless set_slot_settings() gives them their own thresholds (sweeps).
+    def __init__(self, capacity=None, window_size=None, settings=None):
+        self.capacity = capacity or Config.MAX_TRACKS
+        self.settings = settings or AnalyzerSettings()  # Shared by all slots
+        self.slot_settings = None  # SLOT_SETTINGS name -> (capacity,) array, once set per slot
+        self.window_size = max(1, int(window_size or Config.SMOOTHING_WINDOW_SIZE))
+
+        # Smoothing ring buffers
+        self.buffer = lmk.empty_frame((self.capacity, self.window_size))
+        self.sum = np.zeros((self.capacity, lmk.NUM_LANDMARKS, 3), dtype=np.float64)
+        self.count = np.zeros(self.capacity, dtype=np.int64)
+        self.frames = lmk.empty_frame((self.capacity,))
+
+        # State machine
+        self.state = np.zeros(self.capacity, dtype=np.int8)
+        self.last_head_y = np.full(self.capacity, np.nan)
+        self.last_time = np.zeros(self.capacity)
+        self.fall_start_time = np.zeros(self.capacity)
+        self.lying_start_time = np.zeros(self.capacity)
+        # Fall event IDs: per slot (latest confirmed fall) and the last one issued
+        self.event_id = np.zeros(self.capacity, dtype=np.int64)
+        self.last_event_id = 0
+
+        # Fused metric kernel; torso vectors per slot for on-demand angles
+        self.kernel = kinematics.MetricKernel(self.capacity)
+        self.dx = np.full(self.capacity, kinematics.MIN_DX)
+        self.dy = np.zeros(self.capacity)
+        self.report_angle = True  # Angles (degrees) in analyze() results, else None
+
+    def apply_settings(self, settings):
+        # Back to one shared set for every slot
+        self.settings = settings
+        self.slot_settings = None
+
+    def set_slot_settings(self, slots, settings):
+        # settings: one AnalyzerSettings per slot; other slots keep the shared set
+        if self.slot_settings is None:
+            self.slot_settings = {name: np.full(self.capacity, getattr(self.settings, name))
+                                  for name in SLOT_SETTINGS}
+        for name, values in self.slot_settings.items():
+            values[slots] = [getattr(s, name) for s in settings]
+
+    def _thresholds(self, slots):
+        # Shared AnalyzerSettings, or the per-slot values (same attribute names)
+        if self.slot_settings is None:
+            return self.settings
+        return types.SimpleNamespace(**{name: values[slots] for name, values in self.slot_settings.items()})
+
+    def torso_angle(self, slots):
+        return kinematics.torso_angle(self.dx[slots], self.dy[slots])
+
+    def reset(self, slots):
+        self.sum[slots] = 0
+        self.count[slots] = 0
+        self.state[slots] = STATE_NORMAL
+        self.last_head_y[slots] = np.nan
+        self.fall_start_time[slots] = 0
+        self.lying_start_time[slots] = 0
+
+    def smooth(self, slots, raw):
+        # Boxcar smoothing step of analyze(); returns the smoothed (N, 33, 5)
+        idx = self.count[slots] % self.window_size
+        full = self.count[slots] >= self.window_size
+        old = self.buffer[slots, idx, :, :3]
+        self.sum[slots] -= np.where(full[:, None, None], old, 0)
+        self.buffer[slots, idx] = raw
+        self.sum[slots] += raw[:, :, :3]
+        self.count[slots] += 1
+
+        num_frames = np.minimum(self.count[slots], self.window_size)
+        frames = self.frames[slots]
+        frames[:, :, :3] = self.sum[slots] / num_frames[:, None, None]
+        frames[:, :, 3:] = raw[:, :, 3:]
+        self.frames[slots] = frames
+        return frames
+
+    def analyze(self, slots, raw_frames, timestamps=None):
+        # slots: (N,) slot indices (unique), raw_frames: (N, 33, 5)
+        # Returns (state codes, smoothed frames, torso angles, head velocities)
+        slots = np.asarray(slots, dtype=np.int64)
+        return self.step(slots, self.smooth(slots, raw_frames), timestamps)
+
+    def step(self, slots, landmarks, timestamps=None):
+        # analyze() on frames that are already smoothed, e.g. one smoothed
+        # stream shared by many threshold sets (sweep.py)
+        slots = np.asarray(slots, dtype=np.int64)
+        if timestamps is None:
+            timestamps = time.time()
+        now = np.broadcast_to(np.asarray(timestamps, dtype=np.float64), slots.shape)
+        settings = self._thresholds(slots)
+
+        # Metrics for all slots in one fused pass (see kinematics.py)
+        head_y, dx, dy, height, is_horizontal = self.kernel.compute(landmarks, settings.fall_angle_tan)
+        self.dx[slots] = dx
+        self.dy[slots] = dy
+
+        # 1. Fall Velocity (Head Drop)
+        last_y = self.last_head_y[slots]
+        delta_time = now - self.last_time[slots]
+        valid = ~np.isnan(last_y) & (delta_time > 0)
+        velocity = np.where(valid, (head_y - np.nan_to_num(last_y)) / np.where(valid, delta_time, 1.0), 0.0)
+        is_falling = velocity > settings.drop_velocity_threshold
+        self.last_head_y[slots] = head_y
+        self.last_time[slots] = now
+
+        # --- State Machine ---
+        prev = self.state[slots]
+        state = prev.copy()
+        fall_start = self.fall_start_time[slots]
+        lying_start = self.lying_start_time[slots]
+
+        # NORMAL -> POTENTIAL_FALL on a fast head drop while still tall
+        start_fall = (prev == STATE_NORMAL) & is_falling & (height > settings.fall_min_height)
+        state[start_fall] = STATE_POTENTIAL_FALL
+        fall_start[start_fall] = now[start_fall]
+
+        # POTENTIAL_FALL -> FALL_DETECTED after lying long enough,
+        # back to NORMAL if still vertical sitting_timeout after the drop (sitting)
+        potential = prev == STATE_POTENTIAL_FALL
+        lying = potential & is_horizontal
+        lying_start[lying & (lying_start == 0)] = now[lying & (lying_start == 0)]
+        confirmed = lying & (now - lying_start > settings.lying_down_duration)
+        state[confirmed] = STATE_FALL_DETECTED
+        new_events = int(confirmed.sum())
+        if new_events:
+            self.event_id[slots[confirmed]] = self.last_event_id + np.arange(1, new_events + 1)
+            self.last_event_id += new_events
+        sitting = potential & ~is_horizontal & (now - fall_start > settings.sitting_timeout)
+        state[sitting] = STATE_NORMAL
+        lying_start[sitting] = 0
+
+        # FALL_DETECTED -> NORMAL once they stand up (Vertical + Height)
+        stood_up = (prev == STATE_FALL_DETECTED) & ~is_horizontal & (height > settings.stand_min_height)
+        state[stood_up] = STATE_NORMAL
+        lying_start[stood_up] = 0
+
+        self.state[slots] = state
+        self.fall_start_time[slots] = fall_start
+        self.lying_start_time[slots] = lying_start
+
+        status = np.where((prev == STATE_FALL_DETECTED) | confirmed, STATE_FALL_DETECTED, STATE_NORMAL)
+        angle_deg = kinematics.torso_angle(dx, dy) if self.report_angle else None
+        return status.astype(np.int8), landmarks, angle_deg, velocity
+
+ANALYZER_ENGINES = ("heuristic", "classifier")
+
+def create_analyzer(engine=None, max_poses=None, settings=None):
+    # Analyzer for one camera. The classifier engine follows one person
+    # (the first pose); multi-person rooms use the heuristic tracker.
+    # Every analyzer takes live threshold updates via apply_settings().
+    engine = engine or Config.ANALYZER_ENGINE
+    if engine not in ANALYZER_ENGINES:
+        raise ValueError(f"Unknown analyzer engine: {engine} (known: {', '.join(ANALYZER_ENGINES)})")
+    if engine == "classifier":
+        from classifier import ClassifierAnalyzer
+        return ClassifierAnalyzer(settings=settings)
+    if (max_poses or Config.MAX_POSES) > 1:
+        return MultiPersonFallAnalyzer(settings=settings)
+    return FallAnalyzer(settings)
+
+class MultiPersonFallAnalyzer:
+    # Drop-in replacement for FallAnalyzer when several residents share a room:
+    # associates poses to tracks, then analyzes every track in one batch.
+    def __init__(self, max_tracks=None, settings=None):
+        self.tracker = PoseTracker(max_tracks)
+        self.batch = BatchFallAnalyzer(capacity=self.tracker.max_tracks, settings=settings)
+        self.batch.report_angle = False  # Angles are derived below, only if wanted
+        self.report_angle = True
+        self.worst_slot = -1  # Slot of the most severe track in the last frame
+        # Per-track results of the last call: ids, state codes, angles, velocities
+        self.last_results = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0), np.zeros(0))
+        self.event_id = 0  # Fall event of the most severe track
+        self.fall_start_time = 0  # Start of that event's POTENTIAL_FALL phase
+
+    def is_tracking_fall(self):
+        return bool((self.batch.state != STATE_NORMAL).any())
+
+    def apply_settings(self, settings):
+        self.batch.apply_settings(settings)
+
+    def torso_angle(self):
+        # Angle of the most severe track of the last frame
+        return None if self.worst_slot < 0 else float(self.batch.torso_angle(self.worst_slot))
+
+    @telemetry.timed("fall_analysis_seconds", "Smoothing + fall state machine time per frame", analyzer="multi")
+    def analyze(self, poses, timestamp=None):
+        # poses: (N, 33, 5). Returns the FallAnalyzer tuple for the most
+        # severe track, with the smoothed (M, 33, 5) frames of all tracks.
+        slots, released = self.tracker.update(poses)
+        if len(released):
+            self.batch.reset(released)
+
+        tracked = slots >= 0
+        if not tracked.any():
+            self.last_results = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0), np.zeros(0))
+            self.worst_slot = -1
+            return "NORMAL", None, 0, 0
+
+        slots = slots[tracked]
+        codes, frames, _, velocities = self.batch.analyze(slots, poses[tracked], timestamp)
+        angles = self.batch.torso_angle(slots) if self.report_angle else None
+        self.last_results = (self.tracker.track_ids[slots], codes, angles, velocities)
+
+        worst = int(np.argmax(codes))
+        self.worst_slot = int(slots[worst])
+        if codes[worst] == STATE_FALL_DETECTED:
+            self.event_id = int(self.batch.event_id[slots[worst]])
+            self.fall_start_time = float(self.batch.fall_start_time[slots[worst]])
+        angle = float(angles[worst]) if angles is not None else None
+        return STATE_NAMES[codes[worst]], frames, angle, float(velocities[worst])
@@ -1,10 +1,23 @@
+import os
+import sys
 import requests
+from backends import TIERS, MODEL_URL, model_path
 
-url = "https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_lite/float16/1/pose_landmarker_lite.task"
-output = "pose_landmarker_lite.task"
+# Usage: python download_model.py [lite] [full] [heavy]
+tiers = sys.argv[1:] or ["lite"]
 
-print(f"Downloading {output} from {url}...")
-response = requests.get(url)
-with open(output, 'wb') as f:
-    f.write(response.content)
-print("Download complete.")
+for tier in tiers:
+    if tier not in TIERS:
+        print(f"Unknown tier '{tier}'. Choose from: {', '.join(TIERS)}")
+        continue
+
+    url = MODEL_URL.format(tier=tier)
+    output = model_path(tier)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+    print(f"Downloading {output} from {url}...")
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    with open(output, 'wb') as f:
+        f.write(response.content)
+    print("Download complete.")
@@ -0,0 +1,350 @@
+import argparse
+import datetime
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from config import Config
+import landmarks as lmk
+import telemetry
+
+logger = logging.getLogger("EventStore")
+
+# Local, queryable event history (SQLite in WAL mode):
+#   transitions  status changes per camera (NORMAL <-> FALL_DETECTED, ...)
+#   alerts       alert lifecycle per channel (raised, retry, delivered, failed)
+#   summaries    per-camera landmark summaries every EVENTS_SUMMARY_INTERVAL
+# All tables are indexed on (camera, ts). Writes go through a bounded queue
+# to one writer thread that commits them in groups, so recording an event is
+# a put_nowait() on the caller's side. Several processes (supervisor
+# workers) can share one database file.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transitions (
+    camera TEXT NOT NULL, ts REAL NOT NULL, status TEXT NOT NULL, previous TEXT,
+    event_id INTEGER, velocity REAL, angle REAL);
+CREATE INDEX IF NOT EXISTS transitions_camera_ts ON transitions (camera, ts);
+CREATE INDEX IF NOT EXISTS transitions_ts ON transitions (ts);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    camera TEXT NOT NULL, ts REAL NOT NULL, alert_id TEXT, event TEXT, channel TEXT,
+    outcome TEXT NOT NULL, latency REAL);
+CREATE INDEX IF NOT EXISTS alerts_camera_ts ON alerts (camera, ts);
+CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts);
+CREATE INDEX IF NOT EXISTS alerts_alert_id ON alerts (alert_id);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    camera TEXT NOT NULL, ts REAL NOT NULL, duration REAL NOT NULL, frames INTEGER NOT NULL,
+    present INTEGER NOT NULL, fall_frames INTEGER NOT NULL, max_velocity REAL,
+    mean_height REAL, mean_visibility REAL);
+CREATE INDEX IF NOT EXISTS summaries_camera_ts ON summaries (camera, ts);
+CREATE INDEX IF NOT EXISTS summaries_ts ON summaries (ts);
+"""
+
+INSERTS = {
+    "transitions": "INSERT INTO transitions VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "alerts": "INSERT INTO alerts VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "summaries": "INSERT INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+}
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; a power cut loses at most the last commits
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class CameraLog:
+    # Per-camera front end: update() is called with every analyzed frame,
+    # records status transitions and accumulates the landmark summary.
+    # Frame counts are per frame; pose statistics are sampled once per
+    # second, which keeps update() at a few attribute increments.
+    SAMPLE_INTERVAL = 1.0
+    def __init__(self, store, camera, interval=None):
+        self.store = store
+        self.camera = camera
+        self.interval = interval or Config.EVENTS_SUMMARY_INTERVAL
+        self.status = "NORMAL"
+        self._reset(None)
+
+    def _reset(self, timestamp):
+        self.start = timestamp
+        self.frames = 0
+        self.present = 0
+        self.fall_frames = 0
+        self.max_velocity = 0.0
+        self.samples = 0
+        self.next_sample = timestamp if timestamp is not None else 0.0
+        self.height_sum = 0.0
+        self.visibility_sum = 0.0
+
+    def update(self, timestamp, status, landmarks=None, velocity=0.0, angle=None, event_id=0):
+        if status != self.status:
+            self.store.transition(self.camera, timestamp, status, self.status, event_id, velocity, angle)
+            self.status = status
+
+        if self.start is None:
+            self.start = timestamp
+        self.frames += 1
+        if status == "FALL_DETECTED":
+            self.fall_frames += 1
+        if landmarks is not None:
+            self.present += 1
+            if velocity > self.max_velocity or -velocity > self.max_velocity:
+                self.max_velocity = abs(float(velocity))
+            if timestamp >= self.next_sample:
+                frame = landmarks if landmarks.ndim == 2 else landmarks[0]  # Multi-person: first track
+                ys = frame[:, lmk.Y]
+                self.samples += 1
+                self.height_sum += float(ys.max() - ys.min())
+                self.visibility_sum += float(frame[:, lmk.VISIBILITY].mean())
+                self.next_sample = timestamp + self.SAMPLE_INTERVAL
+        if timestamp - self.start >= self.interval:
+            self.flush(timestamp)
+
+    def flush(self, timestamp=None):
+        if not self.frames:
+            return
+        timestamp = timestamp if timestamp is not None else time.time()
+        samples = max(self.samples, 1)
+        self.store.put("summaries", (self.camera, self.start, timestamp - self.start, self.frames, self.present,
+                                     self.fall_frames, self.max_velocity, self.height_sum / samples,
+                                     self.visibility_sum / samples))
+        self._reset(timestamp)
+
+
+class EventHistory:
+    # Read side: every query opens its own connection, so readers (CLI,
+    # dashboards) never wait on the writer (WAL)
+    def __init__(self, path=None):
+        self.path = path or Config.EVENTS_DB
+
+    def _query(self, sql, params=()):
+        conn = connect(self.path)
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _where(camera, start, end, table=""):
+        prefix = f"{table}." if table else ""
+        clauses, params = [], []
+        if camera is not None:
+            clauses.append(f"{prefix}camera = ?")
+            params.append(camera)
+        if start is not None:
+            clauses.append(f"{prefix}ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{prefix}ts < ?")
+            params.append(end)
+        return clauses, params
+
+    def timeline(self, camera=None, start=None, end=None, limit=None):
+        # Transitions and alert outcomes in time order
+        clauses, params = self._where(camera, start, end)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        sql = (f"SELECT 'status' AS kind, camera, ts, status AS detail, previous AS extra, event_id AS ref "
+               f"FROM transitions{where} UNION ALL "
+               f"SELECT 'alert' AS kind, camera, ts, outcome AS detail, channel AS extra, alert_id AS ref "
+               f"FROM alerts{where} ORDER BY ts")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql, params + params)
+
+    def incidents(self, camera=None, start=None, end=None):
+        # One row per confirmed fall: when it started, how long it lasted
+        # (until the next transition of that camera) and what its alerts did
+        # The window function only scans the (camera, ts) index range asked for
+        clauses, params = self._where(camera, start, None)
+        spans_where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        where, end_params = ("", []) if end is None else (" AND t.ts < ?", [end])
+        return self._query(
+            f"""WITH spans AS (
+                    SELECT camera, ts, status, event_id,
+                           LEAD(ts) OVER (PARTITION BY camera ORDER BY ts) AS end_ts
+                    FROM transitions{spans_where}),
+                raised AS (
+                    SELECT t.camera, t.ts, a.alert_id FROM spans t JOIN alerts a
+                    ON a.camera = t.camera AND a.outcome = 'raised'
+                       AND a.ts >= t.ts AND a.ts < COALESCE(t.end_ts, 1e18)
+                    WHERE t.status = 'FALL_DETECTED'{where})
+                SELECT t.camera, t.ts AS start, t.end_ts AS end, t.end_ts - t.ts AS duration, t.event_id,
+                       (SELECT COUNT(*) FROM raised r WHERE r.camera = t.camera AND r.ts = t.ts) AS alerts,
+                       (SELECT COUNT(*) FROM alerts d JOIN raised r ON d.alert_id = r.alert_id
+                        WHERE r.camera = t.camera AND r.ts = t.ts AND d.outcome = 'delivered') AS delivered,
+                       (SELECT MIN(d.latency) FROM alerts d JOIN raised r ON d.alert_id = r.alert_id
+                        WHERE r.camera = t.camera AND r.ts = t.ts AND d.outcome = 'delivered') AS first_delivery_latency
+                FROM spans t WHERE t.status = 'FALL_DETECTED'{where}
+                ORDER BY t.ts""", params + end_params + end_params)
+
+    def room_stats(self, start=None, end=None):
+        # Per camera: falls, alert outcomes, monitored time, presence, activity
+        clauses, params = self._where(None, start, end)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        stats = {}
+        for row in self._query(f"SELECT camera, SUM(status = 'FALL_DETECTED') AS falls, COUNT(*) AS transitions "
+                               f"FROM transitions{where} GROUP BY camera", params):
+            stats.setdefault(row["camera"], {}).update(row)
+        for row in self._query(f"SELECT camera, SUM(outcome = 'raised') AS alerts, "
+                               f"SUM(outcome = 'delivered') AS delivered, SUM(outcome = 'failed') AS failed, "
+                               f"AVG(latency) AS mean_delivery_latency FROM alerts{where} GROUP BY camera", params):
+            stats.setdefault(row["camera"], {}).update(row)
+        for row in self._query(f"SELECT camera, SUM(duration) AS monitored_seconds, SUM(frames) AS frames, "
+                               f"1.0 * SUM(present) / MAX(SUM(frames), 1) AS presence, "
+                               f"1.0 * SUM(fall_frames) / MAX(SUM(frames), 1) AS fall_fraction, "
+                               f"MAX(max_velocity) AS max_velocity, "
+                               f"SUM(mean_height * present) / MAX(SUM(present), 1) AS mean_height "
+                               f"FROM summaries{where} GROUP BY camera", params):
+            stats.setdefault(row["camera"], {}).update(row)
+        return stats
+
+
+class EventStore(EventHistory):
+    def __init__(self, path=None, commit_interval=None, batch_size=None, queue_size=None):
+        super().__init__(path)
+        self.commit_interval = commit_interval or Config.EVENTS_COMMIT_INTERVAL
+        self.batch_size = batch_size or Config.EVENTS_BATCH_SIZE
+        self.queue = queue.Queue(maxsize=queue_size or Config.EVENTS_QUEUE_SIZE)
+        self.dropped = telemetry.counter("events_dropped_total", "Event store rows dropped on a full queue")
+        self.cameras = []
+
+        conn = connect(self.path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self.thread = threading.Thread(target=self._write, name="event-store", daemon=True)
+        self.thread.start()
+
+    # --- Recording (any thread, never blocks) ---
+
+    def put(self, table, row):
+        try:
+            self.queue.put_nowait((table, row))
+        except queue.Full:
+            self.dropped.inc()
+
+    def camera(self, name, flush_on_close=True):
+        # flush_on_close=False: the caller flushes the log itself (short-lived
+        # logs, which would otherwise pile up here)
+        log = CameraLog(self, name)
+        if flush_on_close:
+            self.cameras.append(log)
+        return log
+
+    def transition(self, camera, timestamp, status, previous=None, event_id=0, velocity=0.0, angle=None):
+        self.put("transitions", (camera, timestamp, status, previous, int(event_id),
+                                 float(velocity), None if angle is None else float(angle)))
+
+    def alert(self, alert, channel, outcome):
+        created = alert.get("created")
+        now = time.time()
+        latency = now - created if created is not None and outcome == "delivered" else None
+        timestamp = created if outcome == "raised" and created is not None else now
+        self.put("alerts", (alert.get("camera") or alert.get("location", ""), timestamp,
+                            alert.get("id"), alert.get("event"), channel, outcome, latency))
+
+    # --- Writer ---
+
+    def _take_batch(self):
+        # Blocks for the first row, then gathers more for up to commit_interval
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.commit_interval
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self):
+        conn = connect(self.path)
+        commits = telemetry.histogram("events_commit_seconds", "Event store group commit time")
+        while True:
+            batch = self._take_batch()
+            closing = batch[-1] is None
+            rows = {}
+            for item in batch:
+                if item is not None:
+                    rows.setdefault(item[0], []).append(item[1])
+            if rows:
+                start = time.perf_counter()
+                try:
+                    with conn:
+                        for table, values in rows.items():
+                            conn.executemany(INSERTS[table], values)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to write {sum(map(len, rows.values()))} events to {self.path}: {e}")
+                commits.record(time.perf_counter() - start)
+            if closing:
+                break
+        conn.close()
+
+    def close(self):
+        for log in self.cameras:
+            log.flush()
+        self.queue.put(None)  # Blocks if full: everything queued gets written
+        self.thread.join()
+
+
+def parse_time(text, now=None):
+    # "7d", "12h", "30m" (ago), an ISO date/time, or epoch seconds
+    if text is None:
+        return None
+    now = now if now is not None else time.time()
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    if text[-1:] in units and text[:-1].replace(".", "", 1).isdigit():
+        return now - float(text[:-1]) * units[text[-1]]
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def _format_time(ts):
+    return datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local event history.")
+    parser.add_argument("command", choices=("timeline", "incidents", "stats"))
+    parser.add_argument("--db", default=Config.EVENTS_DB or "events.db")
+    parser.add_argument("--camera", help="e.g. camera0")
+    parser.add_argument("--since", help="7d, 12h, ISO date/time or epoch seconds")
+    parser.add_argument("--until")
+    parser.add_argument("--limit", type=int, default=200, help="Timeline rows")
+    args = parser.parse_args()
+
+    history = EventHistory(args.db)
+    start, end = parse_time(args.since), parse_time(args.until)
+    query_start = time.perf_counter()
+
+    if args.command == "timeline":
+        rows = history.timeline(args.camera, start, end, args.limit)
+        for r in rows:
+            print(f"{_format_time(r['ts'])}  {r['camera']:<12} {r['kind']:<7} {r['detail']:<15} {r['extra'] or ''}")
+    elif args.command == "incidents":
+        rows = history.incidents(args.camera, start, end)
+        print(f"{'start':<20} {'camera':<12} {'duration':>9} {'alerts':>6} {'delivered':>9} {'latency':>8}")
+        for r in rows:
+            duration = f"{r['duration']:.0f}s" if r["duration"] is not None else "ongoing"
+            latency = f"{r['first_delivery_latency']:.1f}s" if r["first_delivery_latency"] is not None else "-"
+            print(f"{_format_time(r['start']):<20} {r['camera']:<12} {duration:>9} {r['alerts']:>6} "
+                  f"{r['delivered']:>9} {latency:>8}")
+    else:
+        rows = history.room_stats(start, end)
+        print(f"{'camera':<12} {'falls':>5} {'alerts':>6} {'failed':>6} {'hours':>7} {'presence':>8} {'in fall':>7}")
+        for camera, s in sorted(rows.items()):
+            print(f"{camera:<12} {s.get('falls') or 0:>5} {s.get('alerts') or 0:>6} {s.get('failed') or 0:>6} "
+                  f"{(s.get('monitored_seconds') or 0) / 3600:>7.1f} {s.get('presence') or 0:>8.0%} "
+                  f"{s.get('fall_fraction') or 0:>7.1%}")
+    print(f"\n{len(rows)} rows in {(time.perf_counter() - query_start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
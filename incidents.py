@@ -0,0 +1,193 @@
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+import cv2
+import numpy as np
+from config import Config
+import landmarks as lmk
+from recorder import save_recording, LABEL_FALL
+
+logger = logging.getLogger("Incidents")
+
+
+class RawLandmarks:
+    # Recorder-style tap (add(raw landmarks or None, timestamp), see
+    # main.detect_and_analyze): holds the detector's raw landmarks until the
+    # output stage hands over the analyzed frame with the same timestamp.
+    # Frames dropped between the stages (pipeline, load shedding) are skipped;
+    # take() returns MISSING for analyzed frames that were never recorded
+    # (interpolated by the InferenceScheduler).
+    MISSING = object()
+    multi_person = True  # Takes all (N, 33, 5) poses (incident clips pad to P people)
+
+    def __init__(self, size=32):
+        self.frames = deque(maxlen=size)
+
+    def add(self, landmarks, timestamp):
+        self.frames.append((timestamp, None if landmarks is None else np.array(landmarks, dtype=lmk.DTYPE)))
+
+    def take(self, timestamp):
+        while self.frames:
+            frame_time, landmarks = self.frames.popleft()
+            if frame_time == timestamp:
+                return landmarks
+            if frame_time > timestamp:
+                self.frames.appendleft((frame_time, landmarks))
+                break
+        return self.MISSING
+
+
+class IncidentWriter:
+    # One artifact set per fall event instead of one PNG per second:
+    #   incident_<camera>_<stamp>_<event>.npz   landmark sequence (replayable)
+    #   incident_<camera>_<stamp>_<event>.json  metadata
+    #   incident_<camera>_<stamp>_<event>.png   privacy frame at detection
+    #   incident_<camera>_<stamp>_<event>.mp4   privacy clip (INCIDENT_CLIP=1)
+    # The loop only appends to in-memory rings; once the post-event frames
+    # are in, the snapshot goes through a bounded queue to a writer thread.
+    # Writes are keyed by the analyzer's event ID, so a long fall is saved once.
+    # Saved landmarks are the raw detections (recorder format, so replay and
+    # training smooth them once): add self.raw to the detection recorders.
+    def __init__(self, directory=None, camera="camera", pre_frames=None, post_frames=None,
+                 save_clip=None, queue_size=None):
+        self.directory = directory or Config.ALERTS_DIR
+        self.camera = camera
+        self.pre_frames = pre_frames or Config.INCIDENT_PRE_FRAMES
+        self.post_frames = post_frames if post_frames is not None else Config.INCIDENT_POST_FRAMES
+        self.save_clip = Config.INCIDENT_CLIP if save_clip is None else save_clip
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Ring of (timestamp, status, raw landmarks or None)
+        self.history = deque(maxlen=self.pre_frames + self.post_frames)
+        self.raw = RawLandmarks()
+        # Ring of privacy frames, preallocated on first use (clip only)
+        self.clip = None
+        self.clip_index = 0
+        self.clip_count = 0
+
+        self.last_event_id = 0
+        self.pending = None  # Event waiting for its post-event frames
+        self.dropped = 0
+
+        self.queue = queue.Queue(maxsize=queue_size or Config.INCIDENT_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, name="incident-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, timestamp, status, event_id=0, privacy_frame=None, fall_start=None):
+        # Called once per frame from the output stage; O(1) + one frame copy.
+        # fall_start: the analyzer's fall_start_time (start of POTENTIAL_FALL);
+        # `timestamp` of the first FALL_DETECTED frame is only the confirmation
+        landmarks = self.raw.take(timestamp)
+        if landmarks is not RawLandmarks.MISSING:
+            # Only real detections go into the saved clip (timestamps say which)
+            self.history.append((timestamp, status, landmarks))
+        if self.save_clip and privacy_frame is not None:
+            self._add_clip_frame(privacy_frame)
+
+        if status == "FALL_DETECTED" and event_id and event_id != self.last_event_id:
+            self.last_event_id = event_id
+            if self.pending is not None:
+                # A new event cut the previous one's post-event window short;
+                # save it with what it has rather than losing it
+                self._submit(self.pending)
+            keyframe = privacy_frame.copy() if privacy_frame is not None else None
+            self.pending = {"event_id": event_id, "timestamp": timestamp, "keyframe": keyframe,
+                            "fall_start": fall_start or timestamp, "remaining": self.post_frames}
+        elif self.pending is not None:
+            self.pending["remaining"] -= 1
+
+        if self.pending is not None and self.pending["remaining"] <= 0:
+            self._submit(self.pending)
+            self.pending = None
+
+    def _add_clip_frame(self, frame):
+        size = self.pre_frames + self.post_frames
+        if self.clip is None or self.clip.shape[1:] != frame.shape:
+            self.clip = np.empty((size,) + frame.shape, dtype=frame.dtype)
+            self.clip_index = 0
+            self.clip_count = 0
+        np.copyto(self.clip[self.clip_index], frame)
+        self.clip_index = (self.clip_index + 1) % size
+        self.clip_count = min(self.clip_count + 1, size)
+
+    def _submit(self, event):
+        event["history"] = list(self.history)
+        if self.save_clip and self.clip is not None:
+            # Oldest-first copy of the ring; the live ring keeps being overwritten
+            order = (np.arange(self.clip_count) + self.clip_index - self.clip_count) % len(self.clip)
+            event["clip"] = self.clip[order]
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Incident writer queue full, dropped event {event['event_id']}")
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+            try:
+                self._write(event)
+            except Exception as e:
+                logger.error(f"Failed to write incident {event['event_id']}: {e}")
+
+    def _write(self, event):
+        stamp = datetime.datetime.fromtimestamp(event["timestamp"]).strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(self.directory, f"incident_{self.camera}_{stamp}_{event['event_id']}")
+
+        history = event["history"]
+        timestamps = np.array([h[0] for h in history], dtype=np.float64)
+        present = np.array([h[2] is not None for h in history], dtype=bool)
+        # Pad multi-person frames to (T, P, 33, 5); single person stays (T, 33, 5)
+        people = max([1] + [len(h[2]) for h in history if h[2] is not None and h[2].ndim == 3])
+        frames = lmk.empty_frame((len(history), people))
+        for i, (_, _, landmarks) in enumerate(history):
+            if landmarks is not None:
+                landmarks = landmarks.reshape(-1, lmk.NUM_LANDMARKS, lmk.NUM_FIELDS)
+                frames[i, :len(landmarks)] = landmarks
+        if people == 1:
+            frames = frames[:, 0]
+
+        save_recording(base + ".npz", frames, timestamps, present, label=LABEL_FALL,
+                       camera=self.camera, event_id=event["event_id"], fall_time=event["fall_start"])
+
+        files = [base + ".npz"]
+        if event["keyframe"] is not None:
+            cv2.imwrite(base + ".png", event["keyframe"])
+            files.append(base + ".png")
+        clip = event.get("clip")
+        if clip is not None and len(clip):
+            height, width = clip.shape[1:3]
+            writer = cv2.VideoWriter(base + ".mp4", cv2.VideoWriter_fourcc(*"mp4v"), Config.FPS, (width, height))
+            for frame in clip:
+                writer.write(frame)
+            writer.release()
+            files.append(base + ".mp4")
+
+        meta = {
+            "event_id": event["event_id"],
+            "camera": self.camera,
+            "fell_at": datetime.datetime.fromtimestamp(event["fall_start"]).isoformat(),
+            "detected_at": datetime.datetime.fromtimestamp(event["timestamp"]).isoformat(),
+            "start": float(timestamps[0]) if len(timestamps) else None,
+            "end": float(timestamps[-1]) if len(timestamps) else None,
+            "frames": len(history),
+            "statuses": sorted({h[1] for h in history}),
+            "files": [os.path.basename(f) for f in files],
+        }
+        with open(base + ".json", "w") as f:
+            json.dump(meta, f, indent=2)
+        logger.info(f"Saved incident {event['event_id']} ({len(history)} frames) to {base}.*")
+
+    def close(self):
+        # Flush an incident still waiting for post-event frames, then stop
+        if self.pending is not None:
+            self._submit(self.pending)
+            self.pending = None
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,497 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import re
+import struct
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+import numpy as np
+from config import Config
+import landmarks as lmk
+from detector import BatchFallAnalyzer, STATE_NAMES, STATE_FALL_DETECTED
+from server import ws_message, read_ws_message, WS_GUID
+import telemetry
+
+logger = logging.getLogger("Ingest")
+
+# Landmark ingest for thin clients: browsers and tablets run pose inference
+# only and send landmark batches here; this process smooths, analyzes and
+# alerts for every room with the tuned thresholds ("defaults" of
+# settings.json), through the same Notifier and event history as cameras.
+#   GET  /ingest?room=<name>               WebSocket, one session per connection:
+#                                          binary batches in, binary results out
+#   POST /ingest?room=<name>&session=<id>  One batch per request, result as the body
+#   GET  /sessions                         JSON list of sessions and their state
+# With INGEST_TOKEN set, clients add &token=<secret>.
+#
+# Batch message (little-endian): BATCH_HEADER (sequence u32, frames u16),
+# then one f64 timestamp (Unix seconds) per frame, one u8 people flag per
+# frame (0 = nobody in view), then lmk.pack() of the frames with a person.
+# Result message: RESULT (sequence u32, status u8, state u8, event id u32,
+# frames accepted u16). status is the most severe analyzer status over the
+# batch, state the session's state machine after it (codes: STATE_NAMES).
+#
+# Every session owns a slot of one shared BatchFallAnalyzer. Messages that
+# arrive within INGEST_BATCH_WINDOW of each other are analyzed together:
+# the k-th frame of every pending message goes through one vectorized pass.
+
+BATCH_HEADER = struct.Struct("<IH")
+RESULT = struct.Struct("<IBBIH")
+ROOM_PATTERN = re.compile(r"^[\w.-]{1,64}$")
+
+
+def encode_batch(sequence, timestamps, frames):
+    # frames: one (33, 5) array or None per timestamp (for Python edge clients and tests)
+    present = [frame is not None for frame in frames]
+    packed = lmk.pack(np.array([f for f in frames if f is not None], dtype=lmk.DTYPE).reshape(-1, lmk.NUM_LANDMARKS, lmk.NUM_FIELDS))
+    return (BATCH_HEADER.pack(sequence, len(frames)) + np.asarray(timestamps, dtype="<f8").tobytes()
+            + np.asarray(present, dtype=np.uint8).tobytes() + packed)
+
+
+def decode_batch(data):
+    # Returns (sequence, (N,) timestamps, (N,) present mask, (P, 33, 5) frames of the present ones)
+    if len(data) < BATCH_HEADER.size:
+        raise ValueError("truncated batch header")
+    sequence, count = BATCH_HEADER.unpack_from(data)
+    if count > Config.INGEST_MAX_BATCH_FRAMES:
+        raise ValueError(f"too many frames in one batch ({count} > {Config.INGEST_MAX_BATCH_FRAMES})")
+    offset = BATCH_HEADER.size
+    if len(data) < offset + count * 9:
+        raise ValueError("truncated batch")
+    timestamps = np.frombuffer(data, dtype="<f8", count=count, offset=offset).astype(np.float64)
+    present = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset + count * 8) != 0
+    people = int(present.sum())
+    offset += count * 9
+    if len(data) != offset + people * lmk.PACKED_SIZE:
+        raise ValueError(f"expected {people} packed frames, got {len(data) - offset} bytes")
+    return sequence, timestamps, present, lmk.unpack(memoryview(data)[offset:], people)
+
+
+class Session:
+    def __init__(self, session_id, room, slot, log=None, persistent=False):
+        self.id = session_id
+        self.room = room
+        self.slot = slot
+        self.log = log  # eventstore.CameraLog of the room, optional
+        self.persistent = persistent  # HTTP sessions outlive their requests (expired when idle)
+        self.last_timestamp = -np.inf
+        self.last_seen = time.monotonic()
+        self.frames = 0
+        self.status = 0  # Status code of the last logged frame
+
+
+class IngestEngine:
+    # Sessions, slot allocation and the batched analysis; no I/O. Used from
+    # one thread (the server's event loop).
+    def __init__(self, capacity=None, settings=None, notifier=None, events=None):
+        self.analyzer = BatchFallAnalyzer(capacity or Config.INGEST_MAX_SESSIONS, settings=settings)
+        self.analyzer.report_angle = False
+        self.free = list(range(self.analyzer.capacity - 1, -1, -1))
+        self.sessions = {}
+        self.notifier = notifier
+        self.events = events  # eventstore.EventStore, optional
+        # room -> its open sessions; they share one CameraLog, dropped (and
+        # flushed) with the room's last session
+        self.rooms = {}
+
+        self.accepted = telemetry.counter("ingest_frames_total", "Ingested landmark frames", result="accepted")
+        self.rejected = telemetry.counter("ingest_frames_total", "Ingested landmark frames", result="out_of_order")
+        self.pass_time = telemetry.histogram("ingest_pass_seconds", "Time per batched analyzer pass")
+        telemetry.callback("ingest_sessions", lambda: len(self.sessions), "gauge", "Connected ingest sessions")
+
+    def open(self, session_id, room, persistent=False):
+        # Returns the session, or None when every slot is taken
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_seen = time.monotonic()
+            return session
+        if not self.free:
+            return None
+        slot = self.free.pop()
+        self.analyzer.reset([slot])
+        self.analyzer.event_id[slot] = 0
+        peers = self.rooms.setdefault(room, [])
+        log = None
+        if self.events is not None:
+            log = peers[0].log if peers else self.events.camera(room, flush_on_close=False)
+        session = self.sessions[session_id] = Session(session_id, room, slot, log, persistent)
+        peers.append(session)
+        logger.info(f"Session {session_id} opened for {room} ({len(self.sessions)} active)")
+        return session
+
+    def close(self, session):
+        if self.sessions.pop(session.id, None) is None:
+            return
+        self.free.append(session.slot)
+        peers = self.rooms[session.room]
+        peers.remove(session)
+        if not peers:
+            del self.rooms[session.room]
+            if session.log is not None:
+                session.log.flush()
+        logger.info(f"Session {session.id} ({session.room}) closed after {session.frames} frames")
+
+    def close_all(self):
+        # Shutdown: ends every session, flushing the room logs
+        for session in list(self.sessions.values()):
+            self.close(session)
+
+    def expire(self, now=None):
+        now = now if now is not None else time.monotonic()
+        for session in list(self.sessions.values()):
+            if session.persistent and now - session.last_seen > Config.INGEST_SESSION_TIMEOUT:
+                self.close(session)
+
+    def process(self, batches):
+        # batches: [(session, timestamps, present, frames)] as from decode_batch;
+        # a session may appear more than once (its batches are taken in order).
+        # Returns [(status code, state code, event id, frames accepted)] per batch.
+        # Per-frame bookkeeping stays in plain Python lists; numpy only sees
+        # the gathered arrays, so a pass costs little more than the analyzer.
+        start = time.perf_counter()
+        now = time.monotonic()
+        offsets = {}
+        slots, times, rounds, rows = [], [], [], []
+        flags = []  # Per batch: [(timestamp, analyzed)] of accepted frames
+        base = 0
+        rejected = 0
+        for session, timestamps, present, frames in batches:
+            session.last_seen = now
+            slot = session.slot
+            k = offsets.get(slot, 0)
+            last = session.last_timestamp
+            row = base - 1
+            accepted = []
+            for timestamp, person in zip(timestamps.tolist(), present.tolist()):
+                row += person
+                # Frames must move forward in time per session (retransmits, clock steps)
+                if timestamp <= last:
+                    rejected += 1
+                    continue
+                last = timestamp
+                accepted.append((timestamp, person))
+                if person:
+                    slots.append(slot)
+                    times.append(timestamp)
+                    rounds.append(k)
+                    rows.append(row)
+                    k += 1
+            session.last_timestamp = last
+            offsets[slot] = k
+            flags.append(accepted)
+            base += len(frames)
+
+        count = len(slots)
+        status = np.zeros(count, dtype=np.int8)
+        velocity = np.zeros(count)
+        smoothed = lmk.empty_frame((count,))
+        if count:
+            slots = np.array(slots, dtype=np.int64)
+            times = np.array(times)
+            rounds = np.array(rounds, dtype=np.int64)
+            frames = np.concatenate([batch[3] for batch in batches])[rows]
+            # One analyzer pass per frame position: slots are unique within a pass
+            order = np.argsort(rounds, kind="stable")
+            bounds = np.searchsorted(rounds[order], np.arange(int(rounds.max()) + 2))
+            for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                index = order[lo:hi]
+                result = self.analyzer.analyze(slots[index], frames[index], times[index])
+                status[index], smoothed[index], velocity[index] = result[0], result[1], result[3]
+        codes = status.tolist()
+
+        results = []
+        position = 0
+        for (session, _, _, _), accepted in zip(batches, flags):
+            analyzed = sum(person for _, person in accepted)
+            worst = max(codes[position:position + analyzed], default=0)
+            event_id = int(self.analyzer.event_id[session.slot])
+            session.frames += len(accepted)
+            if worst == STATE_FALL_DETECTED and self.notifier is not None:
+                # The Notifier applies the alert cooldown per room
+                self.notifier.alert("FALL_DETECTED", location=session.room, camera=session.room)
+            if session.log is not None:
+                self._log(session, accepted, codes, smoothed, velocity, position, event_id,
+                          self._room_status(session))
+            position += analyzed
+            results.append((worst, int(self.analyzer.state[session.slot]), event_id, len(accepted)))
+
+        self.accepted.inc(sum(len(accepted) for accepted in flags))
+        if rejected:
+            self.rejected.inc(rejected)
+        self.pass_time.record(time.perf_counter() - start)
+        return results
+
+    def _room_status(self, session):
+        # Most severe status of the other sessions in the session's room: the
+        # room's log records the room's status, not whichever client posted last
+        return max((peer.status for peer in self.rooms[session.room] if peer is not session), default=0)
+
+    @staticmethod
+    def _log(session, accepted, codes, smoothed, velocity, position, event_id, room_status=0):
+        # Frames without a person are logged like main.py does (NORMAL, no landmarks)
+        for timestamp, person in accepted:
+            if person:
+                session.status = codes[position]
+                session.log.update(timestamp, STATE_NAMES[max(session.status, room_status)], smoothed[position],
+                                   float(velocity[position]), None, event_id)
+                position += 1
+            else:
+                session.status = 0
+                session.log.update(timestamp, STATE_NAMES[room_status], None, 0.0, None, event_id)
+
+
+class IngestServer:
+    # asyncio HTTP/WebSocket front end of an IngestEngine, on a background
+    # thread (same pattern as server.StreamServer). Requests from all
+    # connections are queued and handed to the engine in one batch per
+    # INGEST_BATCH_WINDOW, so analysis cost grows with frames, not with calls.
+    def __init__(self, engine, host=None, port=None, token=None):
+        self.engine = engine
+        self.host = host or Config.INGEST_HOST
+        self.port = port if port is not None else Config.INGEST_PORT
+        self.token = token if token is not None else Config.INGEST_TOKEN
+        self.max_message = BATCH_HEADER.size + Config.INGEST_MAX_BATCH_FRAMES * (9 + lmk.PACKED_SIZE)
+
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.pending = []
+        self.wakeup = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="ingest-server", daemon=True)
+        self.thread.start()
+        self.ready.wait(timeout=5.0)
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Ingesting on http://{self.host}:{self.port} (/ingest, /sessions)")
+        tasks = [self.loop.create_task(self._batch_loop()), self.loop.create_task(self._expire_loop())]
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    async def submit(self, session, data):
+        # Decoded batch -> RESULT bytes, once the next batched pass has run
+        sequence, timestamps, present, frames = decode_batch(data)
+        future = self.loop.create_future()
+        self.pending.append((session, timestamps, present, frames, future))
+        self.wakeup.set()
+        status, state, event_id, accepted = await future
+        return RESULT.pack(sequence, status, state, event_id, accepted)
+
+    async def _batch_loop(self):
+        while True:
+            await self.wakeup.wait()
+            if Config.INGEST_BATCH_WINDOW:
+                await asyncio.sleep(Config.INGEST_BATCH_WINDOW)  # Let other sessions' messages join
+            self.wakeup.clear()
+            pending, self.pending = self.pending, []
+            # A session closed while its message waited has no slot any more
+            closed = [item for item in pending if self.engine.sessions.get(item[0].id) is not item[0]]
+            for item in closed:
+                item[4].set_exception(ValueError("session closed"))
+            pending = [item for item in pending if item not in closed]
+            try:
+                results = self.engine.process([item[:4] for item in pending])
+            except Exception as e:
+                logger.error(f"Ingest pass failed: {e}")
+                for item in pending:
+                    item[4].set_exception(e)
+                continue
+            for item, result in zip(pending, results):
+                if not item[4].done():
+                    item[4].set_result(result)
+
+    async def _expire_loop(self):
+        while True:
+            await asyncio.sleep(min(Config.INGEST_SESSION_TIMEOUT, 5.0))
+            self.engine.expire()
+
+    def _authorized(self, query, headers):
+        if not self.token:
+            return True
+        supplied = query.get("token", [""])[0] or headers.get("authorization", "").removeprefix("Bearer ").strip()
+        return hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    @staticmethod
+    def _respond(writer, status, body=b"", content_type="application/octet-stream", keep_alive=True):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Access-Control-Allow-Origin: *\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+    async def _handle(self, reader, writer):
+        # HTTP/1.1 with keep-alive (a client posting every 100 ms reuses one connection)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), Config.INGEST_SESSION_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    return
+
+                lines = head.decode("latin-1").split("\r\n")
+                parts = lines[0].split()
+                method = parts[0] if parts else ""
+                target = parts[1] if len(parts) > 1 else "/"
+                path, _, query = target.partition("?")
+                query = parse_qs(query)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                if method == "OPTIONS":
+                    # CORS preflight for browser POSTs
+                    writer.write(b"HTTP/1.1 204 No Content\r\nAccess-Control-Allow-Origin: *\r\n"
+                                 b"Access-Control-Allow-Methods: POST, GET, OPTIONS\r\n"
+                                 b"Access-Control-Allow-Headers: Authorization, Content-Type\r\n"
+                                 b"Content-Length: 0\r\n\r\n")
+                elif not self._authorized(query, headers):
+                    # Every route but the preflight needs the token
+                    self._respond(writer, "403 Forbidden", keep_alive=False)
+                    keep_alive = False
+                elif path == "/sessions" and method == "GET":
+                    now = time.monotonic()
+                    body = json.dumps({"sessions": [
+                        {"id": s.id, "room": s.room, "state": STATE_NAMES[int(self.engine.analyzer.state[s.slot])],
+                         "frames": s.frames, "idle": round(now - s.last_seen, 1)}
+                        for s in self.engine.sessions.values()]}).encode()
+                    self._respond(writer, "200 OK", body, "application/json", keep_alive)
+                elif path != "/ingest":
+                    self._respond(writer, "404 Not Found", keep_alive=keep_alive)
+                elif not ROOM_PATTERN.match(query.get("room", [""])[0]):
+                    self._respond(writer, "400 Bad Request", b"room: 1-64 letters, digits, '.', '-' or '_'",
+                                  "text/plain", keep_alive)
+                elif method == "GET" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers, query["room"][0])
+                    return
+                elif method == "POST":
+                    await self._post(reader, writer, headers, query, keep_alive)
+                else:
+                    self._respond(writer, "405 Method Not Allowed", keep_alive=keep_alive)
+
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Server shutting down. Not re-raised: asyncio's stream callback
+            # would log every cancelled connection as an unhandled exception
+            pass
+        finally:
+            writer.close()
+
+    async def _post(self, reader, writer, headers, query, keep_alive):
+        length = int(headers.get("content-length", "0") or 0)
+        if not 0 < length <= self.max_message:
+            self._respond(writer, "413 Payload Too Large", keep_alive=False)
+            return
+        data = await reader.readexactly(length)
+        session_id = query.get("session", [""])[0]
+        if not session_id or len(session_id) > 64:
+            self._respond(writer, "400 Bad Request", b"session: 1-64 characters", "text/plain", keep_alive)
+            return
+        session = self.engine.open(session_id, query["room"][0], persistent=True)
+        if session is None:
+            self._respond(writer, "503 Service Unavailable", b"session limit reached", "text/plain", keep_alive)
+            return
+        try:
+            result = await self.submit(session, data)
+        except ValueError as e:
+            self._respond(writer, "400 Bad Request", str(e).encode(), "text/plain", keep_alive)
+            return
+        self._respond(writer, "200 OK", result, keep_alive=keep_alive)
+
+    async def _websocket(self, reader, writer, headers, room):
+        accept = base64.b64encode(hashlib.sha1((headers.get("sec-websocket-key", "") + WS_GUID).encode()).digest())
+        session = self.engine.open(uuid.uuid4().hex, room)
+        if session is None:
+            self._respond(writer, "503 Service Unavailable", b"session limit reached", "text/plain", False)
+            await writer.drain()
+            return
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        try:
+            while True:
+                opcode, data = await read_ws_message(reader, self.max_message)
+                if opcode == 0x8:
+                    writer.write(struct.pack("!BB", 0x88, 0))
+                    break
+                if opcode == 0x9:
+                    writer.write(struct.pack("!BB", 0x8A, len(data)) + data)
+                elif opcode == 0x2:
+                    writer.write(ws_message(await self.submit(session, data)))
+                await writer.drain()
+        except ValueError as e:
+            logger.warning(f"Session {session.id} ({room}): {e}")
+        finally:
+            self.engine.close(session)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5.0)
+        self.thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze landmark batches sent by thin clients (browsers, tablets).")
+    parser.add_argument("--host", default=Config.INGEST_HOST)
+    parser.add_argument("--port", type=int, default=Config.INGEST_PORT)
+    parser.add_argument("--sessions", type=int, default=Config.INGEST_MAX_SESSIONS, help="Max concurrent sessions")
+    args = parser.parse_args()
+
+    from notifier import Notifier
+    from eventstore import EventStore
+    from settings import SettingsStore
+    from telemetry import Telemetry
+
+    telemetry_service = Telemetry()
+    history = EventStore() if Config.EVENTS_DB else None
+    notifier = Notifier(history)
+    # Ingested rooms share one batched analyzer, so they use the "defaults" section
+    settings = SettingsStore()
+    engine = IngestEngine(args.sessions, settings.get(), notifier, history)
+    settings.subscribe(None, engine.analyzer.apply_settings)
+    settings.start()
+    server = IngestServer(engine, args.host, args.port).start()
+    try:
+        while server.thread.is_alive():
+            server.thread.join(timeout=1.0)
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        server.stop()
+        engine.close_all()
+        settings.close()
+        notifier.close()
+        if history is not None:
+            history.close()
+        telemetry_service.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,87 @@
+import math
+import numpy as np
+import landmarks as lmk
+
+# Fall metrics of a landmark frame in one fused pass: head height, torso
+# vector (shoulder midpoint -> hip midpoint) and body height. The "lying"
+# test is done in tangent space, so no per-frame trigonometry:
+#   atan(|dy / dx|) < threshold  <=>  |dy| < |dx| * tan(threshold)
+# The human-readable torso angle is only computed on request (torso_angle).
+
+MIN_DX = 0.00001  # Stand-in for a perfectly vertical torso (dx == 0)
+
+LS, RS = lmk.LEFT_SHOULDER, lmk.RIGHT_SHOULDER
+LH, RH = lmk.LEFT_HIP, lmk.RIGHT_HIP
+
+
+def torso_angle(dx, dy):
+    # Degrees from horizontal: 0 = lying flat, 90 = upright. Scalars or arrays.
+    if np.ndim(dx) == 0:
+        return math.degrees(math.atan(abs(dy / (dx or MIN_DX))))
+    return np.degrees(np.arctan(np.abs(dy / np.where(dx == 0, MIN_DX, dx))))
+
+
+def is_horizontal(dx, dy, tan_threshold):
+    # The lying test for one frame; MetricKernel.compute does the same per row
+    return abs(dy) < abs(dx) * tan_threshold
+
+
+def frame_metrics(frame):
+    # (head_y, dx, dy, height) of one (33, 5) frame as Python floats.
+    # One tolist() of the y column serves head, torso and height.
+    ys = frame[:, lmk.Y].tolist()
+    x = frame.item
+    dx = (x(LH, lmk.X) + x(RH, lmk.X) - x(LS, lmk.X) - x(RS, lmk.X)) * 0.5
+    dy = (ys[LH] + ys[RH] - ys[LS] - ys[RS]) * 0.5
+    return ys[lmk.NOSE], dx or MIN_DX, dy, max(ys) - min(ys)
+
+
+class MetricKernel:
+    # frame_metrics() for (N, 33, 5) frames at once (tracks, sessions, clips,
+    # or long offline runs in chunks). Results land in preallocated float64
+    # buffers, computed in the same order as frame_metrics() so batched and
+    # per-frame decisions agree bit for bit. Steady-state calls allocate no
+    # arrays; the returned views are valid until the next call.
+    def __init__(self, capacity=1):
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.head_y = np.empty(capacity)
+        self.dx = np.empty(capacity)
+        self.dy = np.empty(capacity)
+        self.height = np.empty(capacity)
+        self.scratch = np.empty(capacity)
+        self.abs_dy = np.empty(capacity)
+        self.mask = np.empty(capacity, dtype=bool)
+        self.horizontal = np.empty(capacity, dtype=bool)
+
+    def compute(self, frames, tan_threshold):
+        # tan_threshold: scalar, or (N,) per frame (e.g. parameter sweeps)
+        # Returns (head_y, dx, dy, height, is_horizontal), each (N,)
+        n = len(frames)
+        if n > self.capacity:
+            self._allocate(max(n, 2 * self.capacity))
+        head_y, dx, dy = self.head_y[:n], self.dx[:n], self.dy[:n]
+        height, scratch, abs_dy = self.height[:n], self.scratch[:n], self.abs_dy[:n]
+        mask, horizontal = self.mask[:n], self.horizontal[:n]
+
+        head_y[:] = frames[:, lmk.NOSE, lmk.Y]
+        for out, axis in ((dx, lmk.X), (dy, lmk.Y)):
+            np.add(frames[:, LH, axis], frames[:, RH, axis], out=out, dtype=np.float64)
+            np.subtract(out, frames[:, LS, axis], out=out, dtype=np.float64)
+            np.subtract(out, frames[:, RS, axis], out=out, dtype=np.float64)
+            out *= 0.5
+        np.equal(dx, 0.0, out=mask)
+        np.copyto(dx, MIN_DX, where=mask)
+
+        ys = frames[:, :, lmk.Y]
+        np.maximum.reduce(ys, axis=1, out=height, dtype=np.float64)
+        np.minimum.reduce(ys, axis=1, out=scratch, dtype=np.float64)
+        height -= scratch
+
+        np.abs(dx, out=scratch)
+        scratch *= tan_threshold
+        np.abs(dy, out=abs_dy)
+        np.less(abs_dy, scratch, out=horizontal)
+        return head_y, dx, dy, height, horizontal
@@ -0,0 +1,127 @@
+import numpy as np
+
+# A landmark frame is a float32 array of shape (33, 5): one row per BlazePose
+# landmark, columns x, y, z, visibility, presence (normalized image coords).
+# Batches of frames/tracks are simply (..., 33, 5) arrays, so every consumer
+# can index rows and columns with the constants below.
+
+NUM_LANDMARKS = 33
+NUM_FIELDS = 5
+DTYPE = np.float32
+
+# Columns
+X = 0
+Y = 1
+Z = 2
+VISIBILITY = 3
+PRESENCE = 4
+XY = slice(0, 2)
+XYZ = slice(0, 3)
+
+# Rows (MediaPipe pose landmark topology)
+NOSE = 0
+LEFT_EYE_INNER = 1
+LEFT_EYE = 2
+LEFT_EYE_OUTER = 3
+RIGHT_EYE_INNER = 4
+RIGHT_EYE = 5
+RIGHT_EYE_OUTER = 6
+LEFT_EAR = 7
+RIGHT_EAR = 8
+MOUTH_LEFT = 9
+MOUTH_RIGHT = 10
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_PINKY = 17
+RIGHT_PINKY = 18
+LEFT_INDEX = 19
+RIGHT_INDEX = 20
+LEFT_THUMB = 21
+RIGHT_THUMB = 22
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+LEFT_HEEL = 29
+RIGHT_HEEL = 30
+LEFT_FOOT_INDEX = 31
+RIGHT_FOOT_INDEX = 32
+
+SHOULDERS = [LEFT_SHOULDER, RIGHT_SHOULDER]
+HIPS = [LEFT_HIP, RIGHT_HIP]
+
+
+def empty_frame(batch_shape=()):
+    return np.zeros(tuple(batch_shape) + (NUM_LANDMARKS, NUM_FIELDS), dtype=DTYPE)
+
+
+def from_mediapipe(pose_landmarks, out=None):
+    # One pass over the MediaPipe result; no intermediate Python objects kept
+    if out is None:
+        out = np.empty((len(pose_landmarks), NUM_FIELDS), dtype=DTYPE)
+    flat = out.reshape(-1)
+    flat[:] = np.fromiter(
+        (v for lm in pose_landmarks for v in (lm.x, lm.y, lm.z, lm.visibility or 0.0, lm.presence or 0.0)),
+        dtype=DTYPE, count=len(pose_landmarks) * NUM_FIELDS)
+    return out
+
+
+def as_landmark_array(landmarks, out=None):
+    # Accepts a landmark frame as-is, or any sequence of objects with
+    # x/y/z (and optionally visibility/presence) attributes, e.g. test mocks.
+    if isinstance(landmarks, np.ndarray):
+        return landmarks
+    if out is None:
+        out = np.empty((len(landmarks), NUM_FIELDS), dtype=DTYPE)
+    out[:] = [(lm.x, lm.y, lm.z, getattr(lm, "visibility", 1.0), getattr(lm, "presence", 1.0))
+              for lm in landmarks]
+    return out
+
+
+def midpoint(frames, a, b):
+    # (..., 2) x/y midpoint of two landmarks, for a frame or a batch of frames
+    return (frames[..., a, XY] + frames[..., b, XY]) * 0.5
+
+
+def body_height(frames):
+    # Vertical extent of all landmarks, per frame
+    ys = frames[..., Y]
+    return ys.max(axis=-1) - ys.min(axis=-1)
+
+
+def bounding_box(frames):
+    # (..., 4) normalized x_min, y_min, x_max, y_max
+    xy = frames[..., XY]
+    return np.concatenate([xy.min(axis=-2), xy.max(axis=-2)], axis=-1)
+
+
+# Compact wire format: x/y/z as int16 (1/8192 steps, range +-4), visibility
+# and presence as uint8 (1/255 steps). 8 bytes per landmark, 264 per person.
+# Layout: all int16 xyz values (little-endian) followed by all uint8 scores.
+PACK_SCALE = 8192.0
+PACKED_SIZE = NUM_LANDMARKS * 8
+
+
+def pack(frames):
+    # (..., 33, 5) float -> bytes
+    frames = np.asarray(frames, dtype=DTYPE)
+    xyz = np.clip(np.rint(frames[..., XYZ] * PACK_SCALE), -32768, 32767).astype("<i2")
+    scores = np.clip(np.rint(frames[..., VISIBILITY:] * 255.0), 0, 255).astype(np.uint8)
+    return xyz.tobytes() + scores.tobytes()
+
+
+def unpack(data, count=None):
+    # bytes -> (count, 33, 5) float32; count defaults to what the buffer holds
+    if count is None:
+        count = len(data) // PACKED_SIZE
+    split = count * NUM_LANDMARKS * 3 * 2
+    out = empty_frame((count,))
+    out[..., XYZ] = np.frombuffer(data, dtype="<i2", count=count * NUM_LANDMARKS * 3).reshape(count, NUM_LANDMARKS, 3) / PACK_SCALE
+    out[..., VISIBILITY:] = np.frombuffer(data, dtype=np.uint8, count=count * NUM_LANDMARKS * 2, offset=split).reshape(count, NUM_LANDMARKS, 2) / 255.0
+    return out
@@ -1,119 +1,251 @@
+import startup  # First, so the startup timeline covers the imports below
 import cv2
 import time
-import winsound
-import os
-import datetime
 from config import Config
-from detector import PoseDetector, FallAnalyzer
+from detector import PoseDetector, MultiPersonFallAnalyzer, create_analyzer
 from renderer import PrivacyRenderer
 from notifier import Notifier
+from pipeline import Pipeline
+from recorder import LandmarkRecorder
+from archive import LandmarkArchive
+from scheduler import InferenceScheduler
+from incidents import IncidentWriter
+from server import StreamServer
+from telemetry import Telemetry
+from alarm import AlarmController
+from settings import SettingsStore
+from eventstore import EventStore
+from watchdog import ReconnectingCapture, StreamWatchdog
+import capture
 
-def main():
-    # Initialize Modules
-    detector = PoseDetector()
-    analyzer = FallAnalyzer()
-    renderer = PrivacyRenderer()
-    notifier = Notifier()
-    
-    # Snapshot Dir
-    if not os.path.exists(Config.ALERTS_DIR):
-        os.makedirs(Config.ALERTS_DIR)
+def detect_and_analyze(detector, analyzer, frame, timestamp_ms, recorders=(), color=capture.BGR):
+    # Returns (status, landmarks, angle, velocity, event_id, timestamp).
+    # recorders: objects with add(raw landmarks or None, timestamp). They only
+    # get model output: frames the InferenceScheduler skipped (interpolated
+    # landmarks) go to the analyzer but are not recorded. Recorders with
+    # multi_person = True get every pose, the others the first one.
+    timestamp = timestamp_ms / 1000.0
 
-    # Open Camera
-    cap = cv2.VideoCapture(Config.CAMERA_INDEX)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, Config.FRAME_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, Config.FRAME_HEIGHT)
-    cap.set(cv2.CAP_PROP_FPS, Config.FPS)
+    if isinstance(analyzer, MultiPersonFallAnalyzer):
+        # Every resident is tracked; status is the most severe track
+        poses = detector.find_poses(frame, timestamp_ms, color)
+        if getattr(detector, "last_inferred", True):
+            for recorder in recorders:
+                if not len(poses):
+                    recorder.add(None, timestamp)
+                else:
+                    recorder.add(poses if getattr(recorder, "multi_person", False) else poses[0], timestamp)
+        return analyzer.analyze(poses, timestamp) + (analyzer.event_id, timestamp)
 
-    if not cap.isOpened():
-        print("Error: Could not open webcam.")
-        return
+    # 1. Detection
+    landmarks = detector.find_pose(frame, timestamp_ms, color)
+    if getattr(detector, "last_inferred", True):
+        for recorder in recorders:
+            recorder.add(landmarks, timestamp)
 
-    print(f"Starting {Config.WINDOW_NAME}...")
-    print("Press 'q' to quit.")
+    # 2. Analysis
+    status = "NORMAL"
+    velocity = 0
+    angle = 0
 
-    last_beep_time = 0
-    
-    while True:
-        success, frame = cap.read()
-        if not success:
-            print("Ignoring empty camera frame.")
-            continue
+    if landmarks is not None:
+        status, landmarks, angle, velocity = analyzer.analyze(landmarks, timestamp)
+
+    return status, landmarks, angle, velocity, analyzer.event_id, timestamp
+
+class OutputStage:
+    # Alarms, notifications, incident capture and display for one analyzed frame.
+    def __init__(self, renderer, notifier, incidents=None, stream=None, color=capture.BGR, alarm=None, events=None,
+                 analyzer=None):
+        self.renderer = renderer
+        self.color = color  # Layout of the camera frames (see capture.py)
+        self.notifier = notifier
+        self.incidents = incidents
+        self.stream = stream
+        self.alarm = alarm
+        self.events = events  # eventstore.CameraLog: transitions + landmark summaries
+        self.analyzer = analyzer  # Read for the fall start of new incidents
+
+    def handle(self, frame, result):
+        status, landmarks, angle, velocity, event_id, timestamp = result
+        startup.finish()  # Logs the startup timeline once, on the first analyzed frame
 
-        # 1. Detection
-        timestamp_ms = int(time.time() * 1000)
-        landmarks = detector.find_pose(frame, timestamp_ms)
-        
-        # 2. Analysis
-        status = "NORMAL"
-        velocity = 0
-        angle = 0
-        
-        if landmarks:
-            status, landmarks, angle, velocity = analyzer.analyze(landmarks)
-            
         # 3. Actions & Feedback
-        current_time = time.time()
-        
-        if status == "POTENTIAL_FALL":
-            # Soft warning beep per second
-            if current_time - last_beep_time > 1.0:
-                 winsound.Beep(1000, 200) # 1kHz, 200ms
-                 last_beep_time = current_time
-                 
-        elif status == "FALL_DETECTED":
-             # Alarm!
-             if current_time - last_beep_time > 0.5:
-                 winsound.Beep(2500, 400) # 2.5kHz, 400ms
-                 last_beep_time = current_time
-             
-             # Capture Snapshot (Once per event ideally, but here simple)
-             # Notifier handles "alert cooldown" so let's do similar or just save.
-             # We only save if we send an alert logic?
-             # Let's save every time the notifier alerts (controlled by notifier internally).
-             # But notifier runs async. Let's do a simple check here.
-             pass
+        # Alarm outputs run on their own thread; this only flags the change
+        if self.alarm is not None:
+            self.alarm.update(status)
 
         # Notification Trigger
         if status == "FALL_DETECTED":
-            notifier.alert("FALL_DETECTED", location="Living Room (Camera 1)")
-            
-            # Save Snapshot if just triggered (Logic inside Notifier is cooling down, 
-            # here we might save redundant images if we don't check cooldown, but it's okay for now
-            # or we check if notifier.last_alert_time just updated.
-            # Simplified: Save if status is FALL_DETECTED. 
-            # To avoid spam, we rely on the fact user will stand up or we accept multiple images.
-            timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(Config.ALERTS_DIR, f"fall_{timestamp_str}.png")
-            if not os.path.exists(filename): # 1 sec granularity check
-                 # We want to save the PRIVACY frame, not the raw frame!
-                 # So we render first.
-                 pass
+            self.notifier.alert("FALL_DETECTED", location="Living Room (Camera 1)", camera=f"camera{Config.CAMERA_INDEX}")
+
+        # Local event history (queued, written in groups off the loop)
+        if self.events is not None:
+            self.events.update(timestamp, status, landmarks, velocity, angle, event_id)
 
         # 4. Rendering (Privacy Mode)
         # Always render to get the privacy frame
-        privacy_frame = renderer.draw(frame.shape, landmarks, status, velocity, angle)
+        privacy_frame = self.renderer.draw(capture.frame_size(frame, self.color), landmarks, status, velocity, angle)
         
-        # Save snapshot logic (continued)
-        if status == "FALL_DETECTED" and Config.PRIVACY_MODE:
-             timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-             filename = os.path.join(Config.ALERTS_DIR, f"fall_{timestamp_str}.png")
-             if not os.path.exists(filename):
-                  cv2.imwrite(filename, privacy_frame)
+        # Incident artifacts (one per fall event, written off the loop).
+        # We keep the PRIVACY frames, not the raw frames!
+        if self.incidents is not None:
+            fall_start = getattr(self.analyzer, "fall_start_time", None) if status == "FALL_DETECTED" else None
+            self.incidents.add(timestamp, status, event_id, privacy_frame, fall_start)
+
+        # Live dashboards (no-op without viewers)
+        if self.stream is not None:
+            self.stream.publish(0, timestamp, status, landmarks, event_id)
+
+        # Headless: nothing rendered or shown, stop with Ctrl+C
+        if privacy_frame is None:
+            return True
 
         if Config.PRIVACY_MODE:
             output_image = privacy_frame
         else:
-            output_image = frame
-            # If not privacy mode, we might want overlay.
-            pass
+            output_image = capture.to_bgr(frame, self.color)
 
         # Show Result
         cv2.imshow(Config.WINDOW_NAME, output_image)
 
         if cv2.waitKey(5) & 0xFF == ord('q'):
+            return False
+        return True
+
+def run_sequential(cap, detector, analyzer, output, recorders, watchdog):
+    def analyze(frame, timestamp_ms, color):
+        return detect_and_analyze(detector, analyzer, frame, timestamp_ms, recorders, color)
+
+    while True:
+        success, frame = cap.read()
+        if not success:
+            if cap.ended:
+                break  # End of a recording
+            continue  # cap waits / reopens the stream (see watchdog.py)
+
+        timestamp_ms = int(time.time() * 1000)
+        result = watchdog.process(frame, timestamp_ms, cap.color, analyze)
+        if result is None:
+            continue  # Shed by the watchdog's load stage
+
+        if not output.handle(frame, result):
             break
 
+def run_pipelined(cap, detector, analyzer, output, recorders, watchdog):
+    # Capture, inference and render/output run as separate stages linked by
+    # bounded latest-frame-wins queues (see pipeline.py).
+    def analyze(frame, timestamp_ms, color):
+        status, landmarks, angle, velocity, event_id, timestamp = detect_and_analyze(detector, analyzer, frame, timestamp_ms, recorders, color)
+        # The analyzer reuses its landmark buffer; the render stage reads this one later
+        if landmarks is not None:
+            landmarks = landmarks.copy()
+        return status, landmarks, angle, velocity, event_id, timestamp
+
+    def process(frame, timestamp_ms):
+        return watchdog.process(frame, timestamp_ms, cap.color, analyze)
+
+    pipeline = Pipeline(cap, process_fn=process, output_fn=output.handle)
+    print("Pipeline mode enabled.")
+    pipeline.run()
+
+def load_detector():
+    # Imports the pose runtime, loads the model and runs one warm-up inference
+    detector = PoseDetector()
+    startup.mark("pose model loaded")
+    if Config.MODEL_WARMUP:
+        detector.warm_up()
+        startup.mark("pose model warmed up")
+    return detector
+
+def main():
+    startup.mark("imports done")
+    # Metrics endpoint / JSON dump / profiler, as configured
+    telemetry = Telemetry()
+
+    # Initialize Modules. The pose model loads on a background thread
+    # (FAST_STARTUP) while the services and the camera below come up.
+    model = startup.Task("model", load_detector)
+    # Thresholds from settings.json, re-applied live when the file changes
+    camera = f"camera{Config.CAMERA_INDEX}"
+    settings = SettingsStore()
+    analyzer = create_analyzer(Config.ANALYZER_ENGINE, settings=settings.get(camera))
+    settings.subscribe(camera, analyzer.apply_settings)
+    analyzer.report_angle = not Config.HEADLESS  # Only the on-screen stats show the angle
+    settings.start()
+    renderer = PrivacyRenderer()
+    # Local event history (EVENTS_DB); also records alert outcomes
+    events = EventStore() if Config.EVENTS_DB else None
+    notifier = Notifier(events)
+    startup.mark("services started")
+    
+    # Incident Dir (pre-event ring + background writer)
+    incidents = IncidentWriter(camera=f"camera{Config.CAMERA_INDEX}")
+
+    # Open Camera (reused frame buffers; see capture.py), reopened with backoff if it drops out
+    cap = ReconnectingCapture(Config.CAMERA_INDEX)
+
+    if not cap.isOpened():
+        print("Error: Could not open webcam.")
+        return
+    startup.mark("camera opened")
+
+    detector = pose_detector = model.result()
+    if Config.ADAPTIVE_INFERENCE:
+        # Same find_pose/find_poses interface, skips inference while idle
+        detector = InferenceScheduler(detector, analyzer)
+
+    # Optional live stream for dashboards (STREAM_PORT)
+    stream = StreamServer(cameras=[f"camera{Config.CAMERA_INDEX}"]).start() if Config.STREAM_PORT else None
+    # Local alarm (speaker / relay / siren controller, see alarm.py)
+    alarm = AlarmController()
+    output = OutputStage(renderer, notifier, incidents, stream, cap.color, alarm,
+                         events.camera(camera) if events is not None else None, analyzer)
+
+    # Heartbeats/FPS, wedged landmarker recreation and load shedding; a stall
+    # is raised like an alert so detection never stops silently
+    def on_stall(name, kind, stalled):
+        if stalled:
+            notifier.alert(f"{kind.upper()}_STALLED", location="Living Room (Camera 1)", camera=camera)
+
+    watchdog = StreamWatchdog(camera, cap, pose_detector, analyzer, on_stall).start()
+
+    print(f"Starting {Config.WINDOW_NAME}...")
+    print("Press Ctrl+C to quit." if Config.HEADLESS else "Press 'q' to quit.")
+
+    # Optional raw landmark recording for offline replay (see replay.py)
+    recorder = LandmarkRecorder(camera=f"camera{Config.CAMERA_INDEX}") if Config.RECORD_DIR else None
+    # Optional long-term landmark archive (see archive.py)
+    archive = LandmarkArchive() if Config.ARCHIVE_DIR else None
+    recorders = [incidents.raw]  # Incident clips keep the raw detections
+    if recorder is not None:
+        recorders.append(recorder)
+    if archive is not None:
+        recorders.append(archive.camera(camera))
+
+    try:
+        if Config.PIPELINE_MODE:
+            run_pipelined(cap, detector, analyzer, output, recorders, watchdog)
+        else:
+            run_sequential(cap, detector, analyzer, output, recorders, watchdog)
+    except KeyboardInterrupt:
+        print("Stopping...")
+
+    watchdog.close()
+
+    if recorder is not None:
+        recorder.close()
+    if archive is not None:
+        archive.close()
+    if stream is not None:
+        stream.stop()
+    settings.close()
+    alarm.close()
+    incidents.close()
+    notifier.close()
+    if events is not None:
+        events.close()
+    telemetry.close()
     cap.release()
     cv2.destroyAllWindows()
 
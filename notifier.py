@@ -1,32 +1,295 @@
 import logging
 import threading
 import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import requests
+import heapq
+import random
+import time
+import uuid
+from collections import deque
 import json
 from config import Config
 import os
+import telemetry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("Notifier")
 
-class Notifier:
+CHANNEL_SHEETS = "sheets"
+CHANNEL_TELEGRAM = "telegram"
+CHANNEL_WEBHOOK = "webhook"
+
+class AlertJournal:
+    # Append-only JSON-lines journal of alerts and per-channel deliveries.
+    # Alerts still missing a delivery when the process stops are replayed on
+    # the next start; the file is compacted to those pending alerts on load.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = self._load()
+        self._compact()
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        pending = {}
+        if not os.path.exists(self.path):
+            return pending
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line after a crash
+                alert_id = record.get("id")
+                if record.get("op") == "add":
+                    pending[alert_id] = {"alert": record["alert"], "channels": set(record["channels"])}
+                elif record.get("op") == "done" and alert_id in pending:
+                    pending[alert_id]["channels"].discard(record["channel"])
+                    if not pending[alert_id]["channels"]:
+                        del pending[alert_id]
+        return pending
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for alert_id, entry in self.pending.items():
+                f.write(json.dumps({"op": "add", "id": alert_id, "alert": entry["alert"],
+                                    "channels": sorted(entry["channels"])}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+            if Config.ALERT_JOURNAL_FSYNC:
+                os.fsync(self.file.fileno())
+
+    def add(self, alert, channels):
+        self._write({"op": "add", "id": alert["id"], "alert": alert, "channels": sorted(channels)})
+
+    def ack(self, alert_id, channel):
+        self._write({"op": "done", "id": alert_id, "channel": channel})
+
+    def pending_alerts(self):
+        return [(entry["alert"], entry["channels"]) for entry in self.pending.values()]
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def delivery_outcome(channel, outcome, count=1):
+    telemetry.counter("alert_deliveries_total", "Alert delivery attempts by channel and outcome",
+                      channel=channel, outcome=outcome).inc(count)
+
+class DelayQueue:
+    # Job queue where each job becomes available after its delay (retries)
     def __init__(self):
+        self.heap = []
+        self.cond = threading.Condition()
+        self.counter = 0
+        self.closed = False
+
+    def put(self, item, delay=0.0):
+        with self.cond:
+            self.counter += 1
+            heapq.heappush(self.heap, (time.monotonic() + delay, self.counter, item))
+            self.cond.notify()
+
+    def get(self):
+        # Blocks until a job is due; returns None once closed
+        with self.cond:
+            while not self.closed:
+                if self.heap:
+                    wait = self.heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self.heap)[2]
+                    self.cond.wait(wait)
+                else:
+                    self.cond.wait()
+            return None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class Dispatcher:
+    # Long-lived workers per channel, each channel with its own queue and as
+    # many workers as its concurrency limit, so a slow endpoint only ever
+    # ties up its own workers; failed sends are retried with exponential
+    # backoff + jitter.
+    def __init__(self, handlers, on_delivered, limits=None, on_outcome=None):
+        self.handlers = handlers  # channel -> callable(alert), raises on failure
+        self.on_delivered = on_delivered
+        # on_outcome(alert, channel, outcome) for retries and give-ups
+        self.on_outcome = on_outcome or (lambda alert, channel, outcome: delivery_outcome(channel, outcome))
+        limits = limits or Config.CHANNEL_CONCURRENCY
+        self.queues = {ch: DelayQueue() for ch in handlers}
+        self.threads = {ch: [] for ch in handlers}
+        for channel in handlers:
+            for i in range(max(1, limits.get(channel, 1))):
+                thread = threading.Thread(target=self._worker, args=(channel,),
+                                          name=f"notifier-{channel}-{i}", daemon=True)
+                thread.start()
+                self.threads[channel].append(thread)
+
+    def submit(self, alert, channel, attempt=0, delay=0.0):
+        self.queues[channel].put((alert, attempt), delay)
+
+    def _worker(self, channel):
+        queue = self.queues[channel]
+        handler = self.handlers[channel]
+        while True:
+            job = queue.get()
+            if job is None:
+                return
+            alert, attempt = job
+            try:
+                handler(alert)
+            except Exception as e:
+                attempt += 1
+                if attempt >= Config.ALERT_MAX_ATTEMPTS:
+                    logger.error(f"Giving up on {channel} for alert {alert['id']} after {attempt} attempts: {e} "
+                                 "(kept in journal, retried on next start)")
+                    self.on_outcome(alert, channel, "failed")
+                    continue
+                delay = min(Config.ALERT_RETRY_MAX_DELAY, Config.ALERT_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Failed to send {channel} (attempt {attempt}): {e}. Retrying in {delay:.1f}s")
+                self.on_outcome(alert, channel, "retry")
+                self.submit(alert, channel, attempt, delay)
+            else:
+                self.on_delivered(alert, channel)
+
+    def close(self):
+        # One None sentinel per worker, queued behind the jobs already due, so
+        # those get their attempt; retries scheduled for later stay in the
+        # journal. Joining means no on_delivered (journal ack) runs after this
+        # returns, i.e. after the caller closes the journal.
+        for channel, threads in self.threads.items():
+            for _ in threads:
+                self.queues[channel].put(None)
+        for threads in self.threads.values():
+            for thread in threads:
+                thread.join()
+        for queue in self.queues.values():
+            queue.close()
+
+class SheetBatcher:
+    # Collects sheet rows and writes them with one append_rows call per
+    # batch (every SHEETS_FLUSH_INTERVAL seconds or SHEETS_BATCH_SIZE rows).
+    # With FAST_STARTUP it also makes the Sheets connection, in the
+    # background; rows queued meanwhile (or while unreachable) are held and
+    # the connection is retried like a failed write.
+    def __init__(self, notifier):
+        self.notifier = notifier
+        self.alerts = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="notifier-sheets", daemon=True)
+        self.thread.start()
+
+    def add(self, alert):
+        with self.cond:
+            self.alerts.append((time.monotonic(), alert))
+            self.cond.notify()
+
+    def _take_batch(self):
+        with self.cond:
+            while not self.closed:
+                if self.alerts:
+                    age = time.monotonic() - self.alerts[0][0]
+                    if len(self.alerts) >= Config.SHEETS_BATCH_SIZE or age >= Config.SHEETS_FLUSH_INTERVAL:
+                        break
+                    self.cond.wait(Config.SHEETS_FLUSH_INTERVAL - age)
+                else:
+                    self.cond.wait()
+            count = min(len(self.alerts), Config.SHEETS_BATCH_SIZE)
+            return [self.alerts.popleft() for _ in range(count)]
+
+    def _run(self):
+        if self.notifier.sheets_configured and self.notifier.sheet is None:
+            self.notifier.setup_sheets()
+        attempt = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            alerts = [alert for _, alert in batch]
+            try:
+                if self.notifier.sheet is None and not self.notifier.setup_sheets():
+                    raise RuntimeError("Google Sheets not connected")
+                self.notifier.sheet.append_rows(
+                    [[a["timestamp"], a["event"], a["location"], a["message"]] for a in alerts])
+            except Exception as e:
+                attempt += 1
+                delay = min(Config.ALERT_RETRY_MAX_DELAY, Config.ALERT_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                logger.error(f"Failed to log {len(alerts)} rows to Sheet: {e}. Retrying in {delay:.1f}s")
+                for alert in alerts:
+                    self.notifier._outcome(alert, CHANNEL_SHEETS, "retry")
+                with self.cond:
+                    self.alerts.extendleft(reversed(batch))
+                    if self.closed:
+                        return  # Left in the journal for the next start
+                    self.cond.wait(delay)
+                continue
+            attempt = 0
+            for alert in alerts:
+                self.notifier._delivered(alert, CHANNEL_SHEETS)
+
+    def close(self, timeout=5.0):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+class Notifier:
+    def __init__(self, events=None):
+        # Optional eventstore.EventStore: alert lifecycle kept in the local history
+        self.events = events
         self.last_alert_time = 0
+        self.last_alert_times = {}  # Per (location, event), so one room or event cannot mute another
         self.alert_cooldown = 10  # Seconds between alerts
-        
-        # Google Sheets Setup
+
+        # Google Sheets Setup (the sheet batcher connects in the background
+        # with FAST_STARTUP, so startup never waits on Google's auth servers)
         self.sheet = None
-        self.setup_sheets()
+        self.sheets_configured = os.path.exists(Config.GOOGLE_SHEETS_CREDENTIALS_FILE)
+        if not (self.sheets_configured and Config.FAST_STARTUP):
+            self.setup_sheets()
+
+        # Pooled HTTP sessions, one per channel, created on first send
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+        # Long-lived delivery machinery
+        self.journal = AlertJournal(Config.ALERT_JOURNAL_PATH)
+        self.sheet_batcher = SheetBatcher(self)
+        self.dispatcher = Dispatcher(
+            {CHANNEL_TELEGRAM: self._send_telegram, CHANNEL_WEBHOOK: self._send_webhook},
+            on_delivered=self._delivered, on_outcome=self._outcome)
+
+        # Replay alerts that were not delivered before the last shutdown
+        enabled = set(self._channels())
+        for alert, channels in self.journal.pending_alerts():
+            for channel in channels - enabled:
+                logger.warning(f"Dropping pending {channel} delivery for alert {alert['id']}: channel not configured")
+                self.journal.ack(alert["id"], channel)
+            if channels & enabled:
+                logger.info(f"Resending undelivered alert from {alert['timestamp']} ({', '.join(sorted(channels & enabled))})")
+                self._dispatch(alert, channels & enabled)
 
     def setup_sheets(self):
+        # True once connected. The Google client libraries are imported here,
+        # not at startup: they are the slowest imports of the whole program.
         try:
             if os.path.exists(Config.GOOGLE_SHEETS_CREDENTIALS_FILE):
+                import gspread
+                from oauth2client.service_account import ServiceAccountCredentials
+
                 scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
                 creds = ServiceAccountCredentials.from_json_keyfile_name(Config.GOOGLE_SHEETS_CREDENTIALS_FILE, scope)
                 client = gspread.authorize(creds)
-                
+
                 # Open or Create Sheet
                 try:
                     self.sheet = client.open(Config.GOOGLE_SHEET_NAME).sheet1
@@ -37,50 +300,117 @@ class Notifier:
                     self.sheet = sh.sheet1
                     # Add Header
                     self.sheet.append_row(["Timestamp", "Event", "Location", "Details"])
-                
+
                 logger.info("Google Sheets connected successfully.")
             else:
                 logger.warning(f"Google Sheets credentials not found at {Config.GOOGLE_SHEETS_CREDENTIALS_FILE}. Logging will be local only.")
         except Exception as e:
             logger.error(f"Failed to setup Google Sheets: {e}")
+        return self.sheet is not None
 
-    def alert(self, event_type, location="Unknown"):
+    def _channels(self):
+        channels = []
+        if self.sheets_configured:
+            channels.append(CHANNEL_SHEETS)
+        if Config.TELEGRAM_BOT_TOKEN and Config.TELEGRAM_CHAT_ID:
+            channels.append(CHANNEL_TELEGRAM)
+        if Config.WEBHOOK_URL:
+            channels.append(CHANNEL_WEBHOOK)
+        return channels
+
+    def alert(self, event_type, location="Unknown", camera=None):
+        # camera: stable ID ("camera0") for the event history; defaults to location
         current_time = datetime.datetime.now()
         timestamp = current_time.strftime("%Y-%m-%d %H:%M:%S")
-        
+
         # Cooldown check for notifications (not logs)
-        if (current_time.timestamp() - self.last_alert_time) < self.alert_cooldown:
+        key = (location, event_type)
+        if (current_time.timestamp() - self.last_alert_times.get(key, 0)) < self.alert_cooldown:
             return
 
         self.last_alert_time = current_time.timestamp()
-        
+        self.last_alert_times[key] = self.last_alert_time
+
         message = f"ALARM: {event_type} detected at {location} on {timestamp}"
         logger.info(message)
-        
-        # Run in separate thread to not block video
-        threading.Thread(target=self._send_async, args=(message, timestamp, event_type, location)).start()
 
-    def _send_async(self, message, timestamp, event_type, location):
-        # 1. Google Sheets
-        if self.sheet:
-            try:
-                self.sheet.append_row([timestamp, event_type, location, message])
-            except Exception as e:
-                logger.error(f"Failed to log to Sheet: {e}")
+        # Hand off to the dispatcher; never blocks the video loop on the network
+        self._send_async(message, timestamp, event_type, location, camera)
 
-        # 2. Telegram
-        if Config.TELEGRAM_BOT_TOKEN and Config.TELEGRAM_CHAT_ID:
-            try:
-                url = f"https://api.telegram.org/bot{Config.TELEGRAM_BOT_TOKEN}/sendMessage"
-                data = {"chat_id": Config.TELEGRAM_CHAT_ID, "text": message}
-                requests.post(url, data=data)
-            except Exception as e:
-                logger.error(f"Failed to send Telegram: {e}")
+    @telemetry.timed("alert_enqueue_seconds", "Time to journal and hand off an alert")
+    def _send_async(self, message, timestamp, event_type, location, camera=None):
+        channels = self._channels()
+        alert = {
+            "id": uuid.uuid4().hex,
+            "timestamp": timestamp,
+            "event": event_type,
+            "location": location,
+            "camera": camera or location,
+            "message": message,
+            "created": time.time(),
+        }
+        # Recorded locally even when no channel is configured or reachable
+        if self.events is not None:
+            self.events.alert(alert, ",".join(channels), "raised")
+        if not channels:
+            return
+        # Journal first so the alert survives a crash before delivery
+        self.journal.add(alert, channels)
+        self._dispatch(alert, channels)
 
-        # 3. Webhook (Generic)
-        if Config.WEBHOOK_URL:
-             try:
-                payload = {"text": message, "timestamp": timestamp}
-                requests.post(Config.WEBHOOK_URL, json=payload)
-             except Exception as e:
-                logger.error(f"Failed to send Webhook: {e}")
+    def _dispatch(self, alert, channels):
+        for channel in channels:
+            if channel == CHANNEL_SHEETS:
+                self.sheet_batcher.add(alert)
+            else:
+                self.dispatcher.submit(alert, channel)
+
+    def _outcome(self, alert, channel, outcome):
+        delivery_outcome(channel, outcome)
+        if self.events is not None:
+            self.events.alert(alert, channel, outcome)
+
+    def _delivered(self, alert, channel):
+        self.journal.ack(alert["id"], channel)
+        self._outcome(alert, channel, "delivered")
+        if "created" in alert:
+            telemetry.histogram("alert_delivery_latency_seconds", "Alert creation to confirmed delivery",
+                                channel=channel).record(time.time() - alert["created"])
+
+    def _timeout(self):
+        return (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+
+    def _session(self, channel):
+        # Keep-alive session with a bounded pool; requests is imported on the
+        # first send, on a dispatcher thread
+        with self.sessions_lock:
+            session = self.sessions.get(channel)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.CHANNEL_CONCURRENCY.get(channel, 1))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.sessions[channel] = session
+            return session
+
+    def _send_telegram(self, alert):
+        url = f"https://api.telegram.org/bot{Config.TELEGRAM_BOT_TOKEN}/sendMessage"
+        data = {"chat_id": Config.TELEGRAM_CHAT_ID, "text": alert["message"]}
+        response = self._session(CHANNEL_TELEGRAM).post(url, data=data, timeout=self._timeout())
+        response.raise_for_status()
+
+    def _send_webhook(self, alert):
+        payload = {"text": alert["message"], "timestamp": alert["timestamp"]}
+        response = self._session(CHANNEL_WEBHOOK).post(Config.WEBHOOK_URL, json=payload, timeout=self._timeout())
+        response.raise_for_status()
+
+    def close(self):
+        self.dispatcher.close()
+        self.sheet_batcher.close()
+        self.journal.close()
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session.close()
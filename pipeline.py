@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from collections import deque
+from config import Config
+import telemetry
+
+logger = logging.getLogger("Pipeline")
+
+# Drop policies for full queues
+DROP_OLDEST = "drop_oldest"  # Latest frame wins (evict the stale item)
+DROP_NEWEST = "drop_newest"  # Keep what is queued, discard the incoming item
+BLOCK = "block"              # Back-pressure the producer until there is room
+
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class FrameQueue:
+    # Small bounded hand-off between two pipeline stages.
+    def __init__(self, maxsize=1, drop_policy=DROP_OLDEST):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.maxsize = max(1, int(maxsize))
+        self.drop_policy = drop_policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        # Returns False if the item was dropped (or the queue is closed)
+        with self.cond:
+            if self.closed:
+                return False
+
+            if len(self.items) >= self.maxsize:
+                if self.drop_policy == DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+                elif self.drop_policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                else:
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        return False
+
+            self.items.append(item)
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        # Returns None on timeout or once the queue is closed and drained
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class StageStats:
+    # Per-stage throughput counters, read by the stats reporter
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.busy_time = 0.0
+        self.window_frames = 0
+        self.window_busy = 0.0
+        self.window_start = time.perf_counter()
+
+    def record(self, busy_seconds):
+        with self.lock:
+            self.frames += 1
+            self.busy_time += busy_seconds
+            self.window_frames += 1
+            self.window_busy += busy_seconds
+
+    def snapshot(self):
+        # Returns (fps, avg_ms) for the window since the last snapshot
+        with self.lock:
+            now = time.perf_counter()
+            elapsed = now - self.window_start
+            fps = self.window_frames / elapsed if elapsed > 0 else 0.0
+            avg_ms = (self.window_busy / self.window_frames * 1000) if self.window_frames else 0.0
+            self.window_frames = 0
+            self.window_busy = 0.0
+            self.window_start = now
+        return fps, avg_ms
+
+
+class Pipeline:
+    # Capture thread -> inference worker -> render/output stage (caller thread).
+    # Stages are linked by bounded queues so a slow stage drops stale frames
+    # instead of letting them pile up; time-to-alarm is then bounded by
+    # inference speed rather than by the sum of every stage.
+    def __init__(self, cap, process_fn, output_fn,
+                 queue_size=None, capture_policy=None, result_policy=None,
+                 stats_interval=None):
+        self.cap = cap
+        self.process_fn = process_fn  # (frame, timestamp_ms) -> result tuple, None = frame skipped
+        self.output_fn = output_fn    # (frame, result) -> False to stop
+
+        queue_size = queue_size or Config.PIPELINE_QUEUE_SIZE
+        self.capture_queue = FrameQueue(queue_size, capture_policy or Config.CAPTURE_DROP_POLICY)
+        self.result_queue = FrameQueue(queue_size, result_policy or Config.RESULT_DROP_POLICY)
+        self.stats_interval = stats_interval if stats_interval is not None else Config.PIPELINE_STATS_INTERVAL
+
+        self.stats = {
+            "capture": StageStats("capture"),
+            "inference": StageStats("inference"),
+            "render": StageStats("render"),
+        }
+
+        # Exported as-is at scrape time; nothing extra on the hot path
+        for name, stats in self.stats.items():
+            telemetry.callback("pipeline_frames_total", lambda s=stats: s.frames, "counter",
+                               "Frames processed per pipeline stage", stage=name)
+        for name, queue in (("capture", self.capture_queue), ("result", self.result_queue)):
+            telemetry.callback("pipeline_dropped_frames_total", lambda q=queue: q.dropped, "counter",
+                               "Frames dropped by full stage queues", queue=name)
+
+        self.running = threading.Event()
+        self.threads = []
+
+    def _capture_loop(self):
+        stats = self.stats["capture"]
+        while self.running.is_set():
+            start = time.perf_counter()
+            success, frame = self.cap.read()
+            if not success:
+                if getattr(self.cap, "ended", False):
+                    break  # End of a recording
+                continue  # The source waits / reopens (watchdog.ReconnectingCapture)
+
+            timestamp_ms = int(time.time() * 1000)
+            self.capture_queue.put((frame, timestamp_ms))
+            stats.record(time.perf_counter() - start)
+
+        self.capture_queue.close()
+
+    def _inference_loop(self):
+        stats = self.stats["inference"]
+        last_timestamp_ms = -1
+        while True:
+            item = self.capture_queue.get(timeout=0.5)
+            if item is None:
+                if self.capture_queue.closed:
+                    break
+                continue
+
+            frame, timestamp_ms = item
+            # VIDEO mode landmarkers require strictly increasing timestamps
+            if timestamp_ms <= last_timestamp_ms:
+                timestamp_ms = last_timestamp_ms + 1
+            last_timestamp_ms = timestamp_ms
+
+            start = time.perf_counter()
+            try:
+                result = self.process_fn(frame, timestamp_ms)
+            except Exception as e:
+                logger.error(f"Inference stage failed: {e}")
+                telemetry.counter("pipeline_errors_total", "Frames lost to inference stage exceptions").inc()
+                continue
+            stats.record(time.perf_counter() - start)
+            if result is not None:
+                self.result_queue.put((frame, result))
+
+        self.result_queue.close()
+
+    def report_stats(self):
+        parts = []
+        for name, stats in self.stats.items():
+            fps, avg_ms = stats.snapshot()
+            parts.append(f"{name}: {fps:.1f} fps / {avg_ms:.1f} ms")
+        logger.info(
+            " | ".join(parts)
+            + f" | dropped capture={self.capture_queue.dropped} result={self.result_queue.dropped}"
+        )
+
+    def start(self):
+        self.running.set()
+        for target, name in ((self._capture_loop, "capture"), (self._inference_loop, "inference")):
+            thread = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running.clear()
+        self.capture_queue.close()
+        self.result_queue.close()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+        self.threads = []
+
+    def run(self):
+        # Runs the render/output stage on the calling thread (cv2.imshow
+        # must stay on the main thread on most platforms).
+        self.start()
+        stats = self.stats["render"]
+        last_report = time.perf_counter()
+        try:
+            while True:
+                item = self.result_queue.get(timeout=0.5)
+                if item is None:
+                    if self.result_queue.closed:
+                        break
+                    continue
+
+                frame, result = item
+                start = time.perf_counter()
+                keep_going = self.output_fn(frame, result)
+                stats.record(time.perf_counter() - start)
+                if keep_going is False:
+                    break
+
+                if self.stats_interval and time.perf_counter() - last_report >= self.stats_interval:
+                    self.report_stats()
+                    last_report = time.perf_counter()
+        finally:
+            self.stop()
@@ -0,0 +1,105 @@
+import datetime
+import logging
+import os
+import threading
+from collections import namedtuple
+import numpy as np
+from config import Config
+import landmarks as lmk
+
+logger = logging.getLogger("Recorder")
+
+# A recorded landmark stream:
+#   frames:     (N, 33, 5) float32 raw (unsmoothed) landmark frames
+#   timestamps: (N,) float64 seconds
+#   present:    (N,) bool, False where no person was detected
+#   label:      expected outcome for labeled clips ("fall" / "no_fall" / "")
+#   meta:       dict of extra string metadata (camera, fall_time, ...)
+Recording = namedtuple("Recording", ["frames", "timestamps", "present", "label", "meta"])
+
+LABEL_FALL = "fall"
+LABEL_NO_FALL = "no_fall"
+
+
+def save_recording(path, frames, timestamps, present=None, label="", **meta):
+    frames = np.asarray(frames, dtype=lmk.DTYPE)
+    if present is None:
+        present = np.ones(len(frames), dtype=bool)
+    np.savez_compressed(
+        path,
+        frames=frames,
+        timestamps=np.asarray(timestamps, dtype=np.float64),
+        present=np.asarray(present, dtype=bool),
+        label=np.array(label),
+        meta_keys=np.array(list(meta.keys()), dtype=str),
+        meta_values=np.array([str(v) for v in meta.values()], dtype=str),
+    )
+
+
+def load_recording(path):
+    with np.load(path) as data:
+        meta = dict(zip(data["meta_keys"].tolist(), data["meta_values"].tolist())) if "meta_keys" in data else {}
+        return Recording(
+            frames=data["frames"],
+            timestamps=data["timestamps"],
+            present=data["present"],
+            label=str(data["label"]) if "label" in data else "",
+            meta=meta,
+        )
+
+
+class LandmarkRecorder:
+    # Collects raw landmark frames into preallocated arrays and writes a
+    # compressed .npz clip every `clip_frames` frames. Files are written on
+    # a background thread so recording never stalls the capture loop.
+    def __init__(self, directory=None, camera="camera", clip_frames=None, label=""):
+        self.directory = directory or Config.RECORD_DIR
+        self.camera = camera
+        self.clip_frames = clip_frames or Config.RECORD_CLIP_FRAMES
+        self.label = label
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._new_buffers()
+        self.writers = []
+
+    def _new_buffers(self):
+        self.frames = lmk.empty_frame((self.clip_frames,))
+        self.timestamps = np.zeros(self.clip_frames, dtype=np.float64)
+        self.present = np.zeros(self.clip_frames, dtype=bool)
+        self.count = 0
+
+    def add(self, landmarks, timestamp):
+        # landmarks: (33, 5) raw frame, or None when nobody was detected
+        i = self.count
+        if landmarks is not None:
+            self.frames[i] = landmarks
+            self.present[i] = True
+        self.timestamps[i] = timestamp
+        self.count += 1
+        if self.count >= self.clip_frames:
+            self.flush()
+
+    def flush(self):
+        if self.count == 0:
+            return None
+        start = datetime.datetime.fromtimestamp(self.timestamps[0]).strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, f"{self.camera}_{start}.npz")
+        frames, timestamps, present = self.frames[:self.count], self.timestamps[:self.count], self.present[:self.count]
+        self._new_buffers()
+
+        def write():
+            try:
+                save_recording(path, frames, timestamps, present, label=self.label, camera=self.camera)
+                logger.info(f"Saved {len(frames)} frames to {path}")
+            except Exception as e:
+                logger.error(f"Failed to save recording {path}: {e}")
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        self.writers = [w for w in self.writers if w.is_alive()] + [writer]
+        return path
+
+    def close(self):
+        self.flush()
+        for writer in self.writers:
+            writer.join()
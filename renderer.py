@@ -1,8 +1,31 @@
 import cv2
 import numpy as np
+from config import Config
+import landmarks as lmk
+import telemetry
+
+# Colors (BGR)
+COLOR_NORMAL = (0, 255, 0) # Green
+COLOR_WARN = (0, 165, 255) # Orange
+COLOR_ALARM = (0, 0, 255)    # Red
+COLOR_BONE = (255, 255, 255)
+
+STATUS_COLORS = {"NORMAL": COLOR_NORMAL, "POTENTIAL_FALL": COLOR_WARN}
+
+def disc_offsets(radius, ring=False):
+    # Pixel offsets of a filled disc (or a 1 px ring) around a center point
+    r = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(r, r, indexing="ij")
+    dist = np.sqrt(dx * dx + dy * dy)
+    mask = np.abs(dist - radius) < 0.5 if ring else dist <= radius + 0.3
+    return dy[mask], dx[mask]
 
 class PrivacyRenderer:
-    def __init__(self):
+    # Keeps a cached static layer per (frame size, status) and one reused
+    # output buffer, so a frame costs one memcpy, a text line, one batched
+    # polylines call and one vectorized point stamp. The returned frame is
+    # overwritten by the next draw(); copy it if you keep it around.
+    def __init__(self, headless=None):
         # Define connections for a skeleton
         # 11-12: Shoulders
         # 23-24: Hips
@@ -10,63 +33,80 @@ class PrivacyRenderer:
         # Arms: 11-13-15, 12-14-16
         # Legs: 23-25-27, 24-26-28
         self.connections = [
-            (11, 12), (23, 24), (11, 23), (12, 24),
-            (11, 13), (13, 15), (12, 14), (14, 16),
-            (23, 25), (25, 27), (24, 26), (26, 28),
-            (0, 1), (1, 4), (4, 5), (0, 5) # Simple head
+            (lmk.LEFT_SHOULDER, lmk.RIGHT_SHOULDER), (lmk.LEFT_HIP, lmk.RIGHT_HIP),
+            (lmk.LEFT_SHOULDER, lmk.LEFT_HIP), (lmk.RIGHT_SHOULDER, lmk.RIGHT_HIP),
+            (lmk.LEFT_SHOULDER, lmk.LEFT_ELBOW), (lmk.LEFT_ELBOW, lmk.LEFT_WRIST),
+            (lmk.RIGHT_SHOULDER, lmk.RIGHT_ELBOW), (lmk.RIGHT_ELBOW, lmk.RIGHT_WRIST),
+            (lmk.LEFT_HIP, lmk.LEFT_KNEE), (lmk.LEFT_KNEE, lmk.LEFT_ANKLE),
+            (lmk.RIGHT_HIP, lmk.RIGHT_KNEE), (lmk.RIGHT_KNEE, lmk.RIGHT_ANKLE),
+            (lmk.NOSE, lmk.LEFT_EYE_INNER), (lmk.LEFT_EYE_INNER, lmk.RIGHT_EYE_INNER),
+            (lmk.RIGHT_EYE_INNER, lmk.RIGHT_EYE), (lmk.NOSE, lmk.RIGHT_EYE) # Simple head
         ]
+        self.connection_array = np.array(self.connections, dtype=np.intp)
+
+        # Headless deployments skip rendering entirely (draw() returns None)
+        self.headless = Config.HEADLESS if headless is None else headless
 
+        self.layers = {}
+        self.output = None
+
+        # Landmark markers: filled dot (r=5) plus a glow outline (r=8)
+        dot_y, dot_x = disc_offsets(5)
+        ring_y, ring_x = disc_offsets(8, ring=True)
+        self.stamp_y = np.concatenate([dot_y, ring_y])
+        self.stamp_x = np.concatenate([dot_x, ring_x])
+
+    def _static_layer(self, height, width, status):
+        # Black background + top bar + status text, rendered once per status
+        key = (height, width, status)
+        layer = self.layers.get(key)
+        if layer is None:
+            main_color = STATUS_COLORS.get(status, COLOR_ALARM)
+            layer = np.zeros((height, width, 3), dtype=np.uint8)
+            cv2.rectangle(layer, (0, 0), (width, 60), (30, 30, 30), -1)
+            cv2.putText(layer, f"STATUS: {status}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, main_color, 2)
+            self.layers[key] = layer
+        return layer
+
+    @telemetry.timed("render_seconds", "Privacy frame rendering time")
     def draw(self, frame_shape, landmarks, status="NORMAL", velocity=0, angle=0):
-        # Colors (BGR)
-        COLOR_NORMAL = (0, 255, 0) # Green
-        COLOR_WARN = (0, 165, 255) # Orange
-        COLOR_ALARM = (0, 0, 255)    # Red
-        
-        if status == "NORMAL":
-            main_color = COLOR_NORMAL
-        elif status == "POTENTIAL_FALL":
-            main_color = COLOR_WARN
-        else:
-            main_color = COLOR_ALARM
-
-        # Create a black background
-        height, width, _ = frame_shape
-        privacy_frame = np.zeros((height, width, 3), dtype=np.uint8)
-
-        # Dashboard / UI
-        # Top Bar
-        cv2.rectangle(privacy_frame, (0, 0), (width, 60), (30, 30, 30), -1)
-        cv2.putText(privacy_frame, f"STATUS: {status}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, main_color, 2)
-        
+        if self.headless:
+            return None
+
+        main_color = STATUS_COLORS.get(status, COLOR_ALARM)
+        height, width = frame_shape[:2]
+
+        # Start from the cached dashboard in the reused output buffer
+        layer = self._static_layer(height, width, status)
+        if self.output is None or self.output.shape != layer.shape:
+            self.output = np.empty_like(layer)
+        privacy_frame = self.output
+        np.copyto(privacy_frame, layer)
+
         # Stats (Velocity, Angle)
-        stats_text = f"Spd: {velocity:.2f} | Ang: {int(angle)} deg"
+        angle_text = f"{int(angle)} deg" if angle is not None else "--"
+        stats_text = f"Spd: {velocity:.2f} | Ang: {angle_text}"
         cv2.putText(privacy_frame, stats_text, (width - 350, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
 
-        if not landmarks:
-            return privacy_frame
-
-        # Draw Connections
-        for start_idx, end_idx in self.connections:
-            if start_idx < len(landmarks) and end_idx < len(landmarks):
-                start = landmarks[start_idx]
-                end = landmarks[end_idx]
-                
-                x1, y1 = int(start.x * width), int(start.y * height)
-                x2, y2 = int(end.x * width), int(end.y * height)
-                
-                # Dynamic Line Thickness
-                thickness = 2
-                if status == "FALL_DETECTED": 
-                    thickness = 4
-                
-                cv2.line(privacy_frame, (x1, y1), (x2, y2), (255, 255, 255), thickness)
-
-        # Draw Points
-        for lm in landmarks:
-            x, y = int(lm.x * width), int(lm.y * height)
-            cv2.circle(privacy_frame, (x, y), 5, main_color, -1)
-            # Glow effect (simple outline)
-            cv2.circle(privacy_frame, (x, y), 8, main_color, 1)
+        if landmarks is not None and len(landmarks) > 0:
+            # Pixel coordinates for every landmark in one vectorized step.
+            # Accepts one (33, 5) skeleton or an (N, 33, 5) batch of tracked people.
+            skeletons = (landmarks[..., lmk.XY] * (width, height)).astype(np.int32)
+            skeletons = skeletons.reshape(-1, skeletons.shape[-2], 2)
+
+            # Dynamic Line Thickness
+            thickness = 4 if status == "FALL_DETECTED" else 2
+
+            # Draw Connections: every bone of every skeleton in one call
+            bones = skeletons[:, self.connection_array].reshape(-1, 2, 2)
+            cv2.polylines(privacy_frame, list(bones), False, COLOR_BONE, thickness)
+
+            # Draw Points: stamp all markers at once, clipped to the frame
+            points = skeletons.reshape(-1, 2)
+            ys = (points[:, 1:2] + self.stamp_y).ravel()
+            xs = (points[:, 0:1] + self.stamp_x).ravel()
+            inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+            privacy_frame[ys[inside], xs[inside]] = main_color
         
         # If ALARM, draw border
         if status == "FALL_DETECTED":
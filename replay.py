@@ -0,0 +1,158 @@
+import argparse
+import glob
+import os
+import time
+from collections import namedtuple
+import numpy as np
+from detector import BatchFallAnalyzer, STATE_FALL_DETECTED, create_analyzer
+from recorder import load_recording, LABEL_FALL, LABEL_NO_FALL
+
+# Offline replay / benchmark of recorded landmark streams through the analyzer.
+#   python replay.py recordings/ --repeat 10
+#   python replay.py incidents/*.npz --batch
+
+ClipResult = namedtuple("ClipResult", ["name", "label", "frames", "detected", "detection_time", "delay"])
+
+
+def find_recordings(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "*.npz"), recursive=True)))
+        else:
+            files.extend(sorted(glob.glob(path)))
+    return files
+
+
+def reference_time(recording):
+    # Delay is measured from the labeled fall time if the clip has one,
+    # otherwise from the start of the clip
+    return float(recording.meta.get("fall_time", recording.timestamps[0]))
+
+
+def clip_result(name, recording, detection_time):
+    delay = None
+    if detection_time is not None:
+        delay = detection_time - reference_time(recording)
+    return ClipResult(name, recording.label, len(recording.frames), detection_time is not None, detection_time, delay)
+
+
+def replay_clip(name, recording, latencies, engine=None):
+    # Runs one clip through a fresh analyzer, appending per-call latency (ns)
+    analyzer = create_analyzer(engine, max_poses=1)
+    analyzer.report_angle = False  # Only the decisions matter here
+    detection_time = None
+    frames, timestamps, present = recording.frames, recording.timestamps.tolist(), recording.present.tolist()
+    perf = time.perf_counter_ns
+
+    for i in range(len(frames)):
+        if not present[i]:
+            continue
+        start = perf()
+        status, _, _, _ = analyzer.analyze(frames[i], timestamps[i])
+        latencies.append(perf() - start)
+        if status == "FALL_DETECTED" and detection_time is None:
+            detection_time = timestamps[i]
+
+    return clip_result(name, recording, detection_time)
+
+
+def replay_batch(names, recordings, latencies):
+    # Runs every clip at once through a BatchFallAnalyzer (one slot per clip),
+    # stepping all clips in lockstep; latencies are per batched call.
+    analyzer = BatchFallAnalyzer(capacity=len(recordings))
+    analyzer.report_angle = False
+    detection_times = [None] * len(recordings)
+    perf = time.perf_counter_ns
+
+    # Pad every clip to the longest one: (clips, steps, 33, 5)
+    steps = max((len(r.frames) for r in recordings), default=0)
+    frames_all = np.zeros((len(recordings), steps) + recordings[0].frames.shape[1:], dtype=np.float32)
+    timestamps_all = np.zeros((len(recordings), steps))
+    present_all = np.zeros((len(recordings), steps), dtype=bool)
+    for i, r in enumerate(recordings):
+        frames_all[i, :len(r.frames)] = r.frames
+        timestamps_all[i, :len(r.frames)] = r.timestamps
+        present_all[i, :len(r.frames)] = r.present
+
+    for step in range(steps):
+        slots = np.flatnonzero(present_all[:, step])
+        if len(slots) == 0:
+            continue
+        frames = frames_all[slots, step]
+        timestamps = timestamps_all[slots, step]
+
+        start = perf()
+        codes, _, _, _ = analyzer.analyze(slots, frames, timestamps)
+        latencies.append(perf() - start)
+
+        for slot, code, timestamp in zip(slots.tolist(), codes.tolist(), timestamps.tolist()):
+            if code == STATE_FALL_DETECTED and detection_times[slot] is None:
+                detection_times[slot] = timestamp
+
+    return [clip_result(n, r, t) for n, r, t in zip(names, recordings, detection_times)]
+
+
+def summarize(results):
+    counts = {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    for r in results:
+        if r.label == LABEL_FALL:
+            counts["tp" if r.detected else "fn"] += 1
+        elif r.label == LABEL_NO_FALL:
+            counts["fp" if r.detected else "tn"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded landmark clips through the fall analyzer.")
+    parser.add_argument("paths", nargs="+", help=".npz recordings, globs or directories")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay every clip N times (throughput runs)")
+    parser.add_argument("--batch", action="store_true", help="Analyze all clips together in one batched analyzer")
+    parser.add_argument("--engine", default=None, help="Analyzer engine: heuristic or classifier (default: Config)")
+    args = parser.parse_args()
+    if args.batch and args.engine == "classifier":
+        parser.error("--batch only supports the heuristic engine")
+
+    files = find_recordings(args.paths)
+    if not files:
+        print("No recordings found.")
+        return
+    recordings = [load_recording(f) for f in files]
+    names = [os.path.basename(f) for f in files]
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        if args.batch:
+            results = replay_batch(names, recordings, latencies)
+        else:
+            results = [replay_clip(n, r, latencies, args.engine) for n, r in zip(names, recordings)]
+    elapsed = time.perf_counter() - start
+
+    total_frames = sum(int(r.present.sum()) for r in recordings) * args.repeat
+    print(f"{'clip':40} {'label':8} {'frames':>7} {'result':>9} {'delay':>7}")
+    for r in results:
+        outcome = "FALL" if r.detected else "-"
+        delay = f"{r.delay:.2f}s" if r.delay is not None else ""
+        mark = ""
+        if r.label in (LABEL_FALL, LABEL_NO_FALL) and r.detected != (r.label == LABEL_FALL):
+            mark = "  <-- MISMATCH"
+        print(f"{r.name[:40]:40} {r.label or '?':8} {r.frames:7d} {outcome:>9} {delay:>7}{mark}")
+
+    lat_us = np.array(latencies, dtype=np.float64) / 1000.0
+    p50, p95, p99 = np.percentile(lat_us, [50, 95, 99]) if len(lat_us) else (0, 0, 0)
+    print()
+    print(f"Frames: {total_frames} in {elapsed:.2f}s -> {total_frames / max(elapsed, 1e-9):,.0f} frames/sec")
+    print(f"Per-call latency: p50={p50:.1f}us p95={p95:.1f}us p99={p99:.1f}us ({'batched' if args.batch else 'per frame'})")
+
+    counts = summarize(results)
+    labeled = sum(counts.values())
+    if labeled:
+        precision = counts["tp"] / max(counts["tp"] + counts["fp"], 1)
+        recall = counts["tp"] / max(counts["tp"] + counts["fn"], 1)
+        print(f"Labeled clips: {labeled}  TP={counts['tp']} FP={counts['fp']} FN={counts['fn']} TN={counts['tn']}"
+              f"  precision={precision:.2f} recall={recall:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import cv2
+from config import Config
+import landmarks as lmk
+import capture
+import telemetry
+
+
+class MotionGate:
+    # Cheap motion check: mean absolute difference of a tiny grayscale
+    # thumbnail against the thumbnail of the last inferred frame. Comparing
+    # to the last inference (not the previous frame) also catches slow drift.
+    def __init__(self, threshold=None, size=(80, 60)):
+        self.threshold = threshold if threshold is not None else Config.MOTION_THRESHOLD
+        self.size = size
+        self.reference = None
+        self.thumb = None
+
+    def score(self, frame, color=capture.BGR):
+        if color == capture.YUV:
+            # The Y plane already is the grayscale image
+            self.thumb = cv2.resize(capture.to_gray(frame, color), self.size, interpolation=cv2.INTER_AREA)
+        else:
+            small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            self.thumb = capture.to_gray(small, color)
+        if self.reference is None:
+            return float("inf")
+        return float(cv2.absdiff(self.thumb, self.reference).mean())
+
+    def moved(self, frame, color=capture.BGR):
+        return self.score(frame, color) > self.threshold
+
+    def mark_reference(self):
+        # Called when a frame was actually sent to inference
+        self.reference = self.thumb
+
+
+class LandmarkInterpolator:
+    # Linear interpolation/extrapolation between the last two inferred
+    # results so skipped frames still get landmarks on a consistent
+    # timeline (keeps FallAnalyzer's head velocity physically meaningful).
+    def __init__(self, max_horizon=None):
+        self.max_horizon = max_horizon  # Seconds past the last keyframe to extrapolate
+        self.prev = None
+        self.last = None
+
+    def reset(self):
+        self.prev = None
+        self.last = None
+
+    def add(self, landmarks, timestamp):
+        if landmarks is None:
+            self.reset()
+            return
+        self.prev = self.last
+        self.last = (landmarks, timestamp)
+
+    def predict(self, timestamp):
+        if self.last is None:
+            return None
+        last, t1 = self.last
+        if self.prev is None or self.prev[0].shape != last.shape:
+            return last
+        prev, t0 = self.prev
+        if t1 <= t0:
+            return last
+
+        dt = timestamp - t1
+        if self.max_horizon is not None:
+            dt = min(dt, self.max_horizon)
+        alpha = dt / (t1 - t0)
+        out = last + (last - prev) * alpha
+        out[..., lmk.VISIBILITY:] = last[..., lmk.VISIBILITY:]  # Visibility/presence are not interpolated
+        return out
+
+
+class InferenceScheduler:
+    # Sits in front of PoseDetector and decides per frame whether to run the
+    # landmarker. Full rate while something moves or the analyzer is tracking
+    # a possible fall; otherwise a low idle rate on a downscaled frame, with
+    # interpolated landmarks for the frames in between.
+    def __init__(self, detector, analyzer=None, idle_fps=None, idle_scale=None, hold_seconds=None):
+        self.detector = detector
+        self.analyzer = analyzer
+        self.idle_interval = 1.0 / (idle_fps or Config.IDLE_INFERENCE_FPS)
+        self.idle_scale = idle_scale if idle_scale is not None else Config.IDLE_INFERENCE_SCALE
+        self.hold_seconds = hold_seconds if hold_seconds is not None else Config.MOTION_HOLD_SECONDS
+
+        self.gate = MotionGate()
+        self.interpolator = LandmarkInterpolator(max_horizon=self.idle_interval)
+        self.last_inference_time = None
+        self.last_motion_time = None
+        self.last_inferred = False  # Whether the latest result came from the model
+
+        # Counters for throughput reporting
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+        telemetry.callback("scheduler_frames_total", lambda: self.inferred_frames, "counter",
+                           "Frames seen by the adaptive scheduler", result="inferred")
+        telemetry.callback("scheduler_frames_total", lambda: self.skipped_frames, "counter",
+                           "Frames seen by the adaptive scheduler", result="skipped")
+
+    def _analyzer_active(self):
+        return self.analyzer is not None and self.analyzer.is_tracking_fall()
+
+    def plan(self, frame, timestamp, color=capture.BGR):
+        # Returns (run_inference, scale)
+        if self._analyzer_active():
+            return True, 1.0
+
+        if self.gate.moved(frame, color):
+            self.last_motion_time = timestamp
+        if self.last_motion_time is not None and timestamp - self.last_motion_time < self.hold_seconds:
+            return True, 1.0
+
+        due = self.last_inference_time is None or timestamp - self.last_inference_time >= self.idle_interval
+        return due, self.idle_scale
+
+    def _infer(self, frame, timestamp_ms, scale, find, color):
+        frame, color = capture.resize(frame, scale, color)
+        result = find(frame, timestamp_ms, color)
+        self.gate.mark_reference()
+        self.last_inference_time = timestamp_ms / 1000.0
+        self.inferred_frames += 1
+        self.last_inferred = True
+        return result
+
+    def find_pose(self, frame, timestamp_ms, color=capture.BGR):
+        timestamp = timestamp_ms / 1000.0
+        run, scale = self.plan(frame, timestamp, color)
+        if run:
+            landmarks = self._infer(frame, timestamp_ms, scale, self.detector.find_pose, color)
+            self.interpolator.add(landmarks, timestamp)
+            return landmarks
+
+        self.skipped_frames += 1
+        self.last_inferred = False
+        return self.interpolator.predict(timestamp)
+
+    def find_poses(self, frame, timestamp_ms, color=capture.BGR):
+        timestamp = timestamp_ms / 1000.0
+        run, scale = self.plan(frame, timestamp, color)
+        if run:
+            poses = self._infer(frame, timestamp_ms, scale, self.detector.find_poses, color)
+            self.interpolator.add(poses if len(poses) else None, timestamp)
+            return poses
+
+        self.skipped_frames += 1
+        self.last_inferred = False
+        poses = self.interpolator.predict(timestamp)
+        if poses is None:
+            return lmk.empty_frame((0,))
+        return poses
+
+    def inference_ratio(self):
+        total = self.inferred_frames + self.skipped_frames
+        return self.inferred_frames / total if total else 1.0
@@ -0,0 +1,301 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+import threading
+import time
+from collections import deque
+import numpy as np
+from config import Config
+import landmarks as lmk
+from detector import STATE_NAMES
+
+logger = logging.getLogger("StreamServer")
+
+# Live status + skeleton stream for dashboards (stdlib asyncio, no extra deps).
+#   GET /ws      WebSocket: binary frame messages + text (JSON) status events
+#   GET /events  Server-Sent Events: "status" events (JSON), "frame" events (base64 frame message)
+#   GET /status  JSON snapshot of every camera's latest status
+#
+# Frame message (little-endian): header FRAME_HEADER (camera id u16,
+# timestamp f64, status code u8, people u8, event id u32) followed by
+# lmk.pack() of the (people, 33, 5) landmarks.
+
+FRAME_HEADER = struct.Struct("<HdBBI")
+STATUS_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def encode_frame(camera_id, timestamp, status, landmarks, event_id=0):
+    frames = lmk.empty_frame((0,)) if landmarks is None else np.asarray(landmarks).reshape(-1, lmk.NUM_LANDMARKS, lmk.NUM_FIELDS)
+    header = FRAME_HEADER.pack(camera_id, timestamp, STATUS_CODES.get(status, 0), len(frames), event_id)
+    return header + lmk.pack(frames)
+
+
+def decode_frame(data):
+    # Returns (camera_id, timestamp, status, (people, 33, 5) landmarks, event_id)
+    camera_id, timestamp, status, people, event_id = FRAME_HEADER.unpack_from(data)
+    frames = lmk.unpack(memoryview(data)[FRAME_HEADER.size:], people)
+    return camera_id, timestamp, STATE_NAMES[status], frames, event_id
+
+
+def ws_message(payload, binary=True):
+    # Server -> client WebSocket frame (FIN set, unmasked)
+    opcode = 0x2 if binary else 0x1
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_ws_message(reader, limit):
+    # Client -> server WebSocket message: (opcode, payload). Continuation
+    # frames are joined; payloads are unmasked with numpy.
+    opcode, parts, size = None, [], 0
+    while True:
+        head = await reader.readexactly(2)
+        fin, frame_opcode, length = head[0] & 0x80, head[0] & 0x0F, head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        size += length
+        if size > limit:
+            raise ValueError(f"message of {size} bytes exceeds {limit}")
+        mask = await reader.readexactly(4) if head[1] & 0x80 else None
+        data = await reader.readexactly(length)
+        if mask is not None and length:
+            words = np.frombuffer(data, dtype=np.uint8)
+            data = (words ^ np.resize(np.frombuffer(mask, dtype=np.uint8), length)).tobytes()
+        if frame_opcode >= 0x8:
+            return frame_opcode, data  # Control frames are never fragmented
+        if opcode is None:
+            opcode = frame_opcode
+        parts.append(data)
+        if fin:
+            return opcode, b"".join(parts)
+
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+
+class StreamClient:
+    # Per-viewer outbox. Frames are latest-wins per camera (a slow viewer
+    # skips frames); status events are queued in order up to a backlog.
+    def __init__(self, writer, kind):
+        self.writer = writer
+        self.kind = kind  # "ws" or "sse"
+        self.frames = {}
+        self.events = deque(maxlen=Config.STREAM_EVENT_BACKLOG)
+        self.wakeup = asyncio.Event()
+        self.skipped = 0
+        self.closed = False
+
+
+class StreamServer:
+    # Runs an asyncio loop on a background thread. publish() is called from
+    # the detection side: it is a no-op without viewers, otherwise it encodes
+    # the frame once and hands the bytes to the loop, which fans them out.
+    # Each viewer has its own sender task, so a slow client only delays itself.
+    def __init__(self, host=None, port=None, cameras=None, fps=None):
+        self.host = host or Config.STREAM_HOST
+        self.port = port if port is not None else Config.STREAM_PORT
+        self.cameras = list(cameras or [])
+        self.min_interval = 1.0 / (fps or Config.STREAM_FPS)
+
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.clients = set()
+
+        # Publisher-side state (detection thread)
+        self.last_status = {}
+        self.last_sent = {}
+        # Latest status per camera, for /status and new viewers
+        self.snapshot = {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="stream-server", daemon=True)
+        self.thread.start()
+        self.ready.wait(timeout=5.0)
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Streaming on http://{self.host}:{self.port} (/ws, /events, /status)")
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for client in self.clients:
+                client.writer.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    def camera_name(self, camera_id):
+        return self.cameras[camera_id] if camera_id < len(self.cameras) else f"camera{camera_id}"
+
+    def publish(self, camera_id, timestamp, status, landmarks, event_id=0):
+        # Thread-safe. Status changes always go out; frames are rate-limited.
+        event = None
+        if self.last_status.get(camera_id) != status:
+            self.last_status[camera_id] = status
+            event = json.dumps({"type": "status", "camera": camera_id, "name": self.camera_name(camera_id),
+                                "status": status, "timestamp": timestamp, "event_id": int(event_id)})
+
+        payload = None
+        if self.clients:
+            now = time.monotonic()
+            if event is not None or now - self.last_sent.get(camera_id, 0.0) >= self.min_interval:
+                self.last_sent[camera_id] = now
+                payload = encode_frame(camera_id, timestamp, status, landmarks, int(event_id))
+
+        if event is not None or payload is not None:
+            self.loop.call_soon_threadsafe(self._fanout, camera_id, payload, event)
+
+    def _fanout(self, camera_id, payload, event):
+        # Loop thread: wrap once per transport, share the bytes with every client
+        if event is not None:
+            self.snapshot[camera_id] = event
+        if not self.clients:
+            return
+        kinds = {client.kind for client in self.clients}
+        messages = {}
+        if "ws" in kinds:
+            messages["ws"] = (ws_message(payload) if payload is not None else None,
+                              ws_message(event.encode(), binary=False) if event is not None else None)
+        if "sse" in kinds:
+            messages["sse"] = (sse_message("frame", base64.b64encode(payload).decode()) if payload is not None else None,
+                               sse_message("status", event) if event is not None else None)
+
+        for client in self.clients:
+            frame_message, event_message = messages[client.kind]
+            if event_message is not None:
+                client.events.append(event_message)
+            if frame_message is not None:
+                if camera_id in client.frames:
+                    client.skipped += 1
+                client.frames[camera_id] = frame_message
+            client.wakeup.set()
+
+    async def _send_loop(self, client):
+        while not client.closed:
+            await client.wakeup.wait()
+            client.wakeup.clear()
+            chunks = list(client.events) + list(client.frames.values())
+            client.events.clear()
+            client.frames.clear()
+            client.writer.write(b"".join(chunks))
+            # Only this client's task waits on a full socket buffer
+            await asyncio.wait_for(client.writer.drain(), Config.STREAM_SEND_TIMEOUT)
+
+    async def _read_ws(self, reader, client):
+        # Client -> server frames: only close/ping matter, so anything beyond
+        # a control frame's 125 bytes ends the connection
+        while True:
+            try:
+                opcode, data = await read_ws_message(reader, 125)
+            except ValueError as e:
+                logger.info(f"Dropped viewer: {e}")
+                client.writer.write(struct.pack("!BBH", 0x88, 2, 1009))  # Close: message too big
+                return
+            if opcode == 0x8:
+                client.writer.write(struct.pack("!BB", 0x88, 0))
+                return
+            if opcode == 0x9:
+                client.writer.write(struct.pack("!BB", 0x8A, len(data)) + data)
+
+    async def _read_eof(self, reader):
+        while await reader.read(1024):
+            pass
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10.0)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else "/"
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+
+        if path == "/status":
+            body = json.dumps({"cameras": [json.loads(e) for _, e in sorted(self.snapshot.items())],
+                               "viewers": len(self.clients)}).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: close\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            writer.close()
+            return
+
+        if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            kind = "ws"
+            accept = base64.b64encode(hashlib.sha1((headers.get("sec-websocket-key", "") + WS_GUID).encode()).digest())
+            writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                         b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        elif path == "/events":
+            kind = "sse"
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n")
+        else:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+
+        if len(self.clients) >= Config.STREAM_MAX_CLIENTS:
+            logger.warning("Viewer limit reached, rejecting connection.")
+            writer.close()
+            return
+
+        client = StreamClient(writer, kind)
+        # Current status of every camera first, so a new viewer is in sync
+        for _, event in sorted(self.snapshot.items()):
+            client.events.append(ws_message(event.encode(), binary=False) if kind == "ws" else sse_message("status", event))
+        client.wakeup.set()
+        self.clients.add(client)
+        logger.info(f"Viewer connected ({kind}), {len(self.clients)} total")
+
+        sender = asyncio.ensure_future(self._send_loop(client))
+        receiver = asyncio.ensure_future(self._read_ws(reader, client) if kind == "ws" else self._read_eof(reader))
+        try:
+            await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            pass  # Server shutting down
+        finally:
+            client.closed = True
+            self.clients.discard(client)
+            for task in (sender, receiver):
+                task.cancel()
+            if sender.done() and not sender.cancelled() and sender.exception() is not None:
+                logger.info(f"Dropped slow or broken viewer: {sender.exception()!r}")
+            writer.close()
+            logger.info(f"Viewer disconnected ({kind}, {client.skipped} frames skipped), {len(self.clients)} total")
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5.0)
+        self.thread = None
@@ -0,0 +1,188 @@
+import dataclasses
+import json
+import logging
+import math
+import os
+import threading
+from dataclasses import dataclass, field
+from config import Config
+
+logger = logging.getLogger("Settings")
+
+# Hot-reloadable analyzer thresholds with per-camera overrides.
+#
+# settings.json:
+#   {"defaults": {"drop_velocity_threshold": 0.3},
+#    "cameras": {"camera0": {"fall_angle_threshold": 40, "lying_down_duration": 2.0}}}
+#
+# Camera keys are "camera<N>": N is CAMERA_INDEX in main.py and the worker
+# index in supervisor.py. Missing keys fall back to config.py. Only values
+# an analyzer can swap between frames live here; model, smoothing window and
+# capture settings still need a restart.
+
+
+@dataclass(frozen=True)
+class AnalyzerSettings:
+    drop_velocity_threshold: float = Config.DROP_VELOCITY_THRESHOLD  # Head drop speed (normalized units/s)
+    fall_angle_threshold: float = Config.FALL_ANGLE_THRESHOLD  # Degrees; torso flatter than this is lying
+    lying_down_duration: float = Config.LYING_DOWN_DURATION  # Seconds lying to confirm a fall
+    fall_min_height: float = 0.4  # A drop only counts while the body is at least this tall
+    stand_min_height: float = 0.5  # Height that releases a confirmed fall (with a vertical torso)
+    sitting_timeout: float = 1.5  # Seconds after a drop still vertical = sat down
+    classifier_threshold: float = Config.CLASSIFIER_THRESHOLD
+    classifier_release_threshold: float = Config.CLASSIFIER_RELEASE_THRESHOLD
+    classifier_confirm_frames: int = Config.CLASSIFIER_CONFIRM_FRAMES
+
+    # Derived once per load, so analyze() compares without trigonometry:
+    # angle < threshold  <=>  |dy| < |dx| * tan(threshold)
+    fall_angle_tan: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        _check(self)
+        object.__setattr__(self, "fall_angle_tan", math.tan(math.radians(self.fall_angle_threshold)))
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+
+FIELDS = {f.name: f.type for f in dataclasses.fields(AnalyzerSettings) if f.init}
+
+# (field, minimum, maximum), inclusive
+RANGES = (
+    ("drop_velocity_threshold", 0.0, 100.0),
+    ("fall_angle_threshold", 1.0, 89.0),
+    ("lying_down_duration", 0.0, 600.0),
+    ("fall_min_height", 0.0, 2.0),
+    ("stand_min_height", 0.0, 2.0),
+    ("sitting_timeout", 0.0, 60.0),
+    ("classifier_threshold", 0.0, 1.0),
+    ("classifier_release_threshold", 0.0, 1.0),
+    ("classifier_confirm_frames", 1, 1000),
+)
+
+
+def _check(settings):
+    for name, low, high in RANGES:
+        value = getattr(settings, name)
+        numeric = int if FIELDS[name] is int else (int, float)
+        if isinstance(value, bool) or not isinstance(value, numeric):
+            raise ValueError(f"{name} must be {'an integer' if FIELDS[name] is int else 'a number'}, got {value!r}")
+        if not low <= value <= high:
+            raise ValueError(f"{name} must be within [{low}, {high}], got {value}")
+    if settings.classifier_release_threshold > settings.classifier_threshold:
+        raise ValueError("classifier_release_threshold must not exceed classifier_threshold")
+
+
+def _overrides(values, where):
+    if not isinstance(values, dict):
+        raise ValueError(f"{where}: expected an object")
+    unknown = sorted(set(values) - set(FIELDS))
+    if unknown:
+        raise ValueError(f"{where}: unknown setting(s) {', '.join(unknown)} (known: {', '.join(FIELDS)})")
+    return values
+
+
+def parse(document):
+    # {"defaults": {...}, "cameras": {name: {...}}} -> (defaults, {name: AnalyzerSettings})
+    # Raises ValueError naming the offending key if anything is invalid.
+    if not isinstance(document, dict):
+        raise ValueError("settings: expected an object")
+    unknown = sorted(set(document) - {"defaults", "cameras"})
+    if unknown:
+        raise ValueError(f"settings: unknown section(s) {', '.join(unknown)}")
+    values = _overrides(document.get("defaults", {}), "defaults")
+    try:
+        defaults = AnalyzerSettings(**values)
+    except ValueError as e:
+        raise ValueError(f"defaults: {e}") from None
+    sections = document.get("cameras", {})
+    if not isinstance(sections, dict):
+        raise ValueError("cameras: expected an object")
+    cameras = {}
+    for name, values in sections.items():
+        values = _overrides(values, f"cameras.{name}")
+        try:
+            cameras[name] = defaults.replace(**values)
+        except ValueError as e:
+            raise ValueError(f"cameras.{name}: {e}") from None
+    return defaults, cameras
+
+
+def load(path):
+    with open(path) as f:
+        return parse(json.load(f))
+
+
+class SettingsStore:
+    # Resolved settings per camera plus a watcher thread that polls the file's
+    # mtime. A changed file is parsed and validated as a whole; only if every
+    # section is valid are the new settings pushed to subscribers (otherwise
+    # the error is logged and the running values stay). Subscribers receive a
+    # frozen AnalyzerSettings and swap it in with one reference assignment,
+    # so a frame is always analyzed with either the old or the new set.
+    def __init__(self, path=None, poll_interval=None):
+        self.path = path if path is not None else Config.SETTINGS_PATH
+        self.poll_interval = poll_interval or Config.SETTINGS_POLL_INTERVAL
+        self.current = (AnalyzerSettings(), {})  # (defaults, per-camera), replaced as a whole
+        self.subscribers = {}  # camera -> [callback]
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.reload()
+
+    def get(self, camera=None):
+        defaults, cameras = self.current
+        return cameras.get(camera, defaults)
+
+    def subscribe(self, camera, callback):
+        # callback(AnalyzerSettings), called from the watcher thread
+        with self.lock:
+            self.subscribers.setdefault(camera, []).append(callback)
+
+    def reload(self):
+        # True if new settings were applied
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self.mtime is not None:
+                logger.warning(f"{self.path} removed; keeping the current settings")
+            return False
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        try:
+            defaults, cameras = load(self.path)
+        except (OSError, ValueError) as e:  # json.JSONDecodeError is a ValueError
+            logger.error(f"Invalid settings in {self.path}, keeping the current ones: {e}")
+            return False
+
+        with self.lock:
+            self.current = (defaults, cameras)
+            subscribers = {camera: list(callbacks) for camera, callbacks in self.subscribers.items()}
+        for camera, callbacks in subscribers.items():
+            resolved = self.get(camera)
+            for callback in callbacks:
+                callback(resolved)
+        logger.info(f"Loaded settings from {self.path} ({len(cameras)} camera override(s))")
+        return True
+
+    def start(self):
+        if self.path and self.thread is None:
+            self.thread = threading.Thread(target=self._watch, name="settings-watch", daemon=True)
+            self.thread.start()
+        return self
+
+    def _watch(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Settings reload failed: {e}")
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+from config import Config
+import telemetry
+
+logger = logging.getLogger("Startup")
+
+# Startup timeline and overlapped initialization:
+#   mark("camera opened")      records a milestone (seconds since this
+#                              module was imported, i.e. process start for
+#                              main.py, which imports it first)
+#   finish()                   marks the first analyzed frame and logs the
+#                              timeline once; later calls are free
+#   task = Task("model", fn)   runs fn on a background thread with
+#                              FAST_STARTUP (inline otherwise);
+#                              task.result() joins and re-raises
+
+_START = time.perf_counter()
+
+
+class StartupTimeline:
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.marks = []  # (seconds since start, label, thread name)
+        self.lock = threading.Lock()
+        self.done = False
+
+    def mark(self, label):
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            self.marks.append((elapsed, label, threading.current_thread().name))
+        return elapsed
+
+    def finish(self, label="first frame analyzed"):
+        if self.done:
+            return
+        self.done = True
+        self.mark(label)
+        with self.lock:
+            marks = sorted(self.marks)
+        lines = [f"{elapsed * 1000:8.0f} ms  {name}" + ("" if thread == "MainThread" else f"  [{thread}]")
+                 for elapsed, name, thread in marks]
+        logger.info("Startup timeline:\n" + "\n".join(lines))
+        for elapsed, name, _ in marks:
+            telemetry.callback("startup_seconds", lambda e=elapsed: e, "gauge",
+                               "Seconds from process start to each startup milestone", step=name)
+
+
+TIMELINE = StartupTimeline(_START)
+
+
+def mark(label):
+    return TIMELINE.mark(label)
+
+
+def finish(label="first frame analyzed"):
+    TIMELINE.finish(label)
+
+
+class Task:
+    def __init__(self, name, fn, *args, background=None):
+        background = Config.FAST_STARTUP if background is None else background
+        self.name = name
+        self.value = None
+        self.error = None
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(target=self._run, args=(fn, args), name=f"startup-{name}", daemon=True)
+            self.thread.start()
+        else:
+            self._run(fn, args)
+
+    def _run(self, fn, args):
+        try:
+            self.value = fn(*args)
+        except BaseException as e:
+            self.error = e
+
+    def result(self):
+        if self.thread is not None:
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
@@ -0,0 +1,437 @@
+import argparse
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from config import Config
+import landmarks as lmk
+import telemetry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("Supervisor")
+
+STATUS_CODES = {"NORMAL": 0, "POTENTIAL_FALL": 1, "FALL_DETECTED": 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+def parse_camera_source(source):
+    # "0" -> webcam index 0, anything else (RTSP URL, video file) is passed through
+    source = str(source).strip()
+    if source.isdigit():
+        return int(source)
+    return source
+
+
+def split_camera_spec(spec):
+    # "rtsp://cam/stream|full|classifier" -> ("rtsp://cam/stream", "full", "classifier").
+    # The optional model part selects the pose model tier for that camera,
+    # the optional engine part its analyzer ("heuristic" / "classifier").
+    source, *options = str(spec).split("|")
+    model = options[0].strip() if options else ""
+    engine = options[1].strip() if len(options) > 1 else ""
+    return parse_camera_source(source), model or None, engine or None
+
+
+def camera_sources_from_config():
+    if Config.CAMERA_SOURCES:
+        return [s.strip() for s in Config.CAMERA_SOURCES.split(",") if s.strip()]
+    return [str(Config.CAMERA_INDEX)]
+
+
+class LandmarkBoard:
+    # Shared-memory table holding the latest landmarks of every camera.
+    # One writer per row (the camera worker); readers use the per-row
+    # sequence number as a seqlock (odd = write in progress). The heartbeat
+    # column is stamped every loop iteration, frame or not, for the
+    # supervisor's stall check.
+    def __init__(self, num_cameras, name=None):
+        self.num_cameras = num_cameras
+        header_size = num_cameras * 8 * 4  # seq, timestamp, status, heartbeat
+        data_size = num_cameras * lmk.NUM_LANDMARKS * lmk.NUM_FIELDS * 4
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_size + data_size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        self.header = np.ndarray((num_cameras, 4), dtype=np.float64, buffer=self.shm.buf)
+        self.data = np.ndarray(
+            (num_cameras, lmk.NUM_LANDMARKS, lmk.NUM_FIELDS), dtype=lmk.DTYPE,
+            buffer=self.shm.buf, offset=header_size)
+        if self.owner:
+            self.header[:] = 0
+            self.data[:] = 0
+
+    def write(self, camera_id, landmarks, timestamp, status):
+        row = self.header[camera_id]
+        row[0] += 1  # odd: writing
+        if landmarks is None:
+            self.data[camera_id, :, lmk.VISIBILITY:] = 0  # no person: zero visibility/presence
+        else:
+            self.data[camera_id] = landmarks
+        row[1] = timestamp
+        row[2] = STATUS_CODES.get(status, 0)
+        row[0] += 1  # even: stable
+
+    def beat(self, camera_id, now=None):
+        self.header[camera_id, 3] = now if now is not None else time.time()
+
+    def heartbeat(self, camera_id):
+        return self.header[camera_id, 3]
+
+    def reset_row(self, camera_id):
+        # A worker killed mid-write leaves the seqlock odd; make it even again
+        # before a new worker takes the row over
+        if self.header[camera_id, 0] % 2:
+            self.header[camera_id, 0] += 1
+        self.beat(camera_id)
+
+    def read(self, camera_id, retries=10):
+        # Returns (landmarks copy, timestamp, status code) or None if the row kept changing
+        for _ in range(retries):
+            seq = self.header[camera_id, 0]
+            if seq % 2:
+                continue
+            landmarks = self.data[camera_id].copy()
+            timestamp, status = self.header[camera_id, 1], int(self.header[camera_id, 2])
+            if self.header[camera_id, 0] == seq:
+                return landmarks, timestamp, status
+        return None
+
+    def close(self):
+        # Drop the numpy views before releasing the mapping
+        self.header = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def camera_worker(camera_id, source, model, engine, board_name, num_cameras, events, stop_event):
+    # Runs in its own process: one VideoCapture, PoseDetector and FallAnalyzer
+    # per stream, so MediaPipe inference never contends for a shared GIL.
+    import cv2
+    from detector import PoseDetector, MultiPersonFallAnalyzer, create_analyzer
+    from settings import SettingsStore
+    from eventstore import EventStore
+    from archive import LandmarkArchive
+    from watchdog import ReconnectingCapture, StreamWatchdog
+
+    cv2.setNumThreads(1)  # One core per room; avoid oversubscribing the host
+    board = LandmarkBoard(num_cameras, name=board_name)
+    detector = PoseDetector(model=model)
+    # Each worker watches the settings file for its own "camera<N>" overrides
+    settings = SettingsStore()
+    # MAX_POSES > 1 tracks every resident of the room (see tracker.py)
+    analyzer = create_analyzer(engine, settings=settings.get(f"camera{camera_id}"))
+    multi_person = isinstance(analyzer, MultiPersonFallAnalyzer)
+    analyzer.report_angle = False  # Computed only for status events (torso_angle)
+    settings.subscribe(f"camera{camera_id}", analyzer.apply_settings)
+    settings.start()
+    # Transitions and landmark summaries go straight to the shared event
+    # history (SQLite WAL takes writers from several processes)
+    history = EventStore() if Config.EVENTS_DB else None
+    log = history.camera(f"camera{camera_id}") if history is not None else None
+    # Raw landmarks for long-term retention (per-camera files, see archive.py)
+    archive = LandmarkArchive() if Config.ARCHIVE_DIR else None
+    archive_log = archive.camera(f"camera{camera_id}") if archive is not None else None
+
+    # Live sources are reopened with backoff (the wait ends early on stop)
+    cap = ReconnectingCapture(source, stop_event=stop_event)
+
+    if not cap.isOpened() and cap.is_file:
+        events.put(("error", camera_id, time.time(), f"Could not open camera source {source!r}"))
+        settings.close()
+        if history is not None:
+            history.close()
+        return
+
+    def analyze(frame, timestamp_ms, color):
+        if multi_person:
+            poses = detector.find_poses(frame, timestamp_ms, color)
+            if archive_log is not None:
+                archive_log.add(poses[0] if len(poses) else None, timestamp_ms / 1000.0)
+            status, landmarks, _, velocity = analyzer.analyze(poses, timestamp_ms / 1000.0)
+            if landmarks is not None:
+                # The board holds one skeleton per camera: the most severe track's
+                landmarks = landmarks[int(np.argmax(analyzer.last_results[1]))]
+            return status, landmarks, velocity
+
+        landmarks = detector.find_pose(frame, timestamp_ms, color)
+        if archive_log is not None:
+            archive_log.add(landmarks, timestamp_ms / 1000.0)
+        status, velocity = "NORMAL", 0
+        if landmarks is not None:
+            status, landmarks, _, velocity = analyzer.analyze(landmarks, timestamp_ms / 1000.0)
+        return status, landmarks, velocity
+
+    def on_stall(name, kind, stalled):
+        events.put(("stall", camera_id, time.time(), (kind, stalled)))
+
+    watchdog = StreamWatchdog(f"camera{camera_id}", cap, detector, analyzer, on_stall).start()
+
+    events.put(("started", camera_id, time.time(), str(source)))
+    last_status = "NORMAL"
+    last_alert_event = 0
+    last_timestamp_ms = -1
+    crashed = False
+
+    try:
+        while not stop_event.is_set():
+            board.beat(camera_id)
+            success, frame = cap.read()
+            if not success:
+                if cap.ended:
+                    break  # End of recording
+                continue  # cap waits / reopens the stream
+
+            timestamp_ms = int(time.time() * 1000)
+            if timestamp_ms <= last_timestamp_ms:
+                timestamp_ms = last_timestamp_ms + 1
+            last_timestamp_ms = timestamp_ms
+
+            result = watchdog.process(frame, timestamp_ms, cap.color, analyze)
+            if result is None:
+                continue  # Shed by the load stage
+            status, landmarks, velocity = result
+            angle = 0
+
+            board.write(camera_id, landmarks, timestamp_ms / 1000.0, status)
+
+            if status != last_status:
+                angle = (analyzer.torso_angle() or 0) if landmarks is not None else 0
+                events.put(("status", camera_id, timestamp_ms / 1000.0, (status, velocity, angle)))
+                last_status = status
+            if log is not None:
+                log.update(timestamp_ms / 1000.0, status, landmarks, velocity, angle, analyzer.event_id)
+            if status == "FALL_DETECTED" and analyzer.event_id != last_alert_event:
+                # One alert per fall event, not per frame; the supervisor's
+                # Notifier still applies the alert cooldown
+                last_alert_event = analyzer.event_id
+                events.put(("alert", camera_id, timestamp_ms / 1000.0, status))
+    except Exception:
+        crashed = True  # The supervisor restarts the worker
+        raise
+    finally:
+        watchdog.close()
+        settings.close()
+        if history is not None:
+            history.close()
+        if archive is not None:
+            archive.close()
+        cap.release()
+        board.close()
+        if not crashed:
+            events.put(("stopped", camera_id, time.time(), None))
+
+
+class CameraSupervisor:
+    # Spawns one worker process per camera source and funnels their events
+    # into a single Notifier owned by this (parent) process.
+    def __init__(self, specs, names=None, notifier=None, stream=None, alarm=None):
+        # specs: camera sources, optionally suffixed with "|<model>"
+        parsed = [split_camera_spec(spec) for spec in specs]
+        self.sources = [source for source, _, _ in parsed]
+        self.models = [model for _, model, _ in parsed]
+        self.engines = [engine for _, _, engine in parsed]
+        self.names = names or [f"Camera {i + 1} ({s})" for i, s in enumerate(self.sources)]
+        self.ctx = mp.get_context("spawn")
+        self.events = self.ctx.Queue()
+        self.stop_event = self.ctx.Event()
+        self.board = LandmarkBoard(len(self.sources))
+        self.workers = {}
+        self.finished = set()
+        # Hung or crashed workers of live sources are restarted with backoff
+        self.restarts = {}    # camera_id -> consecutive restarts
+        self.restart_at = {}  # camera_id -> time of the pending restart
+        self.spawned_at = {}
+        self.status = {i: "NORMAL" for i in range(len(self.sources))}
+
+        if notifier is None:
+            from notifier import Notifier
+            notifier = Notifier()
+        self.notifier = notifier
+
+        # Optional local alarm (alarm.AlarmController), sounds for the worst camera
+        self.alarm = alarm
+
+        # Optional live stream (server.StreamServer) fed from the landmark board
+        self.stream = stream
+        self.stream_thread = None
+
+    def _spawn(self, camera_id):
+        self.board.reset_row(camera_id)  # Heartbeat starts now (model loading included)
+        self.spawned_at[camera_id] = time.time()
+        proc = self.ctx.Process(
+            target=camera_worker,
+            args=(camera_id, self.sources[camera_id], self.models[camera_id], self.engines[camera_id], self.board.name,
+                  len(self.sources), self.events, self.stop_event),
+            name=f"camera-{camera_id}",
+            daemon=True,
+        )
+        proc.start()
+        self.workers[camera_id] = proc
+
+    def start(self):
+        for camera_id in range(len(self.sources)):
+            self._spawn(camera_id)
+        logger.info(f"Started {len(self.sources)} camera workers.")
+        if self.stream is not None:
+            self.stream_thread = threading.Thread(target=self._stream_loop, name="board-stream", daemon=True)
+            self.stream_thread.start()
+
+    def latest(self, camera_id):
+        return self.board.read(camera_id)
+
+    def _stream_loop(self):
+        # Polls the board at the stream rate and publishes rows that changed
+        interval = 1.0 / Config.STREAM_FPS
+        last_seq = [0.0] * len(self.sources)
+        while not self.stop_event.is_set():
+            for camera_id in range(len(self.sources)):
+                seq = self.board.header[camera_id, 0]
+                if seq == last_seq[camera_id]:
+                    continue
+                row = self.board.read(camera_id)
+                if row is None:
+                    continue
+                last_seq[camera_id] = seq
+                landmarks, timestamp, status = row
+                if not landmarks[:, lmk.PRESENCE].any():
+                    landmarks = None  # Nobody in view
+                self.stream.publish(camera_id, timestamp, STATUS_NAMES.get(status, "NORMAL"), landmarks)
+            self.stop_event.wait(interval)
+
+    def handle_event(self, event):
+        kind, camera_id, timestamp, payload = event
+        name = self.names[camera_id]
+        if kind == "alert":
+            self.notifier.alert(payload, location=name, camera=f"camera{camera_id}")
+        elif kind == "status":
+            status, velocity, angle = payload
+            self.status[camera_id] = status
+            logger.info(f"{name}: {status} (velocity={velocity:.2f}, angle={angle:.0f})")
+            if self.alarm is not None:
+                self.alarm.update(max(self.status.values(), key=lambda s: STATUS_CODES.get(s, 0)))
+        elif kind == "error":
+            logger.error(f"{name}: {payload}")
+            self.finished.add(camera_id)
+        elif kind == "stopped":
+            self.finished.add(camera_id)
+            logger.info(f"{name}: worker stopped.")
+        elif kind == "started":
+            logger.info(f"{name}: streaming from {payload}")
+        elif kind == "stall":
+            stage, stalled = payload
+            if stalled:
+                self.notifier.alert(f"{stage.upper()}_STALLED", location=name, camera=f"camera{camera_id}")
+
+    def check_workers(self, now=None):
+        # Crashed workers never send "stopped"; hung ones stop stamping the
+        # heartbeat (e.g. a landmarker call that never returns). Both are
+        # restarted with backoff unless their source is a recording.
+        from watchdog import backoff_delay, is_file_source
+        now = now if now is not None else time.time()
+        for camera_id, proc in list(self.workers.items()):
+            if camera_id in self.finished:
+                continue
+            if camera_id in self.restart_at:
+                if now >= self.restart_at.pop(camera_id):
+                    self._spawn(camera_id)
+                continue
+
+            if not proc.is_alive():
+                reason = f"worker exited with code {proc.exitcode}"
+            elif now - self.board.heartbeat(camera_id) > Config.WORKER_STALL_SECONDS:
+                reason = f"worker stalled for {now - self.board.heartbeat(camera_id):.0f}s"
+                proc.terminate()
+                proc.join(timeout=5.0)
+            else:
+                continue
+
+            name = self.names[camera_id]
+            if is_file_source(self.sources[camera_id]):
+                logger.error(f"{name}: {reason}")
+                self.finished.add(camera_id)
+                continue
+            if now - self.spawned_at[camera_id] > 2 * Config.WORKER_STALL_SECONDS:
+                self.restarts[camera_id] = 0  # Ran fine for a while: start the backoff over
+            attempt = self.restarts.get(camera_id, 0)
+            self.restarts[camera_id] = attempt + 1
+            delay = backoff_delay(attempt)
+            logger.error(f"{name}: {reason}; restarting in {delay:.1f}s (restart {attempt + 1})")
+            telemetry.counter("worker_restarts_total", "Camera workers restarted after a crash or stall",
+                              camera=f"camera{camera_id}").inc()
+            self.restart_at[camera_id] = now + delay
+
+    def run(self):
+        self.start()
+        try:
+            while len(self.finished) < len(self.sources):
+                try:
+                    self.handle_event(self.events.get(timeout=1.0))
+                except queue.Empty:
+                    pass
+
+                self.check_workers()
+        except KeyboardInterrupt:
+            logger.info("Shutting down...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        for proc in self.workers.values():
+            proc.join(timeout=5.0)
+            if proc.is_alive():
+                proc.terminate()
+        if self.stream_thread is not None:
+            self.stream_thread.join()
+            self.stream.stop()
+        self.board.close()
+        if self.alarm is not None:
+            self.alarm.close()
+        self.notifier.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one fall detector process per camera.")
+    parser.add_argument("sources", nargs="*",
+                        help="Camera indices, RTSP URLs or video files, optionally suffixed with "
+                             "'|<model>[|<engine>]' (e.g. '0|heavy', '1||classifier'). Default: Config.CAMERA_SOURCES")
+    parser.add_argument("--stream-port", type=int, default=Config.STREAM_PORT,
+                        help="Serve live status/skeletons to dashboards on this port (0 = off)")
+    parser.add_argument("--alarm", default=Config.ALARM_OUTPUTS,
+                        help="Local alarm outputs, comma separated: tone, gpio, socket (empty = off)")
+    args = parser.parse_args()
+
+    specs = args.sources or camera_sources_from_config()
+    stream = None
+    if args.stream_port:
+        from server import StreamServer
+        stream = StreamServer(port=args.stream_port, cameras=[str(split_camera_spec(spec)[0]) for spec in specs]).start()
+    # Parent-process metrics (alert delivery); workers keep their own registries
+    from telemetry import Telemetry
+    telemetry = Telemetry()
+    alarm = None
+    if args.alarm:
+        from alarm import AlarmController, create_outputs
+        alarm = AlarmController(create_outputs([name.strip() for name in args.alarm.split(",") if name.strip()]))
+    # Alert outcomes join the workers' transitions in the event history
+    from notifier import Notifier
+    from eventstore import EventStore
+    history = EventStore() if Config.EVENTS_DB else None
+    try:
+        CameraSupervisor(specs, notifier=Notifier(history), stream=stream, alarm=alarm).run()
+    finally:
+        if history is not None:
+            history.close()
+        telemetry.close()
+
+
+if __name__ == "__main__":
+    main()
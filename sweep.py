@@ -0,0 +1,310 @@
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from collections import namedtuple
+import numpy as np
+from config import Config
+from detector import BatchFallAnalyzer, STATE_FALL_DETECTED
+from recorder import load_recording, LABEL_FALL, LABEL_NO_FALL
+from replay import find_recordings, reference_time
+import settings as settings_module
+from settings import AnalyzerSettings
+
+# Threshold sweep / auto-tuning over labeled landmark clips (see recorder.py).
+#   python sweep.py recordings/                          default grid
+#   python sweep.py recordings/ --grid fall_angle_threshold=30:60:5 --grid lying_down_duration=1,2,3
+#   python sweep.py recordings/ --camera camera2         write the pick to settings.json
+#
+# Every configuration x clip pair is one slot of a BatchFallAnalyzer with
+# its own thresholds, so one vectorized pass steps a whole chunk of
+# configurations through all clips in lockstep. Chunks (grouped by smoothing
+# window, which sizes the analyzer's buffers) run on a process pool.
+# Decisions are the same as replay.py / FallAnalyzer with boxcar smoothing.
+
+# Swept values when no --grid is given; everything else stays at the defaults
+DEFAULT_GRID = {
+    "drop_velocity_threshold": (0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6),
+    "fall_angle_threshold": (30, 35, 40, 45, 50, 55, 60),
+    "lying_down_duration": (0.5, 1.0, 1.5, 2.0, 2.5, 3.0),
+    "fall_min_height": (0.3, 0.4, 0.5),
+    "stand_min_height": (0.4, 0.5, 0.6),
+    "smoothing_window_size": (3, 5, 7),
+}
+WINDOW = "smoothing_window_size"  # Not an AnalyzerSettings field: needs a restart (Config)
+SLOTS_PER_CHUNK = 4096  # Configurations x clips per vectorized pass
+
+# (K, T, 33, 5) frames padded to the longest clip, with (K, T) timestamps and
+# presence; is_fall (K,) labels and reference (K,) times detection delay is
+# measured from (labeled fall time, else clip start)
+ClipSet = namedtuple("ClipSet", ["names", "frames", "timestamps", "present", "is_fall", "reference"])
+
+Result = namedtuple("Result", ["params", "tp", "fp", "fn", "tn", "precision", "recall", "f1", "delay"])
+
+
+def load_clips(files):
+    # Labeled clips only; anything else can't be scored
+    names, recordings = [], []
+    for path in files:
+        recording = load_recording(path)
+        if recording.label in (LABEL_FALL, LABEL_NO_FALL) and len(recording.frames):
+            names.append(os.path.basename(path))
+            recordings.append(recording)
+    if not recordings:
+        raise ValueError("No labeled clips (label 'fall' / 'no_fall') found.")
+
+    steps = max(len(r.frames) for r in recordings)
+    frames = np.zeros((len(recordings), steps) + recordings[0].frames.shape[1:], dtype=np.float32)
+    timestamps = np.zeros((len(recordings), steps))
+    present = np.zeros((len(recordings), steps), dtype=bool)
+    for i, r in enumerate(recordings):
+        frames[i, :len(r.frames)] = r.frames
+        timestamps[i, :len(r.frames)] = r.timestamps
+        present[i, :len(r.frames)] = r.present
+    is_fall = np.array([r.label == LABEL_FALL for r in recordings])
+    reference = np.array([reference_time(r) for r in recordings])
+    return ClipSet(names, frames, timestamps, present, is_fall, reference)
+
+
+def parse_values(spec):
+    # "0.2,0.3,0.5" or "start:stop:step" (stop included)
+    if ":" in spec:
+        start, stop, step = (float(v) for v in spec.split(":"))
+        if step <= 0:
+            raise ValueError(f"step must be positive: {spec}")
+        count = int(round((stop - start) / step)) + 1
+        return tuple(round(start + i * step, 6) for i in range(max(count, 0)))
+    return tuple(float(v) for v in spec.split(","))
+
+
+def parse_grid(specs):
+    # ["name=values", ...] -> {name: values}; unknown names are errors
+    if not specs:
+        return dict(DEFAULT_GRID)
+    known = set(settings_module.FIELDS) | {WINDOW}
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name not in known:
+            raise ValueError(f"Unknown parameter {name!r} (known: {', '.join(sorted(known))})")
+        grid[name] = parse_values(values)
+    return grid
+
+
+def expand(grid):
+    # Every combination as a params dict. Integer fields are cast; invalid
+    # combinations (see settings.RANGES) are dropped.
+    names = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[n] for n in names)):
+        params = dict(zip(names, values))
+        for name, value in params.items():
+            if name == WINDOW or settings_module.FIELDS[name] is int:
+                params[name] = int(value)
+        try:
+            AnalyzerSettings(**{k: v for k, v in params.items() if k != WINDOW})
+        except ValueError:
+            continue
+        configs.append(params)
+    return configs
+
+
+def evaluate(clips, window_size, configs):
+    # First FALL_DETECTED time of every (configuration, clip), (C, K), NaN =
+    # never. Slot c * K + k runs configuration c on clip k. Smoothing does
+    # not depend on the thresholds: each clip is smoothed once per step and
+    # the result is shared by every configuration's state machine.
+    c, k = len(configs), len(clips.names)
+    settings = [AnalyzerSettings(**{n: v for n, v in p.items() if n != WINDOW}) for p in configs]
+    smoother = BatchFallAnalyzer(capacity=k, window_size=window_size)
+    analyzer = BatchFallAnalyzer(capacity=c * k, window_size=1)  # Only step() is used
+    analyzer.report_angle = False
+    analyzer.set_slot_settings(np.arange(c * k), [s for s in settings for _ in range(k)])
+
+    detected = np.full(c * k, np.nan)
+    offsets = (np.arange(c) * k)[:, None]
+    for step in range(clips.frames.shape[1]):
+        active = np.flatnonzero(clips.present[:, step])
+        if len(active) == 0:
+            continue
+        slots = (offsets + active).ravel()
+        smoothed = smoother.smooth(active, clips.frames[active, step])
+        frames = np.broadcast_to(smoothed, (c,) + smoothed.shape).reshape((-1,) + smoothed.shape[1:])
+        timestamps = np.tile(clips.timestamps[active, step], c)
+        codes, _, _, _ = analyzer.step(slots, frames, timestamps)
+        hit = (codes == STATE_FALL_DETECTED) & np.isnan(detected[slots])
+        detected[slots[hit]] = timestamps[hit]
+    return detected.reshape(c, k)
+
+
+def score(clips, configs, detected):
+    # Per-configuration confusion counts, precision/recall/F1 and the mean
+    # delay of true detections (NaN if it found no fall)
+    hits = ~np.isnan(detected)
+    tp = (hits & clips.is_fall).sum(axis=1)
+    fp = (hits & ~clips.is_fall).sum(axis=1)
+    fn = (~hits & clips.is_fall).sum(axis=1)
+    tn = (~hits & ~clips.is_fall).sum(axis=1)
+    precision = tp / np.maximum(tp + fp, 1)
+    recall = tp / np.maximum(tp + fn, 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    delays = np.where(hits & clips.is_fall, detected - clips.reference, 0.0)
+    delay = np.where(tp > 0, delays.sum(axis=1) / np.maximum(tp, 1), np.nan)
+    return [Result(p, *row) for p, row in zip(configs, zip(
+        tp.tolist(), fp.tolist(), fn.tolist(), tn.tolist(),
+        precision.tolist(), recall.tolist(), f1.tolist(), delay.tolist()))]
+
+
+def pareto_front(results):
+    # Indices not dominated on (precision up, recall up, delay down); a
+    # configuration without a true detection counts as infinitely late
+    points = np.array([(r.precision, r.recall, -(r.delay if r.delay == r.delay else np.inf)) for r in results])
+    front = []
+    for start in range(0, len(points), 1024):
+        block = points[start:start + 1024, None, :]
+        no_worse = (points[None, :, :] >= block).all(axis=2)
+        better = (points[None, :, :] > block).any(axis=2)
+        dominated = (no_worse & better).any(axis=1)
+        front.extend((start + np.flatnonzero(~dominated)).tolist())
+    return front
+
+
+def best(results, indices, min_precision=0.0):
+    # Highest F1 (then lowest delay) among `indices` reaching min_precision
+    eligible = [i for i in indices if results[i].precision >= min_precision and results[i].tp > 0]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda i: (-results[i].f1, results[i].delay))
+
+
+_CLIPS = None  # Per pool worker, set once by _init_worker
+
+
+def _init_worker(clips):
+    global _CLIPS
+    _CLIPS = clips
+
+
+def _run_chunk(job):
+    window_size, indices, configs = job
+    return indices, evaluate(_CLIPS, window_size, configs)
+
+
+def sweep(clips, configs, workers=None, chunk=None):
+    # Results in the order of `configs`
+    chunk = chunk or max(1, SLOTS_PER_CHUNK // len(clips.names))
+    windows = {}
+    for i, params in enumerate(configs):
+        windows.setdefault(params.get(WINDOW, Config.SMOOTHING_WINDOW_SIZE), []).append(i)
+    jobs = []
+    for window, indices in windows.items():
+        for start in range(0, len(indices), chunk):
+            part = indices[start:start + chunk]
+            jobs.append((window, part, [configs[i] for i in part]))
+
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if workers == 1 or len(jobs) == 1:
+        _init_worker(clips)
+        outputs = map(_run_chunk, jobs)
+    else:
+        pool = mp.get_context("spawn").Pool(min(workers, len(jobs)), initializer=_init_worker, initargs=(clips,))
+        outputs = pool.imap_unordered(_run_chunk, jobs)
+    results = [None] * len(configs)
+    try:
+        for indices, detected in outputs:
+            for i, result in zip(indices, score(clips, [configs[i] for i in indices], detected)):
+                results[i] = result
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+
+def write_camera_settings(path, camera, params):
+    # Merges the picked thresholds into the camera's section of settings.json
+    # (validated as a whole, replaced atomically; running detectors reload it)
+    document = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            document = json.load(f)
+    document.setdefault("cameras", {})[camera] = {k: v for k, v in params.items() if k != WINDOW}
+    settings_module.parse(document)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def describe(params):
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep fall analyzer thresholds over labeled landmark clips.")
+    parser.add_argument("paths", nargs="+", help=".npz recordings, globs or directories")
+    parser.add_argument("--grid", action="append", metavar="NAME=VALUES",
+                        help="Values to sweep: a,b,c or start:stop:step (repeatable; default: built-in grid)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk", type=int, default=None, help="Configurations per vectorized pass")
+    parser.add_argument("--top", type=int, default=15, help="Pareto configurations to print")
+    parser.add_argument("--min-precision", type=float, default=0.0, help="Only pick configurations at least this precise")
+    parser.add_argument("--output", help="Write every result as JSON")
+    parser.add_argument("--camera", help="Write the pick as this camera's overrides, e.g. camera0")
+    parser.add_argument("--settings", default=Config.SETTINGS_PATH or "settings.json", help="settings.json to update")
+    args = parser.parse_args()
+
+    try:
+        grid = parse_grid(args.grid)
+        clips = load_clips(find_recordings(args.paths))
+    except ValueError as e:
+        parser.error(str(e))
+    configs = expand(grid)
+    if not configs:
+        parser.error("The grid has no valid configuration.")
+
+    present = int(clips.present.sum())
+    print(f"{len(configs)} configurations x {len(clips.names)} clips ({int(clips.is_fall.sum())} falls, "
+          f"{present} frames per configuration)")
+    start = time.perf_counter()
+    results = sweep(clips, configs, args.workers, args.chunk)
+    elapsed = time.perf_counter() - start
+    print(f"Swept in {elapsed:.1f}s -> {len(configs) * present / max(elapsed, 1e-9):,.0f} analyzed frames/sec")
+
+    front = pareto_front(results)
+    ranked = sorted(front, key=lambda i: (-results[i].f1, results[i].delay))
+    print(f"\nPareto front: {len(front)} configurations (precision, recall, delay)")
+    print(f"{'precision':>9} {'recall':>6} {'f1':>5} {'delay':>6}  parameters")
+    for i in ranked[:args.top]:
+        r = results[i]
+        delay = f"{r.delay:.2f}s" if r.delay == r.delay else "-"
+        print(f"{r.precision:9.2f} {r.recall:6.2f} {r.f1:5.2f} {delay:>6}  {describe(r.params)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            on_front = set(front)
+            rows = [dict(r._asdict(), delay=r.delay if r.delay == r.delay else None, pareto=i in on_front)
+                    for i, r in enumerate(results)]
+            json.dump(rows, f, indent=1)
+        print(f"\nWrote {len(results)} results to {args.output}")
+
+    pick = best(results, front, args.min_precision)
+    if pick is None:
+        print(f"\nNo configuration detects a fall with precision >= {args.min_precision}.")
+        return
+    chosen = results[pick].params
+    print(f"\nPick: {describe(chosen)}")
+    if args.camera:
+        write_camera_settings(args.settings, args.camera, chosen)
+        print(f"Wrote {args.camera} overrides to {args.settings}")
+        window = chosen.get(WINDOW, Config.SMOOTHING_WINDOW_SIZE)
+        if window != Config.SMOOTHING_WINDOW_SIZE:
+            print(f"Note: smoothing window {window} is not hot-reloadable; set SMOOTHING_WINDOW_SIZE in config.py.")
+
+
+if __name__ == "__main__":
+    main()
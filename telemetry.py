@@ -0,0 +1,317 @@
+import functools
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+
+logger = logging.getLogger("Telemetry")
+
+
+class Histogram:
+    # HDR-style log-linear histogram: each power of two is split into
+    # SUB_BUCKETS linear buckets, so any recorded value is known to within
+    # ~1/SUB_BUCKETS relative error at a fixed memory cost. record() is a
+    # frexp plus one list increment.
+    SUB_BUCKETS = 32
+
+    def __init__(self, lowest=1e-6, highest=1e3):
+        self.lowest = lowest
+        self.octaves = int(math.ceil(math.log2(highest / lowest))) + 1
+        self.counts = [0] * (self.octaves * self.SUB_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def _index(self, value):
+        if value <= self.lowest:
+            return 0
+        mantissa, exponent = math.frexp(value / self.lowest)  # mantissa in [0.5, 1)
+        index = exponent * self.SUB_BUCKETS + int(mantissa * 2 * self.SUB_BUCKETS) - 2 * self.SUB_BUCKETS
+        return min(index, len(self.counts) - 1)
+
+    def _value(self, index):
+        # Upper edge of a bucket
+        exponent, sub = divmod(index, self.SUB_BUCKETS)
+        return self.lowest * 2.0 ** exponent * (1.0 + (sub + 1) / self.SUB_BUCKETS)
+
+    def record(self, value):
+        index = self._index(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentiles(self, quantiles):
+        with self.lock:
+            counts, total, largest = list(self.counts), self.count, self.max
+        if not total:
+            return [0.0] * len(quantiles)
+        results = []
+        for q in quantiles:
+            target = max(1, int(math.ceil(q * total)))
+            seen = 0
+            for index, n in enumerate(counts):
+                seen += n
+                if seen >= target:
+                    results.append(min(self._value(index), largest))
+                    break
+        return results
+
+    def snapshot(self, quantiles=(0.5, 0.9, 0.99)):
+        values = self.percentiles(quantiles)
+        with self.lock:
+            count, total, largest = self.count, self.sum, self.max
+        return {"count": count, "sum": total, "max": largest,
+                "mean": total / count if count else 0.0,
+                "quantiles": dict(zip((str(q) for q in quantiles), values))}
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Registry:
+    # Metrics keyed by (name, sorted labels). Callbacks expose values that
+    # already live elsewhere (queue drop counts, stage frame counts) without
+    # adding work to the hot path.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.help = {}
+
+    def _get(self, kind, name, labels, factory, help_text):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = (kind, factory())
+                    self.metrics[key] = metric
+                    if help_text:
+                        self.help[name] = help_text
+        return metric[1]
+
+    def histogram(self, name, help_text="", **labels):
+        return self._get("summary", name, labels, Histogram, help_text)
+
+    def counter(self, name, help_text="", **labels):
+        return self._get("counter", name, labels, Counter, help_text)
+
+    def callback(self, name, fn, kind="gauge", help_text="", **labels):
+        # fn() -> number, evaluated at scrape/dump time
+        with self.lock:
+            self.metrics[(name, tuple(sorted(labels.items())))] = (kind, fn)
+            if help_text:
+                self.help[name] = help_text
+
+    def collect(self):
+        # [(name, kind, labels, value)], value is a number or a histogram snapshot
+        with self.lock:
+            items = list(self.metrics.items())
+        rows = []
+        for (name, labels), (kind, metric) in sorted(items, key=lambda item: item[0]):
+            try:
+                if isinstance(metric, Histogram):
+                    value = metric.snapshot()
+                elif isinstance(metric, Counter):
+                    value = metric.value
+                else:
+                    value = float(metric())
+            except Exception as e:
+                logger.debug(f"Metric {name} failed: {e}")
+                continue
+            rows.append((name, kind, dict(labels), value))
+        return rows
+
+    def to_prometheus(self):
+        lines = []
+        typed = set()
+        for name, kind, labels, value in self.collect():
+            if name not in typed:
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+            if kind == "summary":
+                for q, v in value["quantiles"].items():
+                    lines.append(f"{name}{_labels(labels, quantile=q)} {v:.9g}")
+                lines.append(f"{name}_sum{_labels(labels)} {value['sum']:.9g}")
+                lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return {"time": time.time(),
+                "metrics": [{"name": name, "type": kind, "labels": labels, "value": value}
+                            for name, kind, labels, value in self.collect()]}
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+REGISTRY = Registry()
+
+
+def histogram(name, help_text="", **labels):
+    return REGISTRY.histogram(name, help_text, **labels)
+
+
+def counter(name, help_text="", **labels):
+    return REGISTRY.counter(name, help_text, **labels)
+
+
+def callback(name, fn, kind="gauge", help_text="", **labels):
+    REGISTRY.callback(name, fn, kind, help_text, **labels)
+
+
+def timed(name, help_text="", **labels):
+    # Decorator: records the wall time of every call into a histogram.
+    # With METRICS_ENABLED off the function is returned untouched.
+    def decorator(fn):
+        if not Config.METRICS_ENABLED:
+            return fn
+        hist = histogram(name, help_text, **labels)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.record(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body, content_type = REGISTRY.to_prometheus().encode(), "text/plain; version=0.0.4"
+        elif path == "/metrics.json":
+            body, content_type = json.dumps(REGISTRY.to_json()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the log
+
+
+class JsonDumper:
+    # Periodically writes the registry to a JSON file (atomic replace)
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+        self.thread.start()
+
+    def dump(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(REGISTRY.to_json(), f)
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.dump()
+            except Exception as e:
+                logger.error(f"Failed to write metrics to {self.path}: {e}")
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.dump()
+
+
+class SamplingProfiler:
+    # Low-rate statistical profiler: samples every thread's Python stack via
+    # sys._current_frames() and counts folded stacks ("a;b;c N" lines, the
+    # input format of flamegraph.pl / speedscope).
+    def __init__(self, path, interval=None):
+        self.path = path
+        self.interval = interval or Config.PROFILE_INTERVAL
+        self.stacks = StackCounter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        with open(self.path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote {self.samples} profile samples to {self.path}")
+
+
+class Telemetry:
+    # Starts whatever the config asks for: HTTP endpoint, JSON dump, profiler
+    def __init__(self, port=None, dump_path=None, profile_path=None):
+        port = Config.METRICS_PORT if port is None else port
+        dump_path = dump_path if dump_path is not None else Config.METRICS_DUMP_PATH
+        profile_path = profile_path if profile_path is not None else Config.PROFILE_PATH
+
+        self.http = None
+        if port and Config.METRICS_ENABLED:
+            self.http = ThreadingHTTPServer((Config.METRICS_HOST, port), MetricsHandler)
+            threading.Thread(target=self.http.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Metrics on http://{Config.METRICS_HOST}:{self.http.server_address[1]}/metrics")
+        self.dumper = JsonDumper(dump_path, Config.METRICS_DUMP_INTERVAL) if dump_path and Config.METRICS_ENABLED else None
+        self.profiler = SamplingProfiler(profile_path) if profile_path else None
+
+    def close(self):
+        if self.http is not None:
+            self.http.shutdown()
+            self.http.server_close()
+        if self.dumper is not None:
+            self.dumper.close()
+        if self.profiler is not None:
+            self.profiler.close()
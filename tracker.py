@@ -0,0 +1,102 @@
+import numpy as np
+from config import Config
+import landmarks as lmk
+
+
+def box_iou(a, b):
+    # IoU matrix between (N, 4) and (M, 4) x_min, y_min, x_max, y_max boxes
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_match(score, threshold, higher_is_better=True):
+    # Greedy one-to-one assignment on a (poses, tracks) score matrix.
+    # Good enough for the handful of people in one room.
+    matches = []
+    if score.size == 0:
+        return matches
+    order = np.argsort(-score if higher_is_better else score, axis=None)
+    used_rows, used_cols = set(), set()
+    for flat in order:
+        row, col = divmod(int(flat), score.shape[1])
+        value = score[row, col]
+        if (value < threshold) if higher_is_better else (value > threshold):
+            break
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matches.append((row, col))
+    return matches
+
+
+class PoseTracker:
+    # Lightweight track-ID association for multi-person scenes: IoU on the
+    # landmark bounding boxes first, then centroid distance for poses whose
+    # boxes no longer overlap (fast movement, e.g. a fall). Every live track
+    # owns a fixed slot so per-track state can live in preallocated arrays.
+    def __init__(self, max_tracks=None, iou_threshold=None, max_distance=None, max_missed=None):
+        self.max_tracks = max_tracks or Config.MAX_TRACKS
+        self.iou_threshold = iou_threshold if iou_threshold is not None else Config.TRACK_IOU_THRESHOLD
+        self.max_distance = max_distance if max_distance is not None else Config.TRACK_MAX_DISTANCE
+        self.max_missed = max_missed if max_missed is not None else Config.TRACK_MAX_MISSED
+
+        self.track_ids = np.full(self.max_tracks, -1, dtype=np.int64)  # -1 = free slot
+        self.boxes = np.zeros((self.max_tracks, 4), dtype=np.float32)
+        self.missed = np.zeros(self.max_tracks, dtype=np.int32)
+        self.next_id = 0
+
+    def update(self, poses):
+        # poses: (N, 33, 5). Returns (slots, released) where slots[i] is the
+        # slot of pose i (-1 if there was no free slot) and released lists
+        # slots whose tracks were dropped this frame.
+        num_poses = len(poses)
+        slots = np.full(num_poses, -1, dtype=np.int64)
+        live = np.flatnonzero(self.track_ids >= 0)
+
+        boxes = lmk.bounding_box(poses) if num_poses else np.zeros((0, 4), dtype=np.float32)
+
+        if num_poses and len(live):
+            iou_matches = greedy_match(box_iou(boxes, self.boxes[live]), self.iou_threshold)
+            for row, col in iou_matches:
+                slots[row] = live[col]
+
+            # Centroid fallback for what IoU could not pair
+            rows = np.flatnonzero(slots < 0)
+            cols = np.setdiff1d(np.arange(len(live)), [col for _, col in iou_matches])
+            if len(rows) and len(cols):
+                centers = (boxes[rows, :2] + boxes[rows, 2:]) * 0.5
+                track_centers = (self.boxes[live[cols], :2] + self.boxes[live[cols], 2:]) * 0.5
+                dist = np.linalg.norm(centers[:, None] - track_centers[None], axis=-1)
+                for row, col in greedy_match(dist, self.max_distance, higher_is_better=False):
+                    slots[rows[row]] = live[cols[col]]
+
+        # New tracks for unmatched poses
+        free = list(np.flatnonzero(self.track_ids < 0))
+        for i in np.flatnonzero(slots < 0):
+            if not free:
+                break
+            slot = free.pop(0)
+            self.track_ids[slot] = self.next_id
+            self.next_id += 1
+            slots[i] = slot
+
+        matched = slots[slots >= 0]
+        self.boxes[matched] = boxes[slots >= 0]
+        self.missed[matched] = 0
+
+        # Age out tracks that were not seen
+        unseen = np.setdiff1d(np.flatnonzero(self.track_ids >= 0), matched)
+        self.missed[unseen] += 1
+        released = unseen[self.missed[unseen] > self.max_missed]
+        self.track_ids[released] = -1
+        self.missed[released] = 0
+
+        return slots, released
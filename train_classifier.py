@@ -0,0 +1,180 @@
+import argparse
+import os
+import time
+import numpy as np
+from config import Config
+from detector import FallAnalyzer, LandmarkSmoother
+from classifier import FeatureWindow, TreeEnsemble, FEATURE_NAMES
+from recorder import load_recording, LABEL_FALL, LABEL_NO_FALL
+from replay import find_recordings
+
+# Trains the ClassifierAnalyzer model from labeled landmark recordings
+# (recorder.py clips with a label, incident .npz files).
+#   python train_classifier.py recordings/ incidents/ --out fall_classifier.npz
+#
+# Frames of "no_fall" clips are negatives. In "fall" clips, frames from
+# fall_time - lead onwards are positives; fall_time comes from the clip's
+# metadata, or from where the heuristic FallAnalyzer first fires.
+
+
+def clip_features(recording, window):
+    # (N, features) window vectors and their timestamps, computed exactly as
+    # ClassifierAnalyzer does online
+    smoother = LandmarkSmoother(window_size=Config.SMOOTHING_WINDOW_SIZE, mode=Config.SMOOTHING_MODE)
+    features = FeatureWindow(window)
+    rows, times = [], []
+    for frame, timestamp, present in zip(recording.frames, recording.timestamps.tolist(), recording.present.tolist()):
+        if not present:
+            continue
+        smoother.smooth(frame, timestamp)
+        features.add(smoother.frame, timestamp)
+        if features.ready:
+            rows.append(features.vector().copy())
+            times.append(timestamp)
+    return np.array(rows, dtype=np.float32).reshape(-1, len(FEATURE_NAMES)), np.array(times)
+
+
+def fall_time(recording):
+    if "fall_time" in recording.meta:
+        return float(recording.meta["fall_time"])
+    analyzer = FallAnalyzer()
+    for frame, timestamp, present in zip(recording.frames, recording.timestamps.tolist(), recording.present.tolist()):
+        if present and analyzer.analyze(frame, timestamp)[0] == "FALL_DETECTED":
+            return timestamp
+    return None
+
+
+def build_dataset(files, window, lead):
+    X, y, groups = [], [], []
+    for i, path in enumerate(files):
+        recording = load_recording(path)
+        if recording.label not in (LABEL_FALL, LABEL_NO_FALL):
+            continue
+        rows, times = clip_features(recording, window)
+        labels = np.zeros(len(rows), dtype=np.float32)
+        if recording.label == LABEL_FALL:
+            start = fall_time(recording)
+            if start is None:
+                print(f"Skipping {os.path.basename(path)}: labeled fall but no fall_time and no detection")
+                continue
+            labels[times >= start - lead] = 1.0
+        X.append(rows)
+        y.append(labels)
+        groups.append(np.full(len(rows), i))
+    if not X:
+        return np.zeros((0, len(FEATURE_NAMES)), np.float32), np.zeros(0, np.float32), np.zeros(0, int)
+    return np.concatenate(X), np.concatenate(y), np.concatenate(groups)
+
+
+def train_gbdt(X, y, trees=100, depth=3, learning_rate=0.1, bins=32, l2=1.0, min_hessian=1.0):
+    # Histogram gradient boosting for log-loss with complete trees of fixed
+    # depth (see TreeEnsemble). Splits are searched over per-feature quantile
+    # bins; a node without a useful split sends everything left.
+    n, f = X.shape
+    edges = np.quantile(X, np.linspace(0, 1, bins + 1)[1:-1], axis=0).T.astype(np.float32)  # (f, bins-1)
+    binned = np.empty((n, f), dtype=np.int64)
+    for j in range(f):
+        binned[:, j] = np.searchsorted(edges[j], X[:, j], side="left")
+
+    internal = 2 ** depth - 1
+    feature = np.zeros((trees, internal), dtype=np.int32)
+    threshold = np.full((trees, internal), np.inf, dtype=np.float32)
+    value = np.zeros((trees, 2 * internal + 1), dtype=np.float32)
+
+    prior = np.clip(y.mean(), 1e-6, 1 - 1e-6)
+    base_score = float(np.log(prior / (1 - prior)))
+    raw = np.full(n, base_score)
+    offsets = np.arange(f) * bins
+
+    for t in range(trees):
+        p = 1.0 / (1.0 + np.exp(-raw))
+        g, h = p - y, np.maximum(p * (1 - p), 1e-6)
+        node = np.zeros(n, dtype=np.int64)
+        for level in range(depth):
+            first = 2 ** level - 1
+            count = 2 ** level
+            local = node - first
+            index = (local[:, None] * f * bins + offsets + binned).ravel()
+            G = np.bincount(index, np.repeat(g, f), count * f * bins).reshape(count, f, bins)
+            H = np.bincount(index, np.repeat(h, f), count * f * bins).reshape(count, f, bins)
+            GL, HL = G.cumsum(axis=2)[:, :, :-1], H.cumsum(axis=2)[:, :, :-1]
+            Gt, Ht = G.sum(axis=(1, 2))[:, None, None], H.sum(axis=(1, 2))[:, None, None]
+            GR, HR = Gt - GL, Ht - HL
+            gain = GL ** 2 / (HL + l2) + GR ** 2 / (HR + l2) - Gt ** 2 / (Ht + l2)
+            gain[(HL < min_hessian) | (HR < min_hessian)] = 0.0
+            for k in range(count):
+                j, b = np.unravel_index(np.argmax(gain[k]), gain[k].shape)
+                if gain[k, j, b] > 1e-9:
+                    feature[t, first + k] = j
+                    threshold[t, first + k] = edges[j, b]
+            right = X[np.arange(n), feature[t, node]] > threshold[t, node]
+            node = 2 * node + 1 + right
+
+        leaves = 2 ** depth - 1
+        G = np.bincount(node - leaves, g, leaves + 1)
+        H = np.bincount(node - leaves, h, leaves + 1)
+        value[t, leaves:] = -learning_rate * G / (H + l2)
+        raw += value[t, node]
+
+    return feature, threshold, value, base_score
+
+
+def report(name, model, X, y, threshold):
+    if not len(X):
+        return
+    p = 1.0 / (1.0 + np.exp(-model.raw_scores(X)))
+    predicted = p >= threshold
+    tp = int((predicted & (y == 1)).sum())
+    fp = int((predicted & (y == 0)).sum())
+    fn = int((~predicted & (y == 1)).sum())
+    precision = tp / max(tp + fp, 1)
+    recall = tp / max(tp + fn, 1)
+    print(f"{name}: {len(X)} frames, {int(y.sum())} positive  precision={precision:.3f} recall={recall:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the windowed fall classifier from labeled recordings.")
+    parser.add_argument("paths", nargs="+", help=".npz recordings, globs or directories")
+    parser.add_argument("--out", default=Config.CLASSIFIER_MODEL, help="Output model file (.npz)")
+    parser.add_argument("--window", type=int, default=Config.CLASSIFIER_WINDOW, help="Frames per feature window")
+    parser.add_argument("--lead", type=float, default=0.0, help="Seconds before fall_time labeled positive")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--validation", type=float, default=0.2, help="Fraction of clips held out")
+    args = parser.parse_args()
+
+    files = find_recordings(args.paths)
+    X, y, groups = build_dataset(files, args.window, args.lead)
+    if not len(X) or y.min() == y.max():
+        print("Need labeled frames of both classes (fall and no_fall clips).")
+        return
+
+    rng = np.random.default_rng(0)
+    clips = np.unique(groups)
+    held_out = rng.choice(clips, int(len(clips) * args.validation), replace=False) if len(clips) > 1 else []
+    validation = np.isin(groups, held_out)
+
+    start = time.perf_counter()
+    feature, threshold, value, base_score = train_gbdt(
+        X[~validation], y[~validation], args.trees, args.depth, args.learning_rate)
+    print(f"Trained {args.trees} trees (depth {args.depth}) on {int((~validation).sum())} frames "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    model = TreeEnsemble(feature, threshold, value, base_score, args.window)
+    report("train", model, X[~validation], y[~validation], Config.CLASSIFIER_THRESHOLD)
+    report("validation", model, X[validation], y[validation], Config.CLASSIFIER_THRESHOLD)
+
+    runs = 2000
+    vector = X[0].copy()
+    start = time.perf_counter()
+    for _ in range(runs):
+        model.predict(vector)
+    print(f"Inference: {(time.perf_counter() - start) / runs * 1e6:.1f}us per frame")
+
+    model.save(args.out)
+    print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import time
 from detector import FallAnalyzer
 from types import SimpleNamespace
 
@@ -20,6 +19,11 @@ def create_mock_landmarks(nose_y, shoulder_y, ankle_y, width=0.2, height=0.8):
     landmarks[11] = MockLandmark(0.5 - width/2, shoulder_y)
     landmarks[12] = MockLandmark(0.5 + width/2, shoulder_y)
     
+    # Hips (23, 24), halfway between shoulders and ankles
+    hip_y = (shoulder_y + ankle_y) / 2
+    landmarks[23] = MockLandmark(0.5 - width/2, hip_y)
+    landmarks[24] = MockLandmark(0.5 + width/2, hip_y)
+    
     # Ankles (27, 28)
     landmarks[27] = MockLandmark(0.5 - width/2, ankle_y)
     landmarks[28] = MockLandmark(0.5 + width/2, ankle_y)
@@ -29,6 +33,10 @@ def create_mock_landmarks(nose_y, shoulder_y, ankle_y, width=0.2, height=0.8):
 def test_fall_scenario():
     analyzer = FallAnalyzer()
     
+    # Simulated clock: timestamps are injected, so the scenario runs instantly
+    t = 1000.0
+    frame_dt = 0.1
+    
     print("--- Starting Simulation ---")
     
     # 1. Standing (Normal)
@@ -36,46 +44,40 @@ def test_fall_scenario():
     print("Phase 1: Standing")
     for _ in range(5):
         lm = create_mock_landmarks(nose_y=0.1, shoulder_y=0.2, ankle_y=0.9, width=0.2, height=0.8)
-        status, _, _, _ = analyzer.analyze(lm)
+        status, _, _, _ = analyzer.analyze(lm, t)
         print(f"Status: {status}")
-        time.sleep(0.1)
+        t += frame_dt
 
     # 2. Free Fall (Rapid Drop)
     # Head drops from 0.1 to 0.8 in 0.2 seconds
     print("\nPhase 2: Falling (Rapid Drop)")
     # Frame 1
     lm = create_mock_landmarks(nose_y=0.3, shoulder_y=0.4, ankle_y=0.9, width=0.2, height=0.6)
-    status, _, _, _ = analyzer.analyze(lm)
+    status, _, _, _ = analyzer.analyze(lm, t)
     print(f"Status: {status} (Head Y: 0.3)")
-    time.sleep(0.1)
+    t += frame_dt
     
     # Frame 2
     lm = create_mock_landmarks(nose_y=0.6, shoulder_y=0.7, ankle_y=0.9, width=0.2, height=0.3)
-    status, _, _, _ = analyzer.analyze(lm)
-    print(f"Status: {status} (Head Y: 0.6) -> Should trigger POTENTIAL")
-    time.sleep(0.1)
+    status, _, _, _ = analyzer.analyze(lm, t)
+    print(f"Status: {status} (Head Y: 0.6) -> Should trigger POTENTIAL (state: {analyzer.state})")
+    t += frame_dt
     
     # 3. Lying Down
     # Head at 0.8, Ankles at 0.8. Height ~ 0. Width > Height.
-    print("\nPhase 3: Lying Down (Waiting 3.1s)")
-    start_lie = time.time()
-    while time.time() - start_lie < 3.2:
+    print("\nPhase 3: Lying Down (Waiting up to 4s: 3s lying + smoothing lag)")
+    start_lie = t
+    while t - start_lie < 4.0:
         # Width 0.8, Height 0.1. Shoulders/Ankles same Y roughly.
         lm = create_mock_landmarks(nose_y=0.85, shoulder_y=0.85, ankle_y=0.85, width=0.8, height=0.1)
-        status, _, _, _ = analyzer.analyze(lm)
-        if status == "FALL_DETECTED":
-            print(f"SUCCESS: Status is {status}!")
-            return
-        time.sleep(0.1)
-        
-    print(f"Final Status: {status}")
-
+        status, _, _, _ = analyzer.analyze(lm, t)
         if status == "FALL_DETECTED":
             print(f"SUCCESS: Status is {status}!")
-            return
-        time.sleep(0.1)
+            return True
+        t += frame_dt
         
     print(f"Final Status: {status}")
+    return False
 
 if __name__ == "__main__":
     test_fall_scenario()
@@ -0,0 +1,263 @@
+import logging
+import random
+import threading
+import time
+from config import Config
+import capture
+import telemetry
+
+logger = logging.getLogger("Watchdog")
+
+# Keeps a camera stream alive and its fall detection running:
+#   ReconnectingCapture  reopens a dead stream with exponential backoff
+#                        (waits between failed reads instead of spinning)
+#   StreamWatchdog       per-stream heartbeats and FPS, recreates a wedged
+#                        landmarker, and sheds inference load in stages
+#                        (DEGRADE_STAGES) while it cannot keep up
+# The supervisor uses the same backoff to restart hung or crashed workers.
+
+
+def backoff_delay(attempt, base=None, maximum=None):
+    # Exponential backoff with +-20% jitter, so cameras on one switch don't
+    # reconnect in lockstep
+    base = base if base is not None else Config.RECONNECT_BASE_DELAY
+    maximum = maximum if maximum is not None else Config.RECONNECT_MAX_DELAY
+    return min(maximum, base * 2 ** min(attempt, 16)) * random.uniform(0.8, 1.2)
+
+
+def is_file_source(source):
+    # Recordings end; live cameras and streams are reopened instead
+    source = str(source).strip()
+    return not source.isdigit() and "://" not in source and not source.startswith("loop:")
+
+
+class ReconnectingCapture:
+    # capture.open_capture() that survives dropouts. A failed read waits
+    # CAPTURE_RETRY_DELAY; once no frame arrived for CAPTURE_RECONNECT_AFTER
+    # the source is released and reopened, with exponential backoff between
+    # attempts. read() still returns (False, None) for every failed read, so
+    # callers keep their loop; `ended` tells the end of a file apart.
+    def __init__(self, source, color=None, stop_event=None):
+        self.source = source
+        self.requested_color = color
+        self.stop_event = stop_event or threading.Event()  # Set to abort a backoff wait
+        self.is_file = is_file_source(source)
+        self.ended = False
+        self.attempt = 0
+        self.frames = 0
+        self.last_frame_time = time.monotonic()
+        self.cap = capture.open_capture(source, color)
+        self.color = self.cap.color
+        self.name = getattr(self.cap, "name", "") or str(source)
+        self.reconnects = telemetry.counter("capture_reconnects_total", "Camera streams reopened", stream=self.name)
+
+    def read(self):
+        success, frame = self.cap.read()
+        if success:
+            self.frames += 1
+            self.last_frame_time = time.monotonic()
+            self.attempt = 0
+            return True, frame
+
+        if self.is_file:
+            self.ended = True
+            return False, None
+        if time.monotonic() - self.last_frame_time < Config.CAPTURE_RECONNECT_AFTER:
+            self.stop_event.wait(Config.CAPTURE_RETRY_DELAY)
+        else:
+            self.reconnect()
+        return False, None
+
+    def reconnect(self):
+        delay = backoff_delay(self.attempt)
+        self.attempt += 1
+        logger.warning(f"{self.name}: no frames for {time.monotonic() - self.last_frame_time:.1f}s, "
+                       f"reopening in {delay:.1f}s (attempt {self.attempt})")
+        self.cap.release()
+        if self.stop_event.wait(delay):
+            return
+        self.reconnects.inc()
+        self.cap = capture.open_capture(self.source, self.requested_color)
+        if self.cap.isOpened():
+            # The reopened stream may come up on another backend/layout
+            self.color = self.cap.color
+            self.last_frame_time = time.monotonic()
+            logger.info(f"{self.name}: stream reopened")
+        # Still failing: the next failed read backs off again (last_frame_time is stale)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def release(self):
+        self.cap.release()
+
+
+class StreamWatchdog:
+    # Wraps the per-frame detection call of one stream:
+    #   result = watchdog.process(frame, timestamp_ms, color, fn)
+    # fn(frame, timestamp_ms, color) runs detection + analysis; process()
+    # returns None for frames shed by the current degradation stage.
+    #
+    # A monitor thread checks heartbeats every WATCHDOG_INTERVAL: frames
+    # stopped arriving (capture stall) or one frame has been in detection for
+    # STALL_SECONDS (inference stall). An inference stall marks the landmarker
+    # for recreation; that happens on the inference thread once the call
+    # returns (a call that never returns can't be interrupted in-process:
+    # the supervisor restarts such workers, see WORKER_STALL_SECONDS).
+    #
+    # Load is the busy fraction of the inference thread over DEGRADE_WINDOW.
+    # Above DEGRADE_HIGH_LOAD the next stage caps the inference rate and/or
+    # scales frames down; after DEGRADE_RECOVER_WINDOWS windows below
+    # DEGRADE_LOW_LOAD it steps back up. While the analyzer tracks a possible
+    # fall the rate cap is lifted, so shedding never delays a confirmation.
+    def __init__(self, name, cap=None, detector=None, analyzer=None, on_stall=None, stages=None):
+        self.name = name
+        self.cap = cap            # ReconnectingCapture (frame heartbeat), optional
+        self.detector = detector  # PoseDetector (reset_backend), optional
+        self.analyzer = analyzer  # is_tracking_fall() lifts the rate cap, optional
+        self.on_stall = on_stall  # on_stall(name, kind, stalled), from the monitor thread
+        self.stages = stages or Config.DEGRADE_STAGES
+        self.stage = 0
+
+        now = time.monotonic()
+        self.analyzed = 0
+        self.shed = 0
+        self.last_analyzed_time = now
+        self.last_admitted = None
+        self.inference_started = None  # Set while fn() runs
+        self.busy = 0.0
+        self.window_start = now
+        self.calm_windows = 0
+        self.reset_requested = False
+
+        self.stalled = {"capture": False, "inference": False}
+        self.fps = {"capture": 0.0, "inference": 0.0}
+        self.last_counts = (self._frames(), self.analyzed, now)
+
+        for kind in self.fps:
+            telemetry.callback("stream_fps", lambda k=kind: self.fps[k], "gauge",
+                               "Frames per second per stream and stage", stream=name, stage=kind)
+        telemetry.callback("stream_stalled", lambda: int(any(self.stalled.values())), "gauge",
+                           "1 while a stream's capture or inference is stalled", stream=name)
+        telemetry.callback("degrade_stage", lambda: self.stage, "gauge",
+                           "Current load-shedding stage (0 = full rate)", stream=name)
+        telemetry.callback("frames_shed_total", lambda: self.shed, "counter",
+                           "Frames skipped by load shedding", stream=name)
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _frames(self):
+        return self.cap.frames if self.cap is not None else self.analyzed
+
+    def _last_frame_time(self):
+        return self.cap.last_frame_time if self.cap is not None else self.last_analyzed_time
+
+    def process(self, frame, timestamp_ms, color, fn):
+        if self.reset_requested and self.detector is not None:
+            self.reset_requested = False
+            self.detector.reset_backend()
+
+        max_fps, scale = self.stages[self.stage]
+        timestamp = timestamp_ms / 1000.0
+        if max_fps and self.last_admitted is not None and timestamp - self.last_admitted < 1.0 / max_fps:
+            if self.analyzer is None or not self.analyzer.is_tracking_fall():
+                self.shed += 1
+                return None
+        self.last_admitted = timestamp
+
+        start = self.inference_started = time.monotonic()
+        frame, color = capture.resize(frame, scale, color)
+        try:
+            result = fn(frame, timestamp_ms, color)
+        finally:
+            self.inference_started = None
+        end = time.monotonic()
+
+        self.busy += end - start
+        self.analyzed += 1
+        self.last_analyzed_time = end
+        if end - self.window_start >= Config.DEGRADE_WINDOW:
+            self._adjust(self.busy / (end - self.window_start))
+            self.busy = 0.0
+            self.window_start = end
+        return result
+
+    def _adjust(self, load):
+        if load > Config.DEGRADE_HIGH_LOAD:
+            self.calm_windows = 0
+            if self.stage < len(self.stages) - 1:
+                self.stage += 1
+                logger.warning(f"{self.name}: inference load {load:.0%}, shedding to stage {self.stage} "
+                               f"{self._describe(self.stage)}")
+        elif load < Config.DEGRADE_LOW_LOAD and self.stage > 0:
+            self.calm_windows += 1
+            if self.calm_windows >= Config.DEGRADE_RECOVER_WINDOWS:
+                self.calm_windows = 0
+                self.stage -= 1
+                logger.info(f"{self.name}: inference load {load:.0%}, back to stage {self.stage} "
+                            f"{self._describe(self.stage)}")
+        else:
+            self.calm_windows = 0
+
+    def _describe(self, stage):
+        max_fps, scale = self.stages[stage]
+        return f"({f'{max_fps} fps' if max_fps else 'every frame'}, scale {scale})"
+
+    def check(self, now=None):
+        # One health check; called by the monitor thread
+        now = now if now is not None else time.monotonic()
+        frames, analyzed, then = self.last_counts
+        elapsed = now - then
+        if elapsed > 0:
+            self.fps["capture"] = (self._frames() - frames) / elapsed
+            self.fps["inference"] = (self.analyzed - analyzed) / elapsed
+        self.last_counts = (self._frames(), self.analyzed, now)
+
+        started = self.inference_started
+        inference_age = now - started if started is not None else 0.0
+        inference_stalled = inference_age > Config.STALL_SECONDS
+        if inference_stalled and not self.stalled["inference"]:
+            self.reset_requested = True
+        self._set_stalled("inference", inference_stalled, f"one frame in inference for {inference_age:.0f}s")
+        # A hung inference also stops reads in a sequential loop; report it once
+        frame_age = now - self._last_frame_time()
+        self._set_stalled("capture", not inference_stalled and frame_age > Config.STALL_SECONDS,
+                          f"no frames for {frame_age:.0f}s")
+
+    def _set_stalled(self, kind, stalled, reason):
+        if stalled == self.stalled[kind]:
+            return
+        self.stalled[kind] = stalled
+        if stalled:
+            logger.error(f"{self.name}: {kind} stalled ({reason})")
+            telemetry.counter("stream_stalls_total", "Capture/inference stalls detected",
+                              stream=self.name, kind=kind).inc()
+        else:
+            logger.info(f"{self.name}: {kind} recovered")
+        if self.on_stall is not None:
+            try:
+                self.on_stall(self.name, kind, stalled)
+            except Exception as e:
+                logger.error(f"Stall callback failed: {e}")
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._monitor, name=f"watchdog-{self.name}", daemon=True)
+            self.thread.start()
+        return self
+
+    def _monitor(self):
+        while not self.stop_event.wait(Config.WATCHDOG_INTERVAL):
+            self.check()
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
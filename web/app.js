@@ -15,6 +15,22 @@ const DROP_VELOCITY_THRESHOLD = 0.3;
 const FALL_ANGLE_THRESHOLD = 45;
 const LYING_DOWN_DURATION = 3000; // ms
 
+// Server-side analysis (see ingest.py): open the page with
+// ?ingest=ws://<server>:8770&room=<name>[&token=<secret>] to send landmarks to
+// the shared Python analyzer (tuned thresholds, alerts, event history). The
+// local analysis below keeps running as the fallback while disconnected.
+const pageParams = new URLSearchParams(window.location.search);
+const INGEST_URL = pageParams.get('ingest');
+const INGEST_BATCH_MS = 100; // One message per 100 ms of frames
+const PACK_SCALE = 8192; // landmarks.pack(): int16 x/y/z, uint8 visibility/presence
+const PACKED_SIZE = 33 * 8;
+const STATE_NAMES = ["NORMAL", "POTENTIAL_FALL", "FALL_DETECTED"];
+let ingestSocket = null;
+let ingestTimer = null;
+let ingestQueue = []; // [{time, landmarks or null}]
+let ingestSequence = 0;
+let ingestStatus = null; // Latest server verdict while connected
+
 // Audio Context
 const audioContext = new (window.AudioContext || window.webkitAudioContext)();
 
@@ -41,6 +57,68 @@ function beep(frequency, duration) {
     oscillator.stop(audioContext.currentTime + duration / 1000);
 }
 
+// Batch message for ingest.py: header, timestamps, people flags, packed landmarks
+function encodeBatch(frames) {
+    const people = frames.filter(f => f.landmarks).length;
+    const count = frames.length;
+    const buffer = new ArrayBuffer(6 + count * 9 + people * PACKED_SIZE);
+    const view = new DataView(buffer);
+    view.setUint32(0, ingestSequence++ >>> 0, true);
+    view.setUint16(4, count, true);
+    frames.forEach((f, i) => {
+        view.setFloat64(6 + i * 8, f.time, true);
+        view.setUint8(6 + count * 8 + i, f.landmarks ? 1 : 0);
+    });
+
+    const clamp = (v, lo, hi) => Math.min(hi, Math.max(lo, v));
+    const xyzStart = 6 + count * 9;
+    const scoreStart = xyzStart + people * 33 * 6;
+    let p = 0;
+    for (const f of frames) {
+        if (!f.landmarks) continue;
+        f.landmarks.forEach((lm, j) => {
+            const k = p * 33 + j;
+            [lm.x, lm.y, lm.z].forEach((v, axis) => {
+                view.setInt16(xyzStart + (k * 3 + axis) * 2, clamp(Math.round(v * PACK_SCALE), -32768, 32767), true);
+            });
+            const visibility = lm.visibility ?? 1.0;
+            view.setUint8(scoreStart + k * 2, clamp(Math.round(visibility * 255), 0, 255));
+            view.setUint8(scoreStart + k * 2 + 1, 255); // Presence: the pose was detected
+        });
+        p++;
+    }
+    return buffer;
+}
+
+function connectIngest() {
+    if (!INGEST_URL || !isRunning) return;
+    const url = new URL('/ingest', INGEST_URL.replace(/^http/, 'ws'));
+    url.searchParams.set('room', pageParams.get('room') || 'browser');
+    if (pageParams.get('token')) url.searchParams.set('token', pageParams.get('token'));
+
+    ingestSocket = new WebSocket(url);
+    ingestSocket.binaryType = 'arraybuffer';
+    ingestSocket.onmessage = (event) => {
+        // Result: sequence u32, status u8, state u8, event id u32, accepted u16
+        const view = new DataView(event.data);
+        ingestStatus = STATE_NAMES[Math.max(view.getUint8(4), view.getUint8(5))];
+    };
+    ingestSocket.onclose = () => {
+        ingestSocket = null;
+        ingestStatus = null;
+        setTimeout(connectIngest, 2000); // Reconnect while the demo runs
+    };
+}
+
+function flushIngest() {
+    if (!ingestQueue.length) return;
+    const frames = ingestQueue;
+    ingestQueue = [];
+    if (ingestSocket && ingestSocket.readyState === WebSocket.OPEN) {
+        ingestSocket.send(encodeBatch(frames));
+    }
+}
+
 // Smooth landmarks
 function smoothLandmarks(landmarks) {
     landmarkHistory.push(landmarks);
@@ -264,9 +342,14 @@ function onResults(results) {
     const canvas = document.getElementById('output');
     const canvasCtx = canvas.getContext('2d');
 
+    if (INGEST_URL) {
+        ingestQueue.push({ time: Date.now() / 1000, landmarks: results.poseLandmarks || null });
+    }
+
     if (results.poseLandmarks) {
-        const { status, velocity, angle } = analyzeFall(results.poseLandmarks);
-        updateUI(status, velocity, angle);
+        const local = analyzeFall(results.poseLandmarks);
+        const status = ingestStatus || local.status;
+        updateUI(status, local.velocity, local.angle);
         drawSkeleton(canvasCtx, results.poseLandmarks, canvas.width, canvas.height, status);
     } else {
         canvasCtx.clearRect(0, 0, canvas.width, canvas.height);
@@ -312,6 +395,11 @@ async function startDemo() {
     await camera.start();
     isRunning = true;
 
+    if (INGEST_URL) {
+        connectIngest();
+        ingestTimer = setInterval(flushIngest, INGEST_BATCH_MS);
+    }
+
     document.getElementById('startBtn').style.display = 'none';
     document.getElementById('stopBtn').style.display = 'flex';
 }
@@ -323,6 +411,18 @@ function stopDemo() {
     }
     isRunning = false;
 
+    if (ingestTimer) {
+        clearInterval(ingestTimer);
+        ingestTimer = null;
+    }
+    if (ingestSocket) {
+        ingestSocket.onclose = null;
+        ingestSocket.close();
+        ingestSocket = null;
+    }
+    ingestQueue = [];
+    ingestStatus = null;
+
     const canvas = document.getElementById('output');
     const canvasCtx = canvas.getContext('2d');
     canvasCtx.clearRect(0, 0, canvas.width, canvas.height);